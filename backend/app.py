@@ -2,87 +2,434 @@
 import eventlet
 eventlet.monkey_patch()
 
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session
+import click
+from flask import Flask, Response, g, has_request_context, request, jsonify, render_template, redirect, stream_with_context, url_for, session
 from flask_cors import CORS
 from flask_migrate import Migrate
-from flask_socketio import SocketIO, emit
-from sqlalchemy.orm import scoped_session, sessionmaker
-from models import db, Product, Order, OrderProduct
-from config import DBConfig as Config
+from flask_socketio import SocketIO
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import joinedload, selectinload
+from models import db, ORDER_ID_START, Product, Order, OrderProduct, SalesHourly
+import rollup
+from config import DBConfig as Config, BTConfig, JournalConfig, KitchenConfig, LogConfig, OrderSessionConfig, PrintQueueConfig, SalesConfig, ServeConfig, SocketConfig, VVConfig
 import logging
+import os
+import time
 import pytz
 from datetime import datetime
-from order_call import vvox_test
+from order_call import call_cache, call_text
+from catalog_cache import CatalogCache
+from call_player import CallPlayer, NullSink, PyAudioSink
 #from tamasenSerial import Printer
 from tamasenSDK import Printer
+from order_store import DraftOrderStore
+from print_queue import PrintQueue
+from sales_stats import SalesCounters
+from kitchen_queue import KitchenQueue, NEW_ORDER
+from socket_rooms import RoomRouter
+from printer_pool import PrinterPool
+from storage import SingleWriter, ensure_sqlite_directory
+from local_mq import create_client_manager
+from worker_proxy import FORWARDED_HEADER, PrimaryProxy
+from metrics import registry
+from order_export import export_rows, iter_csv, iter_ndjson
+from order_journal import COMPLETE, JournalConflict, JournalReplayer, OrderJournal
+from eventlet import tpool
 
 # Flask アプリの設定
 app = Flask(__name__)
 app.config.from_object(Config)
 app.secret_key = 'your_secret_key'
 CORS(app, supports_credentials=True, resources={r"/*": {"origins": ["http://localhost:3000", "http://192.168.10.101:3000"]}})
-socketio = SocketIO(app, cors_allowed_origins="*", ping_timeout=60, ping_interval=25)
+# 複数ワーカーで起動した場合 (serve.py) はメッセージキューを通して全ワーカーのクライアントに配信する
+socketio_options = {}
+if SocketConfig.MESSAGE_QUEUE:
+    client_manager = create_client_manager(SocketConfig.MESSAGE_QUEUE)
+    if client_manager is not None:
+        socketio_options['client_manager'] = client_manager
+    else:
+        socketio_options['message_queue'] = SocketConfig.MESSAGE_QUEUE
+socketio = SocketIO(app, cors_allowed_origins="*", ping_timeout=60, ping_interval=25, **socketio_options)
+# イベントは全員ではなく、必要な役割 (レジ・厨房・呼び出し表示・listener) のルームにだけ送る
+# SocketConfig.BATCH_WINDOW を指定すると、短時間に続いたイベントをまとめて送る
+rooms = RoomRouter(
+    socketio,
+    batch_window=SocketConfig.BATCH_WINDOW,
+    unbatched=SocketConfig.UNBATCHED_EVENTS,
+    coalesce=SocketConfig.COALESCED_EVENTS,
+    distributed=bool(SocketConfig.MESSAGE_QUEUE)
+)
+
+# プリンター・音声・メモリ上の状態 (下書きの注文、厨房キューなど) はプライマリのワーカーだけが持つ。
+# セカンダリはDBを読むだけのエンドポイントを自分で処理し、それ以外はプライマリへ転送する
+IS_PRIMARY = not ServeConfig.PRIMARY_URL
+primary = None if IS_PRIMARY else PrimaryProxy(ServeConfig.PRIMARY_URL)
+LOCAL_ENDPOINTS = {'static', 'order_page', 'order_history', 'sales_report', 'export_orders'}
 
 # ログ設定
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=LogConfig.LEVEL)
 logger = logging.getLogger(__name__)
 
 # データベース初期化
 db.init_app(app)
 migrate = Migrate(app, db)
 
-# scoped_session を使用したDBセッション管理
-with app.app_context():
-    db.session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=db.engine))
+# SQLite (組み込みモード) では会計の書き込みを1つのワーカーに並べて実行する
+# ジャーナルを使う場合は JournalReplayer が1件ずつ反映するので、POS_ORDER_JOURNAL=0 のときだけ使う
+ensure_sqlite_directory(app.config['SQLALCHEMY_DATABASE_URI'])
+checkout_writer = SingleWriter(app, enabled=app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')
+                               and not JournalConfig.ENABLED)
+
+def load_last_order_id():
+    with app.app_context():
+        last = db.session.query(db.func.max(Order.order_id)).scalar()
+        db.session.remove()
+    return last if last is not None else ORDER_ID_START - 1
+
+def check_journaled_order(order, record, created_at, lines):
+    """
+    既にDBにある注文がジャーナルのレコードと同じ内容か確かめる (反映後・applied() 前に止まった場合の再反映)。
+    lines は journaled_lines() で商品が削除された明細を除いたもの。
+    内容が違う場合は別の注文が同じ番号で保存されているので JournalConflict を送出する。
+    """
+    differences = [
+        name for name, stored, journaled in (
+            ('total_amount', order.total_amount, record['total_amount']),
+            ('total_quantity', order.total_quantity, record['total_quantity']),
+            ('note', order.note, record['note']),
+            ('lines',
+             sorted((op.product_id, op.quantity, op.unit_price) for op in order.order_products),
+             sorted((line['product_id'], line['quantity'], line['unit_price']) for line in lines)),
+        )
+        if stored != journaled
+    ]
+    # DBによっては秒未満が切り捨てられるので、1秒未満の差は同じとみなす
+    if abs((order.created_at.replace(tzinfo=None) - created_at.replace(tzinfo=None)).total_seconds()) >= 1:
+        differences.append('created_at')
+    if differences:
+        raise JournalConflict(
+            f"Order {record['order_id']} already exists with different {', '.join(differences)}")
+
+JOURNAL_DROPPED_LINES = registry.counter(
+    "pos_order_journal_dropped_lines_total",
+    "Journaled order lines not written to the database because the product had been deleted.")
+
+def journaled_lines(record):
+    """
+    レコードの明細のうち、商品がDBにあるものを返す。
+    ジャーナルに記録した後 (DBへの反映前) に削除された商品の明細は外部キーのため保存できないので除く。
+    """
+    product_ids = {line['product_id'] for line in record['lines']}
+    existing = {product_id for (product_id,) in
+                db.session.query(Product.product_id).filter(Product.product_id.in_(product_ids))}
+    return [line for line in record['lines'] if line['product_id'] in existing]
+
+def apply_journal_record(record):
+    """
+    ジャーナルのレコードをDBに反映する。反映済みのレコードを再度渡しても何もしない。
+    削除された商品の明細は除いて注文は保存する (支払い済みの注文を失わないため)。
+    同じ番号の注文が別の内容でDBにある場合は JournalConflict を送出する。
+    """
+    with app.app_context():
+        try:
+            if record['type'] == COMPLETE:
+                Order.query.filter_by(order_id=record['order_id']).update({'is_completed': True})
+            elif (existing := db.session.get(Order, record['order_id'])) is not None:
+                check_journaled_order(existing, record, datetime.fromisoformat(record['created_at']),
+                                      journaled_lines(record))
+            else:
+                created_at = datetime.fromisoformat(record['created_at'])
+                lines = journaled_lines(record)
+                if len(lines) < len(record['lines']):
+                    dropped = [line for line in record['lines'] if line not in lines]
+                    logger.warning("Order %s is saved without lines for deleted product(s): %s",
+                                   record['order_id'], dropped)
+                    JOURNAL_DROPPED_LINES.inc(amount=len(dropped))
+                order = Order(
+                    order_id=record['order_id'],
+                    created_at=created_at,
+                    total_quantity=record['total_quantity'],
+                    total_amount=record['total_amount'],
+                    note=record['note']
+                )
+                order.order_products = [
+                    OrderProduct(product_id=line['product_id'], quantity=line['quantity'], unit_price=line['unit_price'])
+                    for line in lines
+                ]
+                db.session.add(order)
+                rollup.record_order(db.session, created_at, [
+                    (line['product_id'], line['quantity'], line['unit_price']) for line in lines
+                ])
+            db.session.commit()
+        finally:
+            db.session.remove()
+
+# 再試行すれば通る MySQL のエラー番号
+# 2002/2003: 接続できない, 2006/2013: 接続が切れた, 1205: ロック待ちのタイムアウト, 1213: デッドロック
+TRANSIENT_MYSQL_ERRORS = {2002, 2003, 2006, 2013, 1205, 1213}
+# 再試行すれば通る SQLite のエラー (ほかの書き込みとの競合、ファイルを置いたディスクが使えない)
+TRANSIENT_SQLITE_MESSAGES = ("database is locked", "unable to open database file", "disk I/O error")
+
+def is_transient_db_error(error):
+    """DBに繋がらないことによる失敗か (再試行すれば反映できる)。データの誤りによる失敗は False。"""
+    if isinstance(error, exc.DBAPIError) and error.connection_invalidated:
+        return True
+    if isinstance(error, (exc.InterfaceError, exc.DisconnectionError, exc.TimeoutError)):
+        return True
+    if isinstance(error, exc.OperationalError):
+        # 列がないなどの OperationalError はデータ・スキーマの誤りなので、再試行せずに rejected へ移す
+        args = getattr(error.orig, 'args', ())
+        if args and args[0] in TRANSIENT_MYSQL_ERRORS:
+            return True
+        return any(message in str(error.orig) for message in TRANSIENT_SQLITE_MESSAGES)
+    return False
+
+# DBに繋がらない間に厨房キューをジャーナルの注文だけで読み込んだ場合 True (DBが戻ったら読み直す)
+kitchen_queue_partial = False
+
+def reload_kitchen_queue():
+    """DBが戻ったら、ジャーナルだけで読み込んだ厨房キューにDBの未完了注文を加える。"""
+    global kitchen_queue_partial
+    if not kitchen_queue_partial:
+        return
+    kitchen_queue_partial = False
+    with app.app_context():
+        try:
+            orders = load_open_orders()
+        finally:
+            db.session.remove()
+    for delta in kitchen_queue.merge(orders):
+        broadcast_kitchen_delta(delta)
+    logger.info("Kitchen queue reloaded from the database.")
+
+# 会計のジャーナル: 会計はローカルのファイルへの追記で確定し、DBへはバックグラウンドで反映する
+# (注文はプライマリだけが確定するので、セカンダリでは使わない)
+order_journal = None
+journal_replayer = None
+if JournalConfig.ENABLED and IS_PRIMARY:
+    # 追記と fsync はスレッドプールで行い、ディスクを待つ間も他のリクエストを処理する
+    order_journal = OrderJournal(JournalConfig.PATH, load_last_order_id,
+                                 fsync=JournalConfig.FSYNC, compact_every=JournalConfig.COMPACT_EVERY,
+                                 executor=tpool.execute)
+    # データの誤りで反映できないレコードは再試行せず order_journal.rejected.jsonl に移す
+    journal_replayer = JournalReplayer(order_journal, apply_journal_record,
+                                       retry_interval=JournalConfig.RETRY_INTERVAL,
+                                       max_retry_interval=JournalConfig.MAX_RETRY_INTERVAL,
+                                       is_transient=is_transient_db_error,
+                                       on_recover=reload_kitchen_queue)
+    registry.gauge("pos_order_journal_pending", "Journal records not yet written to the database.",
+                   order_journal.pending)
+    registry.gauge("pos_order_journal_degraded", "1 while the journal cannot be written to the database.",
+                   lambda: int(journal_replayer.degraded))
+    registry.gauge("pos_order_journal_rejected", "Journal records moved to the rejected file since startup.",
+                   lambda: journal_replayer.rejected)
+
+# 処理時間の計測 (/metrics で Prometheus のテキスト形式で返す)
+REQUEST_SECONDS = registry.histogram(
+    "pos_request_seconds", "Time spent handling HTTP requests.", labels=("route", "method"))
+REQUESTS_TOTAL = registry.counter(
+    "pos_http_requests_total", "HTTP requests handled.", labels=("route", "method", "status"))
+DB_QUERY_SECONDS = registry.histogram("pos_db_query_seconds", "Time spent executing SQL statements.")
+DB_QUERIES_PER_REQUEST = registry.histogram(
+    "pos_db_queries_per_request", "SQL statements executed per HTTP request.", labels=("route",),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100))
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERY_SECONDS.observe(time.perf_counter() - conn.info['query_started'].pop())
+    # 会計の書き込みワーカーなどリクエストの外で実行したクエリはリクエストごとの件数に含めない
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+
+@event.listens_for(Engine, "handle_error")
+def discard_query_timer(context):
+    # 失敗したクエリでは after_cursor_execute が呼ばれないので、開始時刻を捨てて次のクエリとずれないようにする
+    conn = context.connection
+    if conn is not None and conn.info.get('query_started'):
+        conn.info['query_started'].pop()
+
+# 転送より先に登録して、プライマリへ転送したリクエストの時間も計測する
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_started' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, route, request.method)
+        REQUESTS_TOTAL.inc(route, request.method, str(response.status_code))
+        DB_QUERIES_PER_REQUEST.observe(g.get('db_queries', 0), route)
+    return response
+
+@app.before_request
+def forward_to_primary():
+    if primary is not None and request.endpoint not in LOCAL_ENDPOINTS:
+        return primary.forward(request)
+
+def internal_request():
+    """他のワーカーから転送された内部用のリクエストかどうか。"""
+    return request.remote_addr in ('127.0.0.1', '::1') and request.headers.get(FORWARDED_HEADER) == '1'
 
 # Socket.IOイベントの定義
 @socketio.on('connect', namespace='/')
-def handle_connect():
+def handle_connect(auth=None):
     client_ip = request.remote_addr  # クライアントのIPアドレスを取得
-    logger.info(f"クライアントが接続しました。{client_ip}")
-    
+    # 役割は接続時の auth ({"role": "kitchen"}) かクエリ (?role=kitchen) で受け取る
+    role = (auth or {}).get('role') if isinstance(auth, dict) else None
+    joined = rooms.join(request.sid, role or request.args.get('role'))
+    logger.info("クライアントが接続しました。%s %s", client_ip, joined)
+
+@socketio.on('disconnect', namespace='/')
+def handle_disconnect(*args):
+    rooms.leave(request.sid)
+
+@socketio.on('join', namespace='/')
+def handle_join(data):
+    # 接続後に役割を追加・変更する場合 (ack で入っているルームを返す)
+    return rooms.join(request.sid, (data or {}).get('role'))
+
+def parse_order_id(data):
+    try:
+        return int(data.get('order_id'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
 @socketio.on('new_order', namespace='/')
 def handle_new_order(data):
-    logger.debug(f"新しい注文を受信: {data}")
-    emit('new_order', data, broadcast=True)
+    # 新しい注文は会計確定時にサーバーから配信するので、クライアントからの通知は中継しない
+    logger.debug("新しい注文を受信: %s", data)
 
 @socketio.on('order_call', namespace='/')
 def handle_order_call(data):
-    logger.debug(f"注文呼び出しデータを受信: {data}")
-    emit('order_call', data, broadcast=True)
+    logger.debug("注文呼び出しデータを受信: %s", data)
+    apply_kitchen_action('order_call', parse_order_id(data))
 
 @socketio.on('end_order', namespace='/')
 def handle_end_order(data):
-    logger.debug(f"注文終了データを受信: {data}")
-    emit('end_order', data, broadcast=True)
+    logger.debug("注文終了データを受信: %s", data)
+    apply_kitchen_action('end_order', parse_order_id(data))
+
+@socketio.on('kitchen_sync', namespace='/')
+def handle_kitchen_sync(data=None):
+    """
+    再接続したクライアントに取りこぼした差分を返す (ack で返す)。
+    data: {"epoch": 前回受け取った epoch, "last_seq": 最後に適用した seq}
+    差分を返せない場合は snapshot=True と未完了注文の一覧を返す。
+    """
+    data = data or {}
+    if primary is not None:
+        return primary.call('GET', '/internal/kitchen_sync', params=data)
+    return kitchen_queue.since(data.get('epoch'), data.get('last_seq'))
+
+def warmup_call_audio():
+    # 次に呼び出す未完了注文の呼び出し音声を先に合成しておく
+    try:
+        with app.app_context():
+            order_ids = [order_id for (order_id,) in db.session.query(Order.order_id)
+                         .filter_by(is_completed=False)
+                         .order_by(Order.order_id)
+                         .limit(VVConfig.WARMUP_COUNT)]
+            db.session.remove()
+        call_cache.warmup(call_text(order_id) for order_id in order_ids)
+    except Exception as e:
+        logger.warning("Call audio warmup failed: %s", e)
+
+# 呼び出し音声の再生サービス: 合成と再生は専用ワーカーで行い、/order_call は待たない
+# 音声の変換 (pydub)・キャッシュの読み書き・再生はブロッキングなので tpool (OSスレッド) で実行する
+call_cache.executor = tpool.execute
+call_player = CallPlayer(
+    call_cache.get,
+    sink_factory=NullSink if VVConfig.AUDIO_SINK == 'null' else PyAudioSink,
+    executor=tpool.execute,
+    on_done=lambda event: rooms.emit('call_played', event)
+)
 
-# アプリ終了時にセッションを削除
-@app.teardown_appcontext
-def shutdown_session(exception=None):
-    db.session.remove()
+# Printer クラスの初期化 (接続はプールが保持し、ジョブをまたいで使い回す)
+printer_pool = PrinterPool(BTConfig.PRINTERS, health_interval=BTConfig.HEALTH_INTERVAL)
+printer = Printer(connection=printer_pool.get('counter'))
 
-# Printer クラスの初期化
-printer = Printer()
+# 印刷キュー: プリンターは専用ワーカーだけが操作し、会計リクエストは印刷完了を待たない
+# 終わっていないジョブはファイルに残し、再起動しても印刷し直す (プライマリの start() で読み込む)
+# SDK呼び出しはブロッキングなので tpool (OSスレッド) で実行してイベントループを止めない
+print_queue = PrintQueue(
+    printer,
+    max_retries=PrintQueueConfig.MAX_RETRIES,
+    backoff=PrintQueueConfig.BACKOFF,
+    max_backoff=PrintQueueConfig.MAX_BACKOFF,
+    history_size=PrintQueueConfig.HISTORY_SIZE,
+    executor=tpool.execute,
+    on_update=lambda job: rooms.emit('print_job_status', job),
+    path=PrintQueueConfig.PATH,
+    fsync=PrintQueueConfig.FSYNC
+)
+
+registry.gauge("pos_print_queue_pending", "Receipt print jobs waiting to be printed.", print_queue.pending)
+registry.gauge("pos_call_player_pending", "Call announcements waiting to be played.", call_player.pending)
+registry.gauge("pos_checkout_writer_pending", "Checkouts waiting for the SQLite writer.", checkout_writer.pending)
+
+def warmup_printer():
+    # プリンターへの接続 (Bluetooth) とロゴの登録は数秒かかるので、起動後にバックグラウンドで済ませる
+    warmup = getattr(print_queue.printer, 'warmup', None)
+    if warmup is None:
+        return
+    try:
+        tpool.execute(warmup)
+    except Exception as e:
+        logger.warning("Printer warmup failed: %s", e)
+
+@socketio.on('print_job_status', namespace='/')
+def handle_print_job_status(data):
+    # ack で印刷ジョブの状態を返す
+    if primary is not None:
+        return primary.call('GET', f"/print_jobs/{int(data.get('job_id'))}")
+    return print_queue.get(data.get('job_id'))
+
+# 会計前の注文 (カート) はサーバー側に保持する
+draft_orders = DraftOrderStore(
+    draft_ttl=OrderSessionConfig.DRAFT_TTL,
+    result_ttl=OrderSessionConfig.RESULT_TTL
+)
 
 @app.route('/')
 def order_page():
     return render_template('order.html')
 
+def load_products():
+    products = Product.query.all()
+    return [{
+        "product_id": product.product_id,
+        "name": product.name,
+        "category": product.category,
+        "price": product.price,
+        "description": product.description,
+        "onSale": product.onSale
+    } for product in products]
+
+# 商品一覧は変更されるまでメモリから返す
+catalog_cache = CatalogCache(load_products)
+
+def catalog_updated():
+    """商品の変更後に呼ぶ。キャッシュを破棄してクライアントに再取得を促す。"""
+    version = catalog_cache.invalidate()
+    rooms.emit('catalog_updated', {'version': version})
+
 @app.route('/products', methods=['GET'])
 def get_products():
     try:
-        products = Product.query.all()
-        product_list = [{
-            "product_id": product.product_id,
-            "name": product.name,
-            "category": product.category,
-            "price": product.price,
-            "description": product.description,
-            "onSale": product.onSale
-        } for product in products]
-        return jsonify(product_list), 200
+        catalog = catalog_cache.get()
+        response = app.response_class(catalog.body, mimetype='application/json')
+        response.set_etag(catalog.etag)
+        response.headers['X-Catalog-Version'] = str(catalog.version)
+        # If-None-Match が一致すれば 304 を返す
+        return response.make_conditional(request)
     except Exception as e:
-        logger.error(f"Error getting products: {e}")
+        logger.error("Error getting products: %s", e)
         return jsonify({"message": "Server error"}), 500
 
 @app.route('/product_management', methods=['GET', 'POST'])
@@ -90,7 +437,7 @@ def product_management():
     try:
         if request.method == 'POST':
             data = request.json
-            logger.debug(f"Received product data: {data}")
+            logger.debug("Received product data: %s", data)
 
             # データのバリデーションを行う
             if not all(key in data for key in ['name', 'price', 'onSale', 'category']):
@@ -107,32 +454,24 @@ def product_management():
 
             db.session.add(new_product)
             db.session.commit()
+            catalog_updated()
             return jsonify({"product_id": new_product.product_id, "name": new_product.name, "price": new_product.price, "category": new_product.category, "description": new_product.description, "onSale": new_product.onSale}), 201
 
         elif request.method == 'GET':
-            products = Product.query.all()
-            product_list = [{
-                "product_id": product.product_id,
-                "name": product.name,
-                "category": product.category,
-                "price": product.price,
-                "description": product.description,
-                "onSale": product.onSale
-            } for product in products]
-            return render_template('product_management.html', products=product_list)
+            return render_template('product_management.html', products=catalog_cache.get().products)
     except Exception as e:
-        logger.error(f"Error managing products: {e}")
+        logger.error("Error managing products: %s", e)
         return jsonify({"message": "Server error"}), 500
 
 @app.route('/product_management/<int:product_id>', methods=['PUT'])
 def update_product(product_id):
     try:
         data = request.json
-        logger.debug(f"Received product update data for product ID {product_id}: {data}")
+        logger.debug("Received product update data for product ID %s: %s", product_id, data)
 
         product = Product.query.get(product_id)
         if not product:
-            logger.error(f"Product with ID {product_id} not found.")
+            logger.error("Product with ID %s not found.", product_id)
             return jsonify({"message": "Product not found"}), 404
 
         # 商品の情報を更新
@@ -143,9 +482,10 @@ def update_product(product_id):
         product.onSale = data.get('onSale', product.onSale)
 
         db.session.commit()
+        catalog_updated()
         return jsonify({"message": "Product updated successfully"}), 200
     except Exception as e:
-        logger.error(f"Error updating product: {e}")
+        logger.error("Error updating product: %s", e)
         return jsonify({"message": "Server error"}), 500
 
 @app.route('/product_management/<int:product_id>', methods=['DELETE'])
@@ -153,17 +493,18 @@ def delete_product(product_id):
     try:
         product = Product.query.get(product_id)
         if not product:
-            logger.error(f"Product with ID {product_id} not found.")
+            logger.error("Product with ID %s not found.", product_id)
             return jsonify({"message": "Product not found"}), 404
 
         # 商品を削除
         db.session.delete(product)
         db.session.commit()
+        catalog_updated()
 
-        logger.debug(f"Product with ID {product_id} has been deleted.")
+        logger.debug("Product with ID %s has been deleted.", product_id)
         return jsonify({"message": "Product deleted successfully"}), 200
     except Exception as e:
-        logger.error(f"Error deleting product: {e}")
+        logger.error("Error deleting product: %s", e)
         return jsonify({"message": "Server error"}), 500
 
 
@@ -171,171 +512,461 @@ def delete_product(product_id):
 def create_order():
     try:
         data = request.json
-        logger.debug(f"Received order data: {data}")
+        logger.debug("Received order data: %s", data)
         if 'orderL' not in data or not data['orderL']:
             return jsonify({"message": "Invalid order data"}), 400
 
-        # 注文情報をセッションに保存
-        session['order_data'] = data
-        session.modified = True  # セッションを更新
-        logger.debug("Order data has been saved to the session.")
+        # 注文情報はサーバー側に保存し、セッションにはトークンだけを持たせる
+        # 会計の冪等キーにも使うので、注文を送り直すたびに新しいトークンにする
+        draft_orders.delete(session.get('order_token'))
+        token = draft_orders.save(data)
+        session['order_token'] = token
+        logger.debug("Order data has been saved to the draft order store.")
 
-        return jsonify({"message": "Order data saved successfully", "redirect_url": url_for('pay_page')}), 200
+        return jsonify({"message": "Order data saved successfully", "redirect_url": url_for('pay_page'), "order_token": token}), 200
     except Exception as e:
-        logger.error(f"Error creating order: {e}")
+        logger.error("Error creating order: %s", e)
         return jsonify({"message": "Server error"}), 500
 
-@app.route('/orders', methods=['GET'])
-def get_incomplete_orders():
-    """未完了の注文を取得する"""
+def load_open_orders():
+    global kitchen_queue_partial
+    # 明細と商品をJOINで一括取得し、注文ごと・明細ごとの追加クエリを発生させない
+    # (商品側を INNER JOIN にすると入れ子の JOIN になり、明細テーブル全体が走査されるので外部結合にする)
     try:
-        orders = Order.query.filter_by(is_completed=False).all()
-        order_list = [
+        orders = (
+            Order.query
+            .options(joinedload(Order.order_products).joinedload(OrderProduct.product))
+            .filter_by(is_completed=False)
+            .order_by(Order.order_id)
+            .all()
+        )
+    except exc.SQLAlchemyError as e:
+        if order_journal is None or not is_transient_db_error(e):
+            raise
+        # DBに繋がらない間はジャーナルの注文だけを返し、DBが戻ったら読み直す
+        logger.warning("Could not load open orders from the database, using the journal only: %s", e)
+        db.session.rollback()
+        kitchen_queue_partial = True
+        orders = []
+    open_orders = [
+        {
+            'order_id': order.order_id,
+            'note': order.note,
+            'menuL': [
+                {
+                    'name': op.product.name,
+                    'price': op.product.price,
+                    'quantity': op.quantity
+                }
+                for op in order.order_products
+                if op.product is not None
+            ]
+        }
+        for order in orders
+    ]
+    if order_journal is not None:
+        # ジャーナルにあってDBに未反映の注文も含め、未反映の完了を済ませた注文は除く
+        completed = order_journal.pending_completions()
+        open_orders = [order for order in open_orders if order['order_id'] not in completed]
+        known = {order['order_id'] for order in open_orders}
+        open_orders.extend(
             {
-                'order_id': order.order_id,
-                'note': order.note,
+                'order_id': record['order_id'],
+                'note': record['note'],
                 'menuL': [
-                    {
-                        'name': product.name,
-                        'price': product.price,
-                        'quantity': op.quantity
-                    }
-                    for op in OrderProduct.query.filter_by(order_id=order.order_id).all()
-                    for product in Product.query.filter_by(product_id=op.product_id).all()
+                    {'name': line['name'], 'price': line['unit_price'], 'quantity': line['quantity']}
+                    for line in record['lines']
                 ]
             }
-            for order in orders
-        ]
-        return jsonify(order_list), 200
+            for record in order_journal.pending_orders()
+            if record['order_id'] not in known
+        )
+        open_orders.sort(key=lambda order: order['order_id'])
+    return open_orders
+
+# 厨房の注文キューはサーバー側で保持し、変更を連番付きの差分として配信する
+kitchen_queue = KitchenQueue(load_open_orders, history_size=KitchenConfig.HISTORY_SIZE)
+
+def broadcast_kitchen_delta(delta):
+    """
+    キューの変更を従来と同じイベント名で配信する。
+    各イベントには seq と epoch が付くので、クライアントは連番の抜けで取りこぼしを検知できる。
+    """
+    if delta is None:
+        return
+    if delta['type'] == NEW_ORDER:
+        payload = dict(delta['order'], seq=delta['seq'], epoch=delta['epoch'])
+    else:
+        payload = {'order_id': delta['order_id'], 'seq': delta['seq'], 'epoch': delta['epoch']}
+    rooms.emit(delta['type'], payload)
+
+def load_kitchen_queue():
+    try:
+        with app.app_context():
+            kitchen_queue.ensure_loaded()
+            db.session.remove()
     except Exception as e:
-        logger.error(f"Error fetching incomplete orders: {e}")
+        logger.warning("Kitchen queue load failed: %s", e)
+
+def apply_kitchen_action(action, order_id):
+    if primary is not None:
+        primary.call('POST', f'/internal/kitchen/{action}', json={'order_id': order_id})
+        return
+    if action == 'order_call':
+        broadcast_kitchen_delta(kitchen_queue.call_order(order_id))
+    elif action == 'end_order':
+        broadcast_kitchen_delta(kitchen_queue.end_order(order_id))
+
+@app.route('/internal/kitchen/<action>', methods=['POST'])
+def internal_kitchen_action(action):
+    # セカンダリのワーカーが受けた厨房画面の操作
+    if not internal_request() or action not in ('order_call', 'end_order'):
+        return jsonify({"message": "Not found"}), 404
+    apply_kitchen_action(action, parse_order_id(request.json))
+    return jsonify({"seq": kitchen_queue.seq}), 200
+
+@app.route('/internal/kitchen_sync', methods=['GET'])
+def internal_kitchen_sync():
+    if not internal_request():
+        return jsonify({"message": "Not found"}), 404
+    return jsonify(kitchen_queue.since(request.args.get('epoch'), request.args.get('last_seq', type=int))), 200
+
+@app.route('/orders', methods=['GET'])
+def get_incomplete_orders():
+    """未完了の注文を取得する"""
+    try:
+        # DBではなくメモリ上のキューから返す (再接続が集中してもDBに負荷をかけない)
+        return jsonify(kitchen_queue.waiting_orders()), 200
+    except Exception as e:
+        logger.error("Error fetching incomplete orders: %s", e)
         return jsonify({"message": "Server error"}), 500
 
+def current_order_token():
+    """会計前の注文のトークンを返す。ヘッダーで指定されていればそちらを優先する。"""
+    return request.headers.get('X-Order-Token') or session.get('order_token')
+
+def save_order(order_data):
+    """注文と明細をDBに保存する。(注文番号, 注文日時, 集計用の明細) を返す。"""
+    total = order_data['total']
+
+    # 注文された商品を IN 句で一度に取得する
+    product_ids = {item['product_id'] for item in order_data['orderL']}
+    products = {
+        row.product_id: row
+        for row in db.session.query(Product.product_id, Product.name, Product.category, Product.price)
+        .filter(Product.product_id.in_(product_ids))
+    }
+
+    # 注文と明細を1つのトランザクションで保存する (途中で失敗しても明細のない注文が残らない)
+    total_quantity = sum(item['quantity'] for item in order_data['orderL'])
+    order_date = datetime.now(pytz.timezone('Asia/Tokyo'))
+    new_order = Order(
+        total_quantity=total_quantity,
+        total_amount=total,
+        note=order_data.get('note', None),
+        created_at=order_date
+    )
+    new_order.order_products = [
+        OrderProduct(
+            product_id=item['product_id'],
+            quantity=item['quantity'],
+            unit_price=products[item['product_id']].price  # 注文時点の価格を保存
+        )
+        for item in order_data['orderL']
+        if item['product_id'] in products
+    ]
+    # commit 後に明細を読み直さないよう、集計用の値を先に取り出しておく
+    sales_lines = [
+        (line.product_id, products[line.product_id].name, products[line.product_id].category,
+         line.quantity, line.unit_price)
+        for line in new_order.order_products
+    ]
+    db.session.add(new_order)
+    db.session.flush()
+    order_id = new_order.order_id  # commit 後に再読み込みが走らないよう先に取得しておく
+    # 時間帯別の集計テーブルも同じトランザクションで更新する
+    rollup.record_order(db.session, order_date, [
+        (line.product_id, line.quantity, line.unit_price) for line in new_order.order_products
+    ])
+    db.session.commit()
+    logger.debug("Order %s and its items saved to database.", order_id)
+    return order_id, order_date, sales_lines
+
+def journal_order(order_data):
+    """
+    注文をジャーナルに追記して確定する (DBへは JournalReplayer が後から反映する)。
+    商品の名前と価格はメモリ上の商品一覧から取るので、DBが止まっていても確定できる。
+    """
+    products = {product['product_id']: product for product in catalog_cache.get_or_stale().products}
+    sales_lines = [
+        (item['product_id'], products[item['product_id']]['name'], products[item['product_id']]['category'],
+         item['quantity'], products[item['product_id']]['price'])
+        for item in order_data['orderL']
+        if item['product_id'] in products
+    ]
+    order_date = datetime.now(pytz.timezone('Asia/Tokyo'))
+    record = order_journal.append_order(
+        created_at=order_date.isoformat(),
+        total_quantity=sum(item['quantity'] for item in order_data['orderL']),
+        total_amount=order_data['total'],
+        note=order_data.get('note', None),
+        lines=[{"product_id": product_id, "name": name, "category": category,
+                "quantity": quantity, "unit_price": unit_price}
+               for product_id, name, category, quantity, unit_price in sales_lines]
+    )
+    logger.debug("Order %s written to the journal.", record['order_id'])
+    return record['order_id'], order_date, sales_lines
+
+def confirm_order(order_data, payment_amount):
+    """注文を確定して保存し、厨房への通知とレシート印刷の登録を行う。"""
+    if order_journal is not None:
+        order_id, order_date, sales_lines = journal_order(order_data)
+    else:
+        order_id, order_date, sales_lines = save_order(order_data)
+
+    # レシート印刷 (キューに登録するだけで完了は待たない)
+    job = print_queue.enqueue(
+        order_id,
+        orderL=order_data['orderL'],
+        totalL=order_data['totalL'],
+        total=order_data['total'],
+        payment=payment_amount,
+        note=order_data.get('note', ''),
+        menuL=order_data['menuL'],
+        order_date=order_date
+    )
+    logger.debug("Receipt print job %s queued.", job.job_id)
+
+    # ここから先は通知だけなので、失敗しても会計は確定したままにする (再試行で二重に注文させない)
+    try:
+        # 売上の集計値に加算してダッシュボードへ送信
+        bucket = sales_counters.record_order(order_id, order_date, sales_lines)
+        if bucket is not None:
+            rooms.emit('sales_update', dict(sales_counters.snapshot(buckets=False), bucket=bucket))
+
+        # 注文完了トーストの送信
+        rooms.emit('order_complete', {'message': '注文完了！レシート印刷中…'})
+        logger.debug("Order complete toast emitted.")
+
+        # 注文情報を厨房のキューに追加して厨房画面へ送信
+        broadcast_kitchen_delta(kitchen_queue.add_order({
+            "order_id": order_id,
+            "note": order_data.get('note', None),
+            "menuL": [
+                {"name": name, "price": unit_price, "quantity": quantity}
+                for _, name, _, quantity, unit_price in sales_lines
+            ]
+        }))
+
+        # 呼び出し時にすぐ再生できるよう音声を先に合成しておく
+        call_cache.warmup([call_text(order_id)])
+    except Exception as e:
+        logger.error("Error notifying order %s: %s", order_id, e)
+
+    return {"order_id": order_id, "print_job_id": job.job_id}
+
+def checkout_response(result, replayed=False):
+    response = redirect(url_for('order_page'))
+    response.headers['X-Order-Id'] = str(result['order_id'])
+    response.headers['X-Print-Job-Id'] = str(result['print_job_id'])
+    if replayed:
+        response.headers['X-Idempotent-Replay'] = 'true'
+    return response
+
 @app.route('/pay', methods=['GET', 'POST'])
 def pay_page():
     try:
+        token = current_order_token()
         if request.method == 'POST':
             logger.debug("Processing payment POST request...")
             payment_data = request.json  # JSON データとして取得
             payment_amount = payment_data.get('payment')
-            logger.debug(f"Received payment amount: {payment_amount}")
+            logger.debug("Received payment amount: %s", payment_amount)
 
             if not payment_amount or not str(payment_amount).isdigit():
                 logger.error("Invalid payment amount received.")
-                return render_template('pay.html', order_data=session.get('order_data'), error="Invalid payment amount")
+                return render_template('pay.html', order_data=draft_orders.get(token), error="Invalid payment amount")
 
             payment_amount = int(payment_amount)
-            logger.debug(f"Parsed payment amount: {payment_amount}")
+            logger.debug("Parsed payment amount: %s", payment_amount)
 
-            order_data = session.get('order_data')
-            if not order_data:
-                raise ValueError("No order data found in session")
-            logger.debug(f"Order data found in session: {order_data}")
+            # 冪等キー: 未指定なら注文トークンを使い、二度押しで注文が二重に作られないようにする
+            idempotency_key = (request.headers.get('Idempotency-Key')
+                               or payment_data.get('idempotency_key')
+                               or (f"order:{token}" if token else None))
+            if idempotency_key:
+                started, result = draft_orders.begin_checkout(idempotency_key)
+                if result is not None:
+                    logger.debug("Checkout already completed for order %s, returning original result.", result['order_id'])
+                    return checkout_response(result, replayed=True)
+                if not started:
+                    return jsonify({"message": "Checkout already in progress"}), 409
 
-            total = order_data['total']
-            if payment_amount < total:
-                logger.error("Payment amount is less than total order amount.")
-                return render_template('pay.html', order_data=order_data, error="支払い金額が不足しています")
-
-            # 注文確定処理
+            # 結果を保存するまでに失敗した場合は、どの経路でもキーを解放して再試行できるようにする
+            # (処理中のまま残ると、同じキーでの再送が result_ttl の間 409 になる)
             try:
-                # 注文完了トーストの送信
-                socketio.emit('order_complete', {'message': '注文完了！レシート印刷中…'})
-                logger.debug("Order complete toast emitted.")
-
-                # 注文全体の保存
-                total_quantity = sum(item['quantity'] for item in order_data['orderL'])
-                order_date = datetime.now(pytz.timezone('Asia/Tokyo'))
-                new_order = Order(
-                    total_quantity=total_quantity,
-                    total_amount=total,
-                    note=order_data.get('note', None),
-                    created_at=order_date
-                )
-                db.session.add(new_order)
-                db.session.commit()
-
-                logger.debug(f"Order {new_order.order_id} saved to database.")
-
-                # 各商品の注文内容を保存
-                for item in order_data['orderL']:
-                    product = Product.query.get(item['product_id'])
-                    if product:
-                        order_product = OrderProduct(
-                            order_id=new_order.order_id,
-                            product_id=item['product_id'],
-                            quantity=item['quantity'],
-                            unit_price=product.price  # 注文時点の価格を保存
-                        )
-                        db.session.add(order_product)
-
-                db.session.commit()
-                logger.debug(f"Order items for order {new_order.order_id} saved to database.")
-
-                # 注文情報を厨房画面へ送信
-                socketio.emit('new_order', {
-                    "order_id": new_order.order_id,
-                    "menuL": order_data['menuL'],
-                    "note": order_data.get('note', '')
-                })
-
-                # レシート印刷
-                logger.debug("Attempting to print receipt...")
-                printer.print_receipt(
-                    order_id=new_order.order_id,
-                    orderL=order_data['orderL'],
-                    totalL=order_data['totalL'],
-                    total=order_data['total'],
-                    payment=payment_amount,
-                    note=order_data.get('note', ''),
-                    menuL=order_data['menuL'],
-                    order_date=order_date
-                )
-                logger.debug("Receipt printing completed.")
+                order_data = draft_orders.get(token)
+                if not order_data:
+                    raise ValueError("No order data found in session")
+                logger.debug("Order data found in draft order store: %s", order_data)
+
+                if payment_amount < order_data['total']:
+                    logger.error("Payment amount is less than total order amount.")
+                    if idempotency_key:
+                        draft_orders.abort_checkout(idempotency_key)
+                    return render_template('pay.html', order_data=order_data, error="支払い金額が不足しています")
 
-                # 注文データをセッションから削除
-                session.pop('order_data', None)
-                logger.debug("Order data removed from session.")
+                # 注文確定処理 (ジャーナルを使う場合はDBを待たずに追記だけで確定する)
+                try:
+                    if order_journal is not None:
+                        result = confirm_order(order_data, payment_amount)
+                    else:
+                        result = checkout_writer.submit(confirm_order, order_data, payment_amount)
+                except Exception as e:
+                    logger.error("Error while processing order confirmation or printing receipt: %s", e)
+                    db.session.rollback()
+                    if idempotency_key:
+                        draft_orders.abort_checkout(idempotency_key)
+                    return render_template('pay.html', order_data=order_data, error="サーバーエラーが発生しました。再度お試しください。")
 
-                return redirect(url_for('order_page'))
-            except Exception as e:
-                logger.error(f"Error while processing order confirmation or printing receipt: {e}")
-                db.session.rollback()
-                return render_template('pay.html', order_data=order_data, error="サーバーエラーが発生しました。再度お試しください。")
+                if idempotency_key:
+                    draft_orders.finish_checkout(idempotency_key, result)
+            except BaseException:
+                if idempotency_key:
+                    draft_orders.abort_checkout(idempotency_key)
+                raise
+
+            # 会計済みの注文を削除
+            draft_orders.delete(token)
+            session.pop('order_token', None)
+            logger.debug("Order data removed from draft order store.")
+
+            return checkout_response(result)
         else:
             logger.debug("Handling GET request for pay page.")
-            order_data = session.get('order_data')
+            order_data = draft_orders.get(token)
             if not order_data:
                 logger.error("No order data found in session.")
                 return render_template('pay.html', error="注文データが見つかりませんでした。再度お試しください。")
-            logger.debug(f"Rendering pay page with order data: {order_data}")
+            logger.debug("Rendering pay page with order data: %s", order_data)
             return render_template('pay.html', order_data=order_data)
     except ValueError as e:
-        logger.error(f"ValueError: {e}")
+        logger.error("ValueError: %s", e)
         return render_template('pay.html', error=str(e))
     except Exception as e:
-        logger.error(f"Error processing payment: {e}")
+        logger.error("Error processing payment: %s", e)
         return render_template('pay.html', error="サーバーエラーが発生しました。")
 
+@app.route('/socket_stats', methods=['GET'])
+def socket_stats():
+    """ルームごとの参加数・送信回数・配信数を返す (監視用)。"""
+    return jsonify(rooms.stats()), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """処理時間などの計測値を Prometheus のテキスト形式で返す (複数ワーカーではプライマリの値)。"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/print_jobs', methods=['GET'])
+def get_print_jobs():
+    return jsonify({
+        "pending": print_queue.pending(),
+        "printers": printer_pool.status(),
+        "jobs": print_queue.jobs()
+    }), 200
+
+@app.route('/print_jobs/<int:job_id>', methods=['GET'])
+def get_print_job(job_id):
+    job = print_queue.get(job_id)
+    if not job:
+        return jsonify({"message": "Print job not found"}), 404
+    return jsonify(job), 200
+
 @app.route('/current_order', methods=['GET'])
 def get_current_order():
     try:
-        order_data = session.get('order_data')
+        order_data = draft_orders.get(current_order_token())
         if not order_data:
             return jsonify({"message": "No order data found in session"}), 400
         return jsonify(order_data), 200
     except Exception as e:
-        logger.error(f"Error getting current order: {e}")
+        logger.error("Error getting current order: %s", e)
         return jsonify({"message": "Server error"}), 500
     
+ORDER_HISTORY_DEFAULT_LIMIT = 100
+ORDER_HISTORY_MAX_LIMIT = 500
+
+def parse_datetime_param(name):
+    """
+    クエリパラメータをISO 8601形式の日時として解釈する。未指定ならNone。
+    DBの created_at はタイムゾーンなしの現地時刻なので、タイムゾーン付きの指定は現地時刻に直してタイムゾーンを外す。
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid datetime for '{name}': {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(pytz.timezone('Asia/Tokyo')).replace(tzinfo=None)
+    return parsed
+
 @app.route('/order_history', methods=['GET'])
 def order_history():
+    """
+    注文履歴をorder_id昇順のカーソル方式でページングして返す。
+    cursor: 前ページの next_cursor (このorder_idより後を返す)
+    limit: 1ページの件数
+    start / end: created_at の範囲 (start以上、end未満)
+    合計値は、範囲の指定がないか時間帯の区切り (xx:00:00) なら集計テーブルから、それ以外は明細から集計する。
+    """
     try:
-        orders = Order.query.all()
-        order_history = []
-        total_items_sold = 0  # 合計商品の個数を保持する変数
-        total_sales_amount = 0  # 合計販売額を保持する変数
+        try:
+            start = parse_datetime_param('start')
+            end = parse_datetime_param('end')
+            cursor = request.args.get('cursor', type=int)
+            limit = request.args.get('limit', ORDER_HISTORY_DEFAULT_LIMIT, type=int)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        limit = max(1, min(limit, ORDER_HISTORY_MAX_LIMIT))
+
+        date_filters = []
+        if start:
+            date_filters.append(Order.created_at >= start)
+        if end:
+            date_filters.append(Order.created_at < end)
+
+        # 合計商品の個数と販売額はDB側で集計する
+        if all(value is None or value == rollup.hour_of(value) for value in (start, end)):
+            hour_filters = []
+            if start:
+                hour_filters.append(SalesHourly.hour >= start)
+            if end:
+                hour_filters.append(SalesHourly.hour < end)
+            totals = db.session.query(
+                db.func.coalesce(db.func.sum(SalesHourly.quantity), 0).label('items'),
+                db.func.coalesce(db.func.sum(SalesHourly.revenue), 0).label('amount')
+            ).join(Product, Product.product_id == SalesHourly.product_id).filter(*hour_filters).one()
+        else:
+            totals = db.session.query(
+                db.func.coalesce(db.func.sum(OrderProduct.quantity), 0).label('items'),
+                db.func.coalesce(db.func.sum(OrderProduct.quantity * OrderProduct.unit_price), 0).label('amount')
+            ).join(Order, Order.order_id == OrderProduct.order_id).join(
+                Product, Product.product_id == OrderProduct.product_id
+            ).filter(*date_filters).one()
+
+        # 1件多く取得して次ページの有無を判定する
+        query = Order.query.options(
+            selectinload(Order.order_products).joinedload(OrderProduct.product)
+        ).filter(*date_filters)
+        if cursor is not None:
+            query = query.filter(Order.order_id > cursor)
+        orders = query.order_by(Order.order_id).limit(limit + 1).all()
+        has_next = len(orders) > limit
+        orders = orders[:limit]
 
+        order_history = []
         for order in orders:
             total_price = 0  # 各注文の合計金額
             order_data = {
@@ -346,64 +977,193 @@ def order_history():
                 "products": []
             }
 
-            # 注文に関連する商品情報を取得
-            order_products = OrderProduct.query.filter_by(order_id=order.order_id).all()
-            for order_product in order_products:
-                product = Product.query.get(order_product.product_id)
-                if product:
+            for order_product in order.order_products:
+                if order_product.product:
                     product_total_price = order_product.unit_price * order_product.quantity
                     total_price += product_total_price  # 注文の合計金額に追加
-                    total_items_sold += order_product.quantity  # 合計商品の個数を加算
 
                     order_data["products"].append({
-                        "name": product.name,
+                        "name": order_product.product.name,
                         "unit_price": order_product.unit_price,
                         "quantity": order_product.quantity,
                         "total_price": product_total_price
                     })
 
-            total_sales_amount += total_price  # 総販売額に注文の合計金額を加算
             order_data["total_price"] = total_price
             order_history.append(order_data)
 
-        # 合計商品の個数と販売額をレスポンスに含める
         return jsonify({
             "order_history": order_history,
-            "total_items_sold": total_items_sold,
-            "total_sales_amount": total_sales_amount
+            "total_items_sold": int(totals.items),
+            "total_sales_amount": int(totals.amount),
+            "next_cursor": orders[-1].order_id if has_next else None
         }), 200
 
     except Exception as e:
-        logger.error(f"Error getting order history: {e}")
+        logger.error("Error getting order history: %s", e)
         return jsonify({"message": "Server error"}), 500
 
 
+def load_sales_lines():
+    # 起動時の集計用に、全明細を注文順に少しずつ読み込む
+    # ジャーナルにあってDBに未反映の注文も含める。先にジャーナルを読むので、
+    # 読んでいる間にDBへ反映された注文もどちらか一方から1回だけ読まれる
+    journaled = set()
+    if order_journal is not None:
+        for record in order_journal.pending_orders(include_completed=True):
+            journaled.add(record['order_id'])
+            created_at = datetime.fromisoformat(record['created_at'])
+            for line in record['lines']:
+                yield (record['order_id'], created_at, line['product_id'], line['name'], line['category'],
+                       line['quantity'], line['unit_price'])
+    rows = (
+        db.session.query(Order.order_id, Order.created_at, Product.product_id, Product.name,
+                         Product.category, OrderProduct.quantity, OrderProduct.unit_price)
+        .join(OrderProduct, Order.order_id == OrderProduct.order_id)
+        .join(Product, Product.product_id == OrderProduct.product_id)
+        .order_by(Order.order_id)
+        .yield_per(1000)
+    )
+    for row in rows:
+        if row[0] not in journaled:
+            yield row
+
+# 売上の集計値はメモリ上で会計ごとに更新する
+sales_counters = SalesCounters(load_sales_lines, bucket_seconds=SalesConfig.BUCKET_SECONDS)
+
+def rebuild_sales_counters():
+    try:
+        with app.app_context():
+            sales_counters.ensure_loaded()
+            db.session.remove()
+    except Exception as e:
+        logger.warning("Sales counters rebuild failed: %s", e)
+
 @app.route('/product_count', methods=['GET'])
 def product_count():
     try:
-        # データベースから商品ごとの売上数を集計するクエリ
-        results = db.session.query(
-            Product.product_id,
-            Product.name,
-            db.func.sum(OrderProduct.quantity).label('sold')
-        ).join(OrderProduct, Product.product_id == OrderProduct.product_id).group_by(
-            Product.product_id, Product.name
-        ).all()
-
-        # 集計結果をリストとして返す
-        sales_summary = []
-        for row in results:
-            sales_summary.append({
-                'product_id': row.product_id,
-                'product_name': row.name,
-                'sold': row.sold
-            })
-
-        return jsonify(sales_summary), 200
+        # 商品ごとの売上数はメモリ上の集計値から返す
+        return jsonify(sales_counters.product_summary()), 200
 
     except Exception as e:
         return jsonify({'error': f'Failed to retrieve sales data: {str(e)}'}), 500
-    
+
+@app.route('/sales_stats', methods=['GET'])
+def sales_stats():
+    try:
+        return jsonify(sales_counters.snapshot()), 200
+    except Exception as e:
+        logger.error("Error getting sales stats: %s", e)
+        return jsonify({"message": "Server error"}), 500
+
+@app.route('/sales_report', methods=['GET'])
+def sales_report():
+    """
+    時間帯別・商品別の売上を集計テーブルから返す。
+    start / end: 時間帯の範囲 (start以上、end未満)
+    """
+    try:
+        try:
+            start = parse_datetime_param('start')
+            end = parse_datetime_param('end')
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+
+        filters = []
+        if start:
+            filters.append(SalesHourly.hour >= start)
+        if end:
+            filters.append(SalesHourly.hour < end)
+
+        by_hour = db.session.query(
+            SalesHourly.hour,
+            db.func.sum(SalesHourly.quantity).label('quantity'),
+            db.func.sum(SalesHourly.revenue).label('revenue')
+        ).filter(*filters).group_by(SalesHourly.hour).order_by(SalesHourly.hour).all()
+
+        by_product = db.session.query(
+            SalesHourly.product_id,
+            Product.name,
+            db.func.sum(SalesHourly.quantity).label('quantity'),
+            db.func.sum(SalesHourly.revenue).label('revenue'),
+            db.func.sum(SalesHourly.order_count).label('order_count')
+        ).outerjoin(Product, Product.product_id == SalesHourly.product_id).filter(*filters).group_by(
+            SalesHourly.product_id, Product.name
+        ).order_by(SalesHourly.product_id).all()
+
+        return jsonify({
+            "by_hour": [{
+                "hour": row.hour.isoformat(),
+                "quantity": int(row.quantity),
+                "revenue": int(row.revenue)
+            } for row in by_hour],
+            "by_product": [{
+                "product_id": row.product_id,
+                "product_name": row.name,
+                "quantity": int(row.quantity),
+                "revenue": int(row.revenue),
+                "order_count": int(row.order_count)
+            } for row in by_product]
+        }), 200
+    except Exception as e:
+        logger.error("Error getting sales report: %s", e)
+        return jsonify({"message": "Server error"}), 500
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson; charset=utf-8'),
+}
+
+@app.route('/export/orders', methods=['GET'])
+def export_orders():
+    """
+    注文と明細を少しずつ読み出しながらストリーミングで返す (締めの集計用)。
+    format: csv (明細1行ごと) / ndjson (注文1件ごと)
+    start / end: created_at の範囲 (start以上、end未満)
+    completed: true / false で完了・未完了に絞り込む
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"message": f"Invalid format: {fmt}"}), 400
+    try:
+        start = parse_datetime_param('start')
+        end = parse_datetime_param('end')
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    completed = request.args.get('completed')
+    if completed not in (None, '', 'true', 'false'):
+        return jsonify({"message": f"Invalid value for 'completed': {completed}"}), 400
+
+    filters = []
+    if start:
+        filters.append(Order.created_at >= start)
+    if end:
+        filters.append(Order.created_at < end)
+    if completed:
+        filters.append(Order.is_completed == (completed == 'true'))
+
+    serialize, content_type = EXPORT_FORMATS[fmt]
+
+    def generate():
+        try:
+            yield from serialize(export_rows(db.session, filters))
+        except Exception as e:
+            # 送信を始めた後はステータスを変えられないので、ログに残して打ち切る
+            logger.error("Error exporting orders: %s", e)
+            raise
+
+    # Content-Length を付けないのでチャンク転送になる。コンテキストは送信が終わるまで保持する
+    filename = f"orders_{datetime.now(pytz.timezone('Asia/Tokyo')).strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return Response(stream_with_context(generate()), content_type=content_type,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.cli.command('rollup-backfill')
+@click.option('--batch-size', default=1000, show_default=True, help='1回に読み込む注文数')
+def rollup_backfill(batch_size):
+    """既存の注文から時間帯別の集計テーブル (sales_hourly) を作り直す。"""
+    total = rollup.backfill(db.session, batch_size=batch_size)
+    click.echo(f"{total} orders aggregated into sales_hourly.")
+
 @app.route('/order_call', methods=['POST'])
 def order_call():
     try:
@@ -416,29 +1176,67 @@ def order_call():
             logger.error("No order ID provided")
             return jsonify({"error": "No order ID provided"}), 400
 
-        # 注文を取得して完了フラグを更新
-        order = Order.query.get(order_id)
-        if not order:
-            logger.error(f"Order with ID {order_id} not found")
-            return jsonify({"error": f"Order with ID {order_id} not found"}), 404
+        if order_journal is not None and order_journal.is_pending(order_id):
+            # DBに未反映の注文は、完了もジャーナルに記録する (反映時に完了フラグを更新する)
+            order_id = int(order_id)
+            order_journal.append_completion(order_id)
+        else:
+            # 注文を取得して完了フラグを更新
+            order = Order.query.get(order_id)
+            if not order:
+                logger.error("Order with ID %s not found", order_id)
+                return jsonify({"error": f"Order with ID {order_id} not found"}), 404
 
-        order.is_completed = True  # 完了フラグを更新
-        db.session.commit()
-        logger.debug(f"Order {order_id} marked as completed")
+            order.is_completed = True  # 完了フラグを更新
+            db.session.commit()
+            order_id = order.order_id
+        logger.debug("Order %s marked as completed", order_id)
+        broadcast_kitchen_delta(kitchen_queue.call_order(order_id))
 
-        # 音声合成の実行
+        # 音声の再生は再生サービスに登録するだけで、再生の完了は待たない
         if text:
-            logger.debug(f"Order call with text: {text}")
-            vvox_test(text)  # 音声合成を呼び出す
+            logger.debug("Order call with text: %s", text)
+            call_player.announce(text, key=order_id)
         else:
             logger.error("No text provided for order call")
             return jsonify({"error": "No text provided"}), 400
 
         return jsonify({"message": f"Order {order_id} call initiated"}), 200
     except Exception as e:
-        logger.error(f"Error in order call: {e}")
+        logger.error("Error in order call: %s", e)
         db.session.rollback()  # エラー時にはロールバック
         return jsonify({"error": "Server error"}), 500
 
+# 起動時の処理。ハードウェア (プリンター・音声) の初期化やDBからの読み込みはすべてバックグラウンドで行い、
+# リクエストの受け付けを待たせない。各処理は必要になった時点でも読み込むので、完了前に来たリクエストも処理できる
+STARTUP_TASKS = (load_kitchen_queue, rebuild_sales_counters, warmup_call_audio, warmup_printer)
+_started = False
+
+def create_app():
+    """
+    ワーカーとバックグラウンドの初期化を開始してアプリを返す (serve.py やベンチマークから呼ぶ)。
+    何度呼んでも開始は1回だけ。import しただけ (flask db upgrade などのCLI) では何も開始しない。
+    """
+    global _started
+    if _started:
+        return app
+    _started = True
+    if order_journal is not None:
+        # 前回の未反映分を復元してから受け付ける (厨房キューの読み込みにも含めるため先に開く)
+        order_journal.open()
+        journal_replayer.start()
+    if IS_PRIMARY:
+        call_player.start()
+        print_queue.start()
+        checkout_writer.start()
+        for task in STARTUP_TASKS:
+            socketio.start_background_task(task)
+    return app
+
 if __name__ == '__main__':
+    # 開発用 (リローダー付き)。本番は serve.py で起動する
+    # リローダーの親プロセスはファイルを監視して子プロセスを起動し直すだけなので、
+    # 印刷やジャーナルなどは実際にリクエストを処理する子プロセス (WERKZEUG_RUN_MAIN=true) だけで開始する
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,225 @@
+# 実機なしの負荷試験: プリンター (ESCPOSPrinter) と VOICEVOX を偽物に差し替え、一時ファイルの SQLite で
+# アプリ全体 (会計 → 印刷キュー、厨房画面のポーリング、呼び出し → 音声合成・再生) を動かして計測する
+# エンドポイントごとの p50/p95/p99 とスループットを JSON で出力するので、結果を保存して比較できる
+# 使い方: python backend/benchmark/bench_e2e.py [--cashiers 4] [--checkouts 25] [--kitchens 3] [--callers 1]
+#         [--print-latency 0.3] [--print-failure-rate 0.05] [--voicevox-latency 0.2] [--output result.json]
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cashiers", type=int, default=4, help="同時に会計するレジの数")
+    parser.add_argument("--checkouts", type=int, default=25, help="レジ1台あたりの会計数")
+    parser.add_argument("--kitchens", type=int, default=3, help="/orders をポーリングする厨房画面の数")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="厨房画面のポーリング間隔(秒)")
+    parser.add_argument("--callers", type=int, default=1, help="出来上がった注文を呼び出す厨房スタッフの数")
+    parser.add_argument("--call-interval", type=float, default=0.5, help="呼び出しの間隔(秒)")
+    parser.add_argument("--print-latency", type=float, default=0.3, help="偽プリンターの1枚あたりの印刷時間(秒)")
+    parser.add_argument("--print-failure-rate", type=float, default=0.0, help="偽プリンターの印刷失敗率")
+    parser.add_argument("--voicevox-latency", type=float, default=0.2, help="偽VOICEVOXの音声合成時間(秒)")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="終了後に印刷・呼び出しの完了を待つ秒数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果のJSONを書き出すファイル (省略時は標準出力)")
+    return parser.parse_args()
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"count": 0, "errors": errors}
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 2)
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "p50_ms": pick(0.5),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(latencies[-1] * 1000, 2),
+        "throughput_per_s": round(len(latencies) / elapsed, 2),
+    }
+
+
+def main():
+    args = parse_args()
+    tmpdir = tempfile.TemporaryDirectory()
+    os.environ["POS_DB_BACKEND"] = "sqlite"
+    os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmpdir.name) / 'bench.db'}"
+    os.environ["POS_AUDIO_SINK"] = "null"
+
+    # config を読む前に環境変数を設定しておく
+    import requests
+    from eventlet import wsgi
+    import app as appmod
+    from config import VVConfig
+    from models import db, Product
+    from fakes import FakeESCPOSPrinter, fake_voicevox_app
+    from order_call import call_cache, call_text
+    from print_queue import DONE, FAILED
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # 偽プリンターの失敗は再試行されるので、1件ずつのエラーは表示しない
+    logging.getLogger("print_queue").setLevel(logging.CRITICAL)
+    app = appmod.app
+
+    # 偽の VOICEVOX を起動して向き先を変える。音声のキャッシュも一時ディレクトリに置く
+    voicevox = eventlet.listen(("127.0.0.1", 0))
+    eventlet.spawn(wsgi.server, voicevox, fake_voicevox_app(latency=args.voicevox_latency), log_output=False)
+    VVConfig.HOST, VVConfig.PORT = "127.0.0.1", voicevox.getsockname()[1]
+    call_cache.cache_dir = Path(tmpdir.name) / "voice"
+
+    # プリンターは接続ごとに偽物のデバイスを使い、NVロゴの登録状態は書き込まない
+    devices = []
+
+    def device_factory():
+        device = FakeESCPOSPrinter(latency=args.print_latency, failure_rate=args.print_failure_rate,
+                                   seed=args.seed + len(devices))
+        devices.append(device)
+        return device
+
+    for name in appmod.printer_pool.names():
+        appmod.printer_pool.get(name).device_factory = device_factory
+    appmod.printer.use_nv_logo = False
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Product(name=name, category="menu", price=price, onSale=True)
+                            for name, price in [("normal", 250), ("DX", 300), ("GAMING", 450)]])
+        db.session.commit()
+        products = [(product.product_id, product.price) for product in Product.query.all()]
+    # 偽物に差し替えてテーブルを作ってから、ワーカーと起動時の初期化を開始する
+    appmod.create_app()
+
+    listener = eventlet.listen(("127.0.0.1", 0), backlog=1024)
+    base = f"http://127.0.0.1:{listener.getsockname()[1]}"
+    eventlet.spawn(wsgi.server, listener, app, log_output=False)
+
+    latencies = defaultdict(list)
+    errors = Counter()
+    called_at = {}
+    call_results = Counter()
+    running = {"cashiers": args.cashiers}
+
+    def request(session, name, method, path, expected=200, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base + path, timeout=60, allow_redirects=False, **kwargs)
+        except requests.RequestException:
+            errors[name] += 1
+            return None
+        latencies[name].append(time.perf_counter() - started)
+        if response.status_code != expected:
+            errors[name] += 1
+        return response
+
+    def cashier(index):
+        session = requests.Session()
+        rng = random.Random(args.seed * 1000 + index)
+        try:
+            for _ in range(args.checkouts):
+                items = rng.sample(products, rng.randint(1, len(products)))
+                orderL = [{"product_id": product_id, "quantity": rng.randint(1, 3)} for product_id, _ in items]
+                totalL = [price * item["quantity"] for (_, price), item in zip(items, orderL)]
+                total = sum(totalL)
+                started = time.perf_counter()
+                request(session, "POST /order", "POST", "/order", json={
+                    "orderL": orderL, "totalL": totalL, "total": total, "note": None,
+                    "menuL": [{"name": "item", "price": price, "quantity": item["quantity"]}
+                              for (_, price), item in zip(items, orderL)]})
+                response = request(session, "POST /pay", "POST", "/pay", expected=302, json={"payment": total})
+                if response is not None and response.status_code == 302:
+                    latencies["checkout"].append(time.perf_counter() - started)
+        finally:
+            running["cashiers"] -= 1
+
+    def kitchen():
+        session = requests.Session()
+        while running["cashiers"]:
+            request(session, "GET /orders", "GET", "/orders")
+            eventlet.sleep(args.poll_interval)
+
+    def caller():
+        session = requests.Session()
+        while True:
+            response = request(session, "GET /orders", "GET", "/orders")
+            waiting = [order["order_id"] for order in (response.json() if response is not None else [])
+                       if order["order_id"] not in called_at]
+            if waiting:
+                order_id = waiting[0]
+                called_at[order_id] = time.perf_counter()
+                request(session, "POST /order_call", "POST", "/order_call",
+                        json={"order_id": order_id, "text": call_text(order_id)})
+            elif not running["cashiers"]:
+                break
+            eventlet.sleep(args.call_interval)
+
+    # 呼び出しから再生完了までの時間を計測する
+    notify = appmod.call_player.on_done
+
+    def on_call_done(event):
+        call_results[event["status"]] += 1
+        if event["status"] == "played" and event["key"] in called_at:
+            latencies["call_to_played"].append(time.perf_counter() - called_at[event["key"]])
+        notify(event)
+
+    appmod.call_player.on_done = on_call_done
+
+    # tamasenSDK は標準出力に印刷の進捗を書くので、結果のJSONと混ざらないように標準エラーへ回す
+    with contextlib.redirect_stdout(sys.stderr):
+        started = time.perf_counter()
+        pool = eventlet.GreenPool(args.cashiers + args.kitchens + args.callers)
+        for index in range(args.cashiers):
+            pool.spawn_n(cashier, index)
+        for _ in range(args.kitchens):
+            pool.spawn_n(kitchen)
+        for _ in range(args.callers):
+            pool.spawn_n(caller)
+        pool.waitall()
+        elapsed = time.perf_counter() - started
+
+        # 会計・呼び出しの応答は印刷や再生を待たないので、それぞれ終わるまで待つ
+        deadline = time.monotonic() + args.drain_timeout
+        while time.monotonic() < deadline and (
+                any(job["status"] not in (DONE, FAILED) for job in appmod.print_queue.jobs())
+                or sum(call_results.values()) < len(called_at)):
+            eventlet.sleep(0.1)
+        drained = time.perf_counter() - started
+
+    jobs = appmod.print_queue.jobs()
+    print_durations = [job["finished_at"] - job["created_at"] for job in jobs if job["status"] == DONE]
+    result = {
+        "config": vars(args),
+        "elapsed_s": round(elapsed, 2),
+        "drained_s": round(drained, 2),
+        "endpoints": {name: summarize(values, errors[name], elapsed)
+                      for name, values in sorted(latencies.items()) if name.startswith(("GET ", "POST "))},
+        "checkout": summarize(latencies["checkout"], errors["POST /pay"], elapsed),
+        "print_jobs": dict(Counter(job["status"] for job in jobs),
+                           attempts=sum(job["attempts"] for job in jobs),
+                           device_failures=sum(device.failed for device in devices),
+                           queued_to_printed=summarize(print_durations, 0, drained)),
+        "calls": dict(call_results, called=len(called_at),
+                      call_to_played=summarize(latencies["call_to_played"], 0, drained)),
+    }
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    print(output)
+    tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
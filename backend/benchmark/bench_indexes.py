@@ -0,0 +1,133 @@
+# インデックス追加前後のクエリ時間のベンチマーク (SQLite)
+# 使い方: python backend/benchmark/bench_indexes.py [--orders 100000]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from flask import Flask
+from sqlalchemy.orm import joinedload, selectinload
+sys.path.append(str(Path(__file__).parent.parent))
+from models import db, Product, Order, OrderProduct
+
+INDEXES = [
+    Order.__table__.indexes,
+    OrderProduct.__table__.indexes,
+]
+
+
+def seed(n_orders, open_orders):
+    # 3日間の営業を想定し、最後の open_orders 件だけ未完了にする
+    products = [Product(product_id=i, name=name, category="menu", price=price, onSale=True)
+                for i, (name, price) in enumerate([("normal", 250), ("DX", 300), ("GAMING", 450)], start=1)]
+    db.session.add_all(products)
+    db.session.commit()
+
+    rng = random.Random(0)
+    start = datetime(2024, 11, 1, 10, 0, 0)
+    orders, lines = [], []
+    for i in range(n_orders):
+        order_id = 100 + i
+        chosen = rng.sample(products, rng.randint(1, 3))
+        quantities = [rng.randint(1, 3) for _ in chosen]
+        orders.append({
+            "order_id": order_id,
+            "created_at": start + timedelta(seconds=i * 3 * 24 * 3600 // n_orders),
+            "total_quantity": sum(quantities),
+            "total_amount": sum(p.price * q for p, q in zip(chosen, quantities)),
+            "note": None,
+            "is_completed": i < n_orders - open_orders,
+        })
+        lines += [{"order_id": order_id, "product_id": p.product_id, "quantity": q, "unit_price": p.price}
+                  for p, q in zip(chosen, quantities)]
+    db.session.execute(Order.__table__.insert(), orders)
+    db.session.execute(OrderProduct.__table__.insert(), lines)
+    db.session.commit()
+    return start
+
+
+def endpoint_queries(start):
+    day = start + timedelta(days=1)
+    return {
+        # GET /orders
+        "/orders": lambda: (
+            Order.query
+            .options(joinedload(Order.order_products).joinedload(OrderProduct.product))
+            .filter_by(is_completed=False)
+            .order_by(Order.order_id)
+            .all()
+        ),
+        # GET /order_history?start=...&end=... の1ページ目
+        "/order_history (page)": lambda: (
+            Order.query.options(selectinload(Order.order_products).joinedload(OrderProduct.product))
+            .filter(Order.created_at >= day, Order.created_at < day + timedelta(hours=2))
+            .order_by(Order.order_id).limit(101).all()
+        ),
+        # GET /order_history?start=...&end=... の合計
+        "/order_history (totals)": lambda: (
+            db.session.query(db.func.sum(OrderProduct.quantity), db.func.sum(OrderProduct.quantity * OrderProduct.unit_price))
+            .join(Order, Order.order_id == OrderProduct.order_id)
+            .join(Product, Product.product_id == OrderProduct.product_id)
+            .filter(Order.created_at >= day, Order.created_at < day + timedelta(hours=2))
+            .one()
+        ),
+        # 商品別の売上数 (/product_count の集計クエリ)
+        "/product_count": lambda: (
+            db.session.query(Product.product_id, Product.name, db.func.sum(OrderProduct.quantity))
+            .join(OrderProduct, Product.product_id == OrderProduct.product_id)
+            .group_by(Product.product_id, Product.name).all()
+        ),
+    }
+
+
+def measure(queries, repeat):
+    results = {}
+    for name, query in queries.items():
+        query()  # ウォームアップ
+        begin = time.perf_counter()
+        for _ in range(repeat):
+            query()
+            db.session.expunge_all()
+        results[name] = (time.perf_counter() - begin) / repeat * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--open-orders", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            for table_indexes in INDEXES:
+                for index in table_indexes:
+                    index.drop(db.engine)
+
+            begin = time.perf_counter()
+            start = seed(args.orders, args.open_orders)
+            print(f"seeded {args.orders:,} orders in {time.perf_counter() - begin:.1f}s")
+
+            queries = endpoint_queries(start)
+            before = measure(queries, args.repeat)
+            for table_indexes in INDEXES:
+                for index in table_indexes:
+                    index.create(db.engine)
+            db.session.execute(db.text("ANALYZE"))
+            after = measure(queries, args.repeat)
+
+    print(f"{'query':<28}{'before (ms)':>12}{'after (ms)':>12}")
+    for name in queries:
+        print(f"{name:<28}{before[name]:>12.2f}{after[name]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
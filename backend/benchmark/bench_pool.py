@@ -0,0 +1,190 @@
+# DB接続プールの負荷試験 (同時に1,000本のグリーンスレッドからリクエストする)
+# 1回目でプールを使い切らせ、プール内の接続を裏で閉じて (DB側で切られた接続の代わり) から2回目を流す
+# 全リクエストが成功し、プールの上限まで貸し出し、接続の貸し出しと返却の回数が一致して
+# 終了後に貸し出し中の接続が残っていないことを確認する。満たさなければ終了コード1で終わる
+# SQLite はクエリ中に他のグリーンスレッドへ切り替わらないので、既定ではクエリごとに --query-delay 秒待って
+# ネットワーク越しのDBの往復を模擬する (MySQL では --query-delay 0 で実際のままにできる)
+# 使い方: python backend/benchmark/bench_pool.py [--concurrency 1000] [--database-url mysql+pymysql://...]
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=1000, help="同時に動かすグリーンスレッドの数")
+    parser.add_argument("--checkout-ratio", type=float, default=0.2, help="会計リクエストの割合 (残りは注文履歴の取得)")
+    parser.add_argument("--database-url", help="省略時は一時ファイルの SQLite")
+    parser.add_argument("--query-delay", type=float,
+                        help="クエリごとに待つ秒数 (既定: SQLite は 0.01、--database-url 指定時は 0)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    tmpdir = tempfile.TemporaryDirectory()
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmpdir.name) / 'bench.db'}"
+    # 会計のジャーナルも一時ディレクトリに置く (backend/data に残さない)
+    os.environ["POS_ORDER_JOURNAL_PATH"] = str(Path(tmpdir.name) / "order_journal.jsonl")
+    # ジャーナルを使うと会計のリクエスト中にDBを使わなくなるので、直接DBに保存させる
+    os.environ["POS_ORDER_JOURNAL"] = "0"
+    os.environ.setdefault("POS_AUDIO_SINK", "null")
+
+    # config を読む前に環境変数を設定しておく
+    import requests
+    from eventlet import wsgi
+    from sqlalchemy import event
+    import app as appmod
+    from models import db, Product
+    from fakes import FakeESCPOSPrinter
+    from config import DBConfig
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # VOICEVOX なしで動かすので、呼び出し音声の先行合成の失敗は表示しない
+    logging.getLogger("order_call").setLevel(logging.ERROR)
+    app = appmod.app
+    # プリンターは偽物のデバイスに差し替え、NVロゴの登録状態は書き込まない
+    for name in appmod.printer_pool.names():
+        appmod.printer_pool.get(name).device_factory = FakeESCPOSPrinter
+    appmod.printer.use_nv_logo = False
+
+    with app.app_context():
+        engine = db.engine
+
+    # 最初の接続を張る前に登録して、開いた接続をすべて数える
+    stats = Counter()
+    checked_out = {"now": 0, "max": 0}
+    connections = []
+    query_delay = args.query_delay if args.query_delay is not None else (0 if args.database_url else 0.01)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, _):
+        stats["connect"] += 1
+        connections.append(dbapi_connection)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def delay_query(*_):
+        if query_delay:
+            eventlet.sleep(query_delay)
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(*_):
+        stats["checkout"] += 1
+        checked_out["now"] += 1
+        checked_out["max"] = max(checked_out["max"], checked_out["now"])
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(*_):
+        stats["checkin"] += 1
+        checked_out["now"] -= 1
+
+    # テーブルを作ってからワーカーと起動時の読み込みを開始する
+    with app.app_context():
+        if not args.database_url:
+            db.create_all()
+        if not Product.query.first():
+            db.session.add_all([Product(name=name, category="menu", price=price, onSale=True)
+                                for name, price in [("normal", 250), ("DX", 300), ("GAMING", 450)]])
+            db.session.commit()
+        product_ids = [product.product_id for product in Product.query.all()]
+    appmod.create_app()
+
+    listener = eventlet.listen(("127.0.0.1", 0), backlog=args.concurrency)
+    base = f"http://127.0.0.1:{listener.getsockname()[1]}"
+    eventlet.spawn(wsgi.server, listener, app, log_output=False, max_size=args.concurrency * 2)
+
+    rng = random.Random(0)
+    latencies = []
+    statuses = Counter()
+
+    def checkout(session):
+        product_id = rng.choice(product_ids)
+        order = {"orderL": [{"product_id": product_id, "quantity": 1}], "totalL": [250], "total": 250,
+                 "note": None, "menuL": [{"name": "item", "price": 250, "quantity": 1}]}
+        session.post(base + "/order", json=order, timeout=60)
+        return session.post(base + "/pay", json={"payment": 250}, allow_redirects=False, timeout=60)
+
+    def worker(index):
+        session = requests.Session()
+        started = time.perf_counter()
+        try:
+            if rng.random() < args.checkout_ratio:
+                response = checkout(session)
+            else:
+                response = session.get(base + "/order_history", params={"limit": 20}, timeout=60)
+            statuses[response.status_code] += 1
+        except requests.RequestException as e:
+            statuses[type(e).__name__] += 1
+        latencies.append(time.perf_counter() - started)
+        session.close()
+
+    def run_wave(name):
+        latencies.clear()
+        statuses.clear()
+        started = time.perf_counter()
+        pool = eventlet.GreenPool(args.concurrency)
+        for index in range(args.concurrency):
+            pool.spawn_n(worker, index)
+        pool.waitall()
+        elapsed = time.perf_counter() - started
+        # 応答を返した後のセッションの後始末を待つ
+        eventlet.sleep(0.5)
+        latencies.sort()
+        p = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+        print(f"{name}: elapsed: {elapsed:.2f}s  p50: {p(0.5):.1f}ms  p95: {p(0.95):.1f}ms  p99: {p(0.99):.1f}ms  "
+              f"status: {dict(statuses)}")
+        return sum(count for status, count in statuses.items() if status not in (200, 302))
+
+    print(f"pool_size={DBConfig.POOL_SIZE} max_overflow={DBConfig.MAX_OVERFLOW} timeout={DBConfig.POOL_TIMEOUT}s "
+          f"pre_ping={DBConfig.POOL_PRE_PING} recycle={DBConfig.POOL_RECYCLE}s concurrency={args.concurrency} "
+          f"query_delay={query_delay}s")
+    failures = run_wave("wave 1")
+
+    # プールに戻っている接続を SQLAlchemy に知らせずに閉じる (DB側のタイムアウトや再起動で切られた状態)
+    stale = 0
+    for dbapi_connection in connections:
+        try:
+            dbapi_connection.close()
+            stale += 1
+        except Exception:
+            pass
+    connected_before = stats["connect"]
+    failures += run_wave("wave 2")
+    # 印刷 (tpool で実行中) が終わるのを待つ
+    appmod.print_queue.stop(timeout=30)
+
+    print(f"connections opened: {stats['connect']}  checkouts: {stats['checkout']}  checkins: {stats['checkin']}  "
+          f"max checked out: {checked_out['max']}")
+    print(f"stale connections closed: {stale}  reopened in wave 2: {stats['connect'] - connected_before}")
+    leaked = engine.pool.checkedout()
+    print(f"pool: {engine.pool.status()}")
+    ok = True
+    if failures:
+        print(f"FAIL: {failures} request(s) failed")
+        ok = False
+    if checked_out["max"] <= DBConfig.POOL_SIZE:
+        print(f"FAIL: at most {checked_out['max']} connection(s) were checked out, so the pool was never exhausted "
+              f"(raise --concurrency or --query-delay)")
+        ok = False
+    if leaked or stats["checkout"] != stats["checkin"]:
+        print(f"FAIL: {leaked} connection(s) still checked out")
+        ok = False
+    if not ok:
+        sys.exit(1)
+    print("pool exhausted and recovered from stale connections without leaks")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# レシート生成とロゴ変換のベンチマーク
+# 使い方: python backend/benchmark/bench_receipt.py [--receipts 20000]
+import argparse
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from PIL import Image
+sys.path.append(str(Path(__file__).parent.parent))
+from receipt_template import BITMAP_PATH, ReceiptTemplate, build_logo_raster, load_logo_raster
+
+
+def legacy_logo(image_path):
+    # 変更前の実装 (1ピクセルずつ getpixel で詰める)
+    img = Image.open(image_path).convert('1')
+    width, height = img.size
+    if width % 8 != 0:
+        width = (width + 7) // 8 * 8
+        img = img.resize((width, height))
+    bitmap_data = bytearray()
+    for y in range(height):
+        for x in range(0, width, 8):
+            byte = 0
+            for bit in range(8):
+                if x + bit < width and img.getpixel((x + bit, y)) == 0:
+                    byte |= (1 << (7 - bit))
+            bitmap_data.append(byte)
+    return bytes(b'\x1D\x76\x30\x00' + bytes([width // 8 % 256, width // 8 // 256, height % 256, height // 256]) + bitmap_data)
+
+
+def legacy_receipt(logo, order_id, orderL, totalL, total, payment, note, menuL, order_date):
+    # 変更前の実装 (bytes += による連結)
+    pad = lambda n: n if n < 4 else n + 1
+    buffer = b'\x1B\x40' + logo
+    buffer += b'\x1D\x21\x00' + "福桔祭店    {}\n".format(order_date.strftime("%Y/%m/%d %H:%M:%S")).encode("shift_jis") + b'\x1D\x21\x10'
+    buffer += b'\x1B\x2D\x01' + "                \n".encode("shift_jis") + b'\x1B\x2D\x00'
+    for i in range(len(menuL)):
+        if orderL[i]['quantity'] > 0:
+            buffer += "{0}{1}@{2} {3}ｺ\n".format(menuL[i]['name'], " " * (6 - len(menuL[i]['name'])), menuL[i]['price'], orderL[i]['quantity']).encode("shift_jis")
+            buffer += "{0}￥{1:,}\n".format(" " * (13 - pad(len(str(totalL[i])))), totalL[i]).encode("shift_jis")
+    if note:
+        buffer += b'\x1D\x21\x00' + "\n{}\n".format(note).encode("shift_jis") + b'\x1D\x21\x10'
+    buffer += b'\x1B\x2D\x01' + "                \n".encode("shift_jis") + b'\x1B\x2D\x00'
+    buffer += "合計{0}￥{1:,}\n".format(" " * (9 - pad(len(str(total)))), total).encode("shift_jis")
+    buffer += "お預り{0}￥{1:,}\n".format(" " * (7 - pad(len(str(payment)))), payment).encode("shift_jis")
+    buffer += "おつり{0}￥{1:,}\n".format(" " * (7 - pad(len(str(payment - total)))), payment - total).encode("shift_jis")
+    buffer += b'\x1D\x21\x00' + "\n          Thank you!".encode("shift_jis")
+    buffer += b'\x1D\x21\x56' + b'\x1D\x42\x01' + "\n {} \n".format(order_id).encode("shift_jis") + b'\x1D\x42\x00'
+    buffer += b'\x1D\x56\x42\x2D'
+    return buffer
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--receipts", type=int, default=20000)
+    parser.add_argument("--image", default=BITMAP_PATH)
+    args = parser.parse_args()
+
+    # ロゴ変換
+    legacy_time, legacy = timed(lambda: legacy_logo(args.image), 3)
+    vector_time, vector = timed(lambda: build_logo_raster(args.image), 20)
+    assert legacy == vector, "logo raster mismatch"
+    with tempfile.TemporaryDirectory() as cache_dir:
+        load_logo_raster(args.image, cache_dir)
+        cached_time, cached = timed(lambda: load_logo_raster(args.image, cache_dir), 20)
+    assert cached == vector
+
+    print("=== logo raster build ===")
+    print(f"getpixel loop : {legacy_time * 1000:9.2f} ms")
+    print(f"vectorized    : {vector_time * 1000:9.2f} ms")
+    print(f"disk cache hit: {cached_time * 1000:9.2f} ms")
+
+    # レシート生成
+    order = dict(
+        order_id=123,
+        orderL=[{'product_id': 1, 'quantity': 2}, {'product_id': 2, 'quantity': 1}, {'product_id': 3, 'quantity': 3}],
+        totalL=[500, 300, 1350],
+        total=2150,
+        payment=5000,
+        note="マヨなし",
+        menuL=[{'name': 'normal', 'price': 250}, {'name': 'DX', 'price': 300}, {'name': 'GAMING', 'price': 450}],
+        order_date=datetime(2024, 11, 3, 12, 34, 56),
+    )
+    template = ReceiptTemplate(logo=vector)
+    assert template.render(**order) == legacy_receipt(vector, **order), "receipt bytes mismatch"
+
+    n = args.receipts
+    legacy_time, _ = timed(lambda: legacy_receipt(vector, **order), n)
+    template_time, _ = timed(lambda: template.render(**order), n)
+    print("=== receipt rendering ===")
+    print(f"bytes +=      : {1 / legacy_time:12,.0f} receipts/sec")
+    print(f"template      : {1 / template_time:12,.0f} receipts/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# 起動時間の計測: serve.py を起動してから最初のリクエストに応答するまでの時間 (コールドスタート) を測る
+# 営業中に再起動しても列を止めないよう、目標 (--target 秒) を超えたら終了コード1で終わる
+# 使い方: python backend/benchmark/bench_startup.py [--runs 5] [--target 3.0] [--database-url mysql+pymysql://...]
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BACKEND_DIR))
+
+
+def parse_args():
+    from config import ServeConfig
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="起動を繰り返す回数")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--target", type=float, default=ServeConfig.STARTUP_TARGET, help="目標とする起動時間(秒)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="1回の起動を待つ最大の秒数")
+    parser.add_argument("--database-url", help="省略時は一時ファイルの SQLite")
+    return parser.parse_args()
+
+
+def wait_until_ready(url, process, started, timeout):
+    """started から応答 (200) が返るまでの秒数を返す。プロセスが終了したかタイムアウトしたら None。"""
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            return None
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - started
+        except requests.RequestException:
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database_url = args.database_url or f"sqlite:///{Path(tmpdir) / 'startup.db'}"
+        if not args.database_url:
+            # start.py と同じく、起動前にテーブルを作っておく
+            from sqlalchemy import create_engine
+            from models import db
+            db.metadata.create_all(create_engine(database_url))
+
+        env = dict(os.environ, DATABASE_URL=database_url, POS_AUDIO_SINK="null", POS_WORKERS="1")
+        command = [sys.executable, str(BACKEND_DIR / "serve.py"), "--host", "127.0.0.1", "--port", str(args.port)]
+        timings = []
+        for run in range(args.runs):
+            started = time.perf_counter()
+            process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            elapsed = wait_until_ready(f"http://127.0.0.1:{args.port}/products", process, started, args.timeout)
+            process.terminate()
+            _, stderr = process.communicate()
+            if elapsed is None:
+                print(f"run {run + 1}: did not become ready\n{stderr.decode(errors='replace')[-2000:]}")
+                sys.exit(1)
+            timings.append(elapsed)
+            print(f"run {run + 1}: first response after {elapsed:.2f}s")
+
+    timings.sort()
+    median = timings[len(timings) // 2]
+    print(f"median: {median:.2f}s  max: {timings[-1]:.2f}s  target: {args.target:.2f}s")
+    if median > args.target:
+        print("FAIL: cold start is slower than the target")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# 会計 (/order → /pay) のレイテンシとスループットを保存先ごとに比較するベンチマーク
+# SQLite (WAL + synchronous=NORMAL)、SQLite (従来のジャーナル + synchronous=FULL)、MySQL (--mysql-url 指定時)
+# 保存先の比較なので会計のジャーナルは切り、比較用にジャーナル経由 (journal+sqlite-wal) の会計も測る
+# 使い方: python backend/benchmark/bench_storage.py [--cashiers 8] [--checkouts 50] [--mysql-url mysql+pymysql://...]
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+VARIANTS = {
+    "sqlite-wal": {"POS_SQLITE_JOURNAL_MODE": "WAL", "POS_SQLITE_SYNCHRONOUS": "NORMAL", "POS_ORDER_JOURNAL": "0"},
+    "sqlite-journal": {"POS_SQLITE_JOURNAL_MODE": "DELETE", "POS_SQLITE_SYNCHRONOUS": "FULL", "POS_ORDER_JOURNAL": "0"},
+    "journal+sqlite-wal": {"POS_SQLITE_JOURNAL_MODE": "WAL", "POS_SQLITE_SYNCHRONOUS": "NORMAL", "POS_ORDER_JOURNAL": "1"},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cashiers", type=int, default=8, help="同時に会計するレジの数")
+    parser.add_argument("--checkouts", type=int, default=50, help="レジ1台あたりの会計数")
+    parser.add_argument("--mysql-url", help="比較する MySQL の接続先 (テーブル作成済みのDB)")
+    parser.add_argument("--run", help=argparse.SUPPRESS)  # 子プロセスとして1つの保存先を計測する
+    return parser.parse_args()
+
+
+def run_variant(args):
+    # 子プロセス: 環境変数で指定された保存先でアプリを起動して計測し、結果をJSONで出力する
+    import eventlet
+    eventlet.monkey_patch()
+    sys.path.append(str(Path(__file__).parent.parent))
+    import logging
+    import requests
+    from eventlet import wsgi
+    import app as appmod
+    from models import db, Product
+    from fakes import FakeESCPOSPrinter
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("order_call").setLevel(logging.ERROR)
+    app = appmod.app
+    # プリンターは偽物のデバイスに差し替え、NVロゴの登録状態は書き込まない
+    for name in appmod.printer_pool.names():
+        appmod.printer_pool.get(name).device_factory = FakeESCPOSPrinter
+    appmod.printer.use_nv_logo = False
+    # テーブルを作ってからワーカーと起動時の読み込みを開始する
+    with app.app_context():
+        db.create_all()
+        if not Product.query.first():
+            db.session.add_all([Product(name=name, category="menu", price=price, onSale=True)
+                                for name, price in [("normal", 250), ("DX", 300), ("GAMING", 450)]])
+            db.session.commit()
+        product_ids = [product.product_id for product in Product.query.all()]
+    appmod.create_app()
+
+    listener = eventlet.listen(("127.0.0.1", 0))
+    base = f"http://127.0.0.1:{listener.getsockname()[1]}"
+    eventlet.spawn(wsgi.server, listener, app, log_output=False)
+
+    latencies = []
+    failures = []
+
+    def cashier(index):
+        session = requests.Session()
+        for n in range(args.checkouts):
+            product_id = product_ids[(index + n) % len(product_ids)]
+            order = {"orderL": [{"product_id": product_id, "quantity": 2}], "totalL": [500], "total": 500,
+                     "note": None, "menuL": [{"name": "item", "price": 250, "quantity": 2}]}
+            started = time.perf_counter()
+            session.post(base + "/order", json=order)
+            response = session.post(base + "/pay", json={"payment": 500}, allow_redirects=False)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 302:
+                failures.append(response.status_code)
+
+    started = time.perf_counter()
+    pool = eventlet.GreenPool(args.cashiers)
+    for index in range(args.cashiers):
+        pool.spawn_n(cashier, index)
+    pool.waitall()
+    elapsed = time.perf_counter() - started
+    # 印刷 (tpool で実行中) が終わってから終了する
+    appmod.print_queue.stop(timeout=30)
+
+    latencies.sort()
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 2)
+    print(json.dumps({
+        "checkouts": len(latencies),
+        "failures": len(failures),
+        "p50_ms": pick(0.5),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "throughput_per_s": round(len(latencies) / elapsed, 1),
+    }))
+
+
+def main():
+    args = parse_args()
+    if args.run:
+        run_variant(args)
+        return
+
+    variants = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, env in VARIANTS.items():
+            variants[name] = dict(env, DATABASE_URL=f"sqlite:///{Path(tmpdir) / (name + '.db')}",
+                                  POS_ORDER_JOURNAL_PATH=str(Path(tmpdir) / (name + '.jsonl')))
+        if args.mysql_url:
+            variants["mysql"] = {"DATABASE_URL": args.mysql_url, "POS_ORDER_JOURNAL": "0"}
+
+        results = {}
+        for name, env in variants.items():
+            command = [sys.executable, __file__, "--run", name,
+                       "--cashiers", str(args.cashiers), "--checkouts", str(args.checkouts)]
+            output = subprocess.run(command, env=dict(os.environ, POS_AUDIO_SINK="null", **env),
+                                    capture_output=True, text=True)
+            if output.returncode != 0:
+                print(f"{name}: failed\n{output.stderr[-2000:]}")
+                continue
+            results[name] = json.loads(output.stdout.strip().splitlines()[-1])
+
+    print(f"{'backend':<20}{'checkouts':>10}{'failures':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'per sec':>10}")
+    for name, r in results.items():
+        print(f"{name:<20}{r['checkouts']:>10}{r['failures']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['throughput_per_s']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# ベンチマーク・テスト用の偽物 (実機のプリンターや VOICEVOX エンジンの代わりに使う)
+import io
+import json
+import random
+import time
+import wave
+
+from csjwindowspossdk import ESCPOSConst
+
+
+class FakeESCPOSPrinter:
+    """
+    実機・DLLなしで動作確認するための ESCPOSPrinter (PrinterConnection の device_factory に渡す)。
+    接続に connect_latency 秒、TransactionPrint(CMP_TP_NORMAL) (送信と印刷) に latency 秒かかり、
+    印刷は failure_rate の確率で失敗する。それ以外の命令は何もせず成功を返す。
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, connect_latency=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.connect_latency = connect_latency
+        self.printed = 0
+        self.failed = 0
+        self._random = random.Random(seed)
+
+    def Connect(self, connectType, addr, Port=None, Timeout=None):
+        if self.connect_latency:
+            time.sleep(self.connect_latency)
+        return ESCPOSConst.CMP_SUCCESS
+
+    def Status(self):
+        return 0
+
+    def TransactionPrint(self, control):
+        if control != ESCPOSConst.CMP_TP_NORMAL:
+            return ESCPOSConst.CMP_SUCCESS
+        if self.latency:
+            time.sleep(self.latency)
+        if self._random.random() < self.failure_rate:
+            self.failed += 1
+            return ESCPOSConst.CMP_E_OFFLINE
+        self.printed += 1
+        return ESCPOSConst.CMP_SUCCESS
+
+    def __getattr__(self, name):
+        # PrintText や CutPaper などは何もしない
+        return lambda *args, **kwargs: ESCPOSConst.CMP_SUCCESS
+
+
+def fake_voicevox_app(latency=0.0, duration=0.5, frame_rate=24000):
+    """
+    VOICEVOX エンジンの代わりに使う WSGI アプリ (実機なしでの動作確認・ベンチマーク用)。
+    /version・/audio_query・/synthesis に答え、/synthesis は latency 秒かけて無音のWAVを返す。
+    """
+    silence = io.BytesIO()
+    with wave.open(silence, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(frame_rate)
+        wf.writeframes(b'\x00\x00' * int(frame_rate * duration))
+    silence = silence.getvalue()
+
+    def app(environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path == '/version':
+            body, content_type = b'"fake"', 'application/json'
+        elif path == '/audio_query':
+            body, content_type = json.dumps({"accent_phrases": [], "speedScale": 1.0}).encode(), 'application/json'
+        elif path == '/synthesis':
+            if latency:
+                time.sleep(latency)
+            body, content_type = silence, 'audio/wav'
+        else:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'not found']
+        start_response('200 OK', [('Content-Type', content_type), ('Content-Length', str(len(body)))])
+        return [body]
+
+    return app
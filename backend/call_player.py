@@ -0,0 +1,177 @@
+import io
+import itertools
+import logging
+import queue
+import threading
+import time
+import wave
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+PLAYBACK_SECONDS = registry.histogram("pos_call_playback_seconds", "Time spent playing a call announcement.")
+
+# 優先度 (小さいほど先に再生する)
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 10
+
+CHUNK_FRAMES = 1024
+
+
+class PyAudioSink:
+    """
+    PyAudio の出力ストリームを開いたまま使い回す。
+    フォーマットが変わったときだけ開き直す。
+    """
+
+    def __init__(self):
+        import pyaudio
+        self._pya = pyaudio.PyAudio()
+        self._stream = None
+        self._format = None
+
+    def _open(self, sampwidth, channels, rate):
+        fmt = (sampwidth, channels, rate)
+        if self._stream is not None and self._format == fmt:
+            return
+        self._close_stream()
+        self._stream = self._pya.open(format=self._pya.get_format_from_width(sampwidth),
+                                      channels=channels,
+                                      rate=rate,
+                                      output=True)
+        self._format = fmt
+
+    def play(self, wav_bytes):
+        wf = wave.open(io.BytesIO(wav_bytes), 'rb')
+        self._open(wf.getsampwidth(), wf.getnchannels(), wf.getframerate())
+        data = wf.readframes(CHUNK_FRAMES)
+        while data:
+            self._stream.write(data)
+            data = wf.readframes(CHUNK_FRAMES)
+
+    def _close_stream(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+
+    def close(self):
+        self._close_stream()
+        self._pya.terminate()
+
+
+class NullSink:
+    """音を出さずに再生したことだけ記録する出力先。realtime=True なら再生時間分待つ。"""
+
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.played = []
+
+    def play(self, wav_bytes):
+        if self.realtime:
+            wf = wave.open(io.BytesIO(wav_bytes), 'rb')
+            time.sleep(wf.getnframes() / wf.getframerate())
+        self.played.append(wav_bytes)
+
+    def close(self):
+        pass
+
+
+class Announcement:
+    def __init__(self, key, text, priority):
+        self.key = key
+        self.text = text
+        self.priority = priority
+        self.created_at = time.time()
+
+    def to_dict(self):
+        return {"key": self.key, "text": self.text, "priority": self.priority}
+
+
+class CallPlayer:
+    """
+    呼び出し音声の再生サービス。
+    専用ワーカーが優先度順に音声を用意して再生し、リクエスト側は登録するだけで戻る。
+    同じキー (注文ID) の呼び出しが待機中なら重複して登録しない。
+    """
+
+    def __init__(self, synthesize, sink_factory=PyAudioSink, executor=None, on_done=None):
+        self.synthesize = synthesize  # テキストからWAVデータを返す関数
+        self.sink_factory = sink_factory
+        # 再生の実行方法 (eventlet 環境では tpool.execute を渡す)
+        self.executor = executor or (lambda func, *args, **kwargs: func(*args, **kwargs))
+        self.on_done = on_done
+        self._queue = queue.PriorityQueue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._sink = None
+        self._worker = None
+
+    def start(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="call-player", daemon=True)
+            self._worker.start()
+        return self
+
+    def stop(self, timeout=None):
+        if self._worker is not None:
+            self._queue.put((float('inf'), next(self._seq), None))
+            self._worker.join(timeout)
+            self._worker = None
+
+    def announce(self, text, key=None, priority=PRIORITY_NORMAL):
+        """呼び出しを登録する。重複して登録しなかった場合はFalseを返す。"""
+        key = key if key is not None else text
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+        self._queue.put((priority, next(self._seq), Announcement(key, text, priority)))
+        return True
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _notify(self, announcement, status, error=None):
+        if self.on_done:
+            try:
+                self.on_done(dict(announcement.to_dict(), status=status, error=error))
+            except Exception as e:
+                logger.error("Error notifying playback: %s", e)
+
+    def _run(self):
+        while True:
+            _, _, announcement = self._queue.get()
+            if announcement is None:
+                break
+            with self._lock:
+                self._pending.discard(announcement.key)
+            try:
+                wav_bytes = self.synthesize(announcement.text)
+            except Exception as e:
+                logger.error("Synthesis failed for %r: %s", announcement.text, e)
+                self._notify(announcement, "failed", str(e))
+                continue
+            try:
+                if self._sink is None:
+                    self._sink = self.sink_factory()
+                with PLAYBACK_SECONDS.time():
+                    self.executor(self._sink.play, wav_bytes)
+            except Exception as e:
+                logger.error("Playback failed for %r: %s", announcement.text, e)
+                self._discard_sink()
+                self._notify(announcement, "failed", str(e))
+                continue
+            self._notify(announcement, "played")
+        self._discard_sink()
+
+    def _discard_sink(self):
+        # 出力デバイスのエラー後は次回開き直す
+        if self._sink is not None:
+            try:
+                self._sink.close()
+            except Exception as e:
+                logger.warning("Error closing audio sink: %s", e)
+            self._sink = None
@@ -0,0 +1,56 @@
+import hashlib
+import json
+import threading
+
+
+class CatalogEntry:
+    def __init__(self, version, products):
+        self.version = version
+        self.products = products
+        # JSONへの変換とETagの計算は読み込み時に一度だけ行う
+        self.body = json.dumps(products, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        self.etag = hashlib.sha1(self.body.encode("utf-8")).hexdigest()
+
+
+class CatalogCache:
+    """
+    商品一覧をプロセス内に保持するキャッシュ。
+    商品が変更されたら invalidate() でバージョンを進め、次の取得時にDBから読み直す。
+    """
+
+    def __init__(self, loader):
+        self.loader = loader  # 商品の辞書のリストを返す関数
+        self._version = 1
+        self._entry = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._version
+
+    def get(self):
+        entry = self._entry
+        if entry is not None and entry.version == self._version:
+            return entry
+        with self._lock:
+            version = self._version
+            if self._entry is not None and self._entry.version == version:
+                return self._entry
+            entry = CatalogEntry(version, self.loader())
+            # 読み込み中に更新された場合は古い内容をキャッシュしない
+            if version == self._version:
+                self._entry = entry
+            return entry
+
+    def get_or_stale(self):
+        """DBから読み直せない場合は、最後に読み込んだ内容を返す (DB停止中の会計用)。"""
+        try:
+            return self.get()
+        except Exception:
+            if self._entry is None:
+                raise
+            return self._entry
+
+    def invalidate(self):
+        self._version += 1
+        return self._version
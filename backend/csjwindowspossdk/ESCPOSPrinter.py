@@ -1,4 +1,3 @@
-import clr
 from pathlib import Path
 dllPath = Path(__file__).parent/"Library"/"CSJPOSLib.dll"
 
@@ -21,6 +20,8 @@ class ESCPOSPrinter:
     def __init__(self):
         if not dllPath.exists():
             raise FileNotFoundError(f"CSJPOSLib.dll not found in {dllPath}")
+        # pythonnet starts the .NET runtime, so import it only when a printer is actually created
+        import clr
         clr.AddReference(str(dllPath))
         # This import may cause an error in some IDEs or linters because the DLL is dynamically loaded at runtime
         import com.citizen.sdk
@@ -0,0 +1,39 @@
+import os
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLocked(Exception):
+    """ほかのプロセス (または同じプロセスの別のインスタンス) が使用中のファイル。"""
+
+
+def lock_file(path):
+    """
+    path の隣のロックファイル (path + ".lock") を排他ロックし、開いたロックファイルを返す。
+    返したファイルを閉じるとロックが外れる (プロセスが終了した場合も外れる)。
+    既にロックされている場合は FileLocked を送出する。
+    ロックは置き換えられることのない別のファイルに掛けるので、os.replace で本体を差し替えても外れない。
+    """
+    lock_path = Path(str(path) + ".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    f = open(lock_path, "a+")
+    try:
+        f.seek(0)
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError as e:
+        f.close()
+        raise FileLocked(f"{path} is already in use by another process (see {lock_path})") from e
+    # 調べやすいよう、ロックしているプロセスの番号を書いておく
+    f.seek(0)
+    f.truncate()
+    f.write(str(os.getpid()))
+    f.flush()
+    return f
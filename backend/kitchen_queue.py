@@ -0,0 +1,121 @@
+import threading
+import uuid
+from collections import OrderedDict, deque
+
+# 差分の種類 (Socket.IO のイベント名と同じ)
+NEW_ORDER = "new_order"
+ORDER_CALL = "order_call"
+END_ORDER = "end_order"
+
+
+class KitchenQueue:
+    """
+    未完了注文のキューをサーバー側で保持する。
+    変更ごとに連番 (seq) 付きの差分を記録し、再接続したクライアントには
+    取りこぼした差分だけを返す。差分が古すぎる場合はスナップショットを返す。
+    """
+
+    def __init__(self, loader, history_size=500):
+        self.loader = loader  # 未完了注文 (order_id, note, menuL を持つ辞書) のリストを返す関数
+        self.history_size = history_size
+        # サーバーを再起動したら連番が振り直されるので、起動ごとの識別子を付ける
+        self.epoch = uuid.uuid4().hex[:8]
+        self._orders = OrderedDict()
+        self._called = set()
+        self._history = deque(maxlen=history_size)
+        self._seq = 0
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    for order in self.loader():
+                        self._orders.setdefault(order['order_id'], order)
+                    self._loaded = True
+
+    def _record(self, delta_type, **fields):
+        self._seq += 1
+        delta = dict(fields, type=delta_type, seq=self._seq, epoch=self.epoch)
+        self._history.append(delta)
+        return delta
+
+    def add_order(self, order):
+        with self._lock:
+            # ここで初めて読み込んだ場合は、DBから読んだ一覧に確定したばかりのこの注文も含まれている
+            loaded_now = not self._loaded
+            self.ensure_loaded()
+            if order['order_id'] in self._orders and not loaded_now:
+                return None
+            self._orders[order['order_id']] = order
+            return self._record(NEW_ORDER, order=order)
+
+    def merge(self, orders):
+        """読み込み直した未完了注文のうち、まだキューにないものを加えて差分のリストを返す。"""
+        with self._lock:
+            self.ensure_loaded()
+            deltas = []
+            for order in orders:
+                if order['order_id'] not in self._orders:
+                    self._orders[order['order_id']] = order
+                    deltas.append(self._record(NEW_ORDER, order=order))
+            return deltas
+
+    def call_order(self, order_id):
+        """呼び出し済みにする。既に呼び出し済み・存在しない場合は None を返す。"""
+        with self._lock:
+            self.ensure_loaded()
+            if order_id not in self._orders or order_id in self._called:
+                return None
+            self._called.add(order_id)
+            return self._record(ORDER_CALL, order_id=order_id)
+
+    def end_order(self, order_id):
+        with self._lock:
+            self.ensure_loaded()
+            if self._orders.pop(order_id, None) is None:
+                return None
+            self._called.discard(order_id)
+            return self._record(END_ORDER, order_id=order_id)
+
+    def get(self, order_id):
+        with self._lock:
+            self.ensure_loaded()
+            return self._orders.get(order_id)
+
+    def waiting_orders(self):
+        """呼び出し前の注文 (GET /orders と同じ内容) を返す。"""
+        with self._lock:
+            self.ensure_loaded()
+            return [order for order_id, order in self._orders.items() if order_id not in self._called]
+
+    def snapshot(self):
+        with self._lock:
+            self.ensure_loaded()
+            return {
+                "epoch": self.epoch,
+                "seq": self._seq,
+                "orders": [dict(order, called=order_id in self._called) for order_id, order in self._orders.items()],
+            }
+
+    def since(self, epoch, last_seq):
+        """
+        last_seq より後の差分を返す。
+        起動が別 (epoch が違う) か、差分が履歴から消えている場合はスナップショットを返す。
+        """
+        with self._lock:
+            self.ensure_loaded()
+            oldest = self._history[0]['seq'] if self._history else self._seq + 1
+            if epoch != self.epoch or last_seq is None or last_seq > self._seq or last_seq < oldest - 1:
+                return dict(self.snapshot(), snapshot=True)
+            return {
+                "epoch": self.epoch,
+                "seq": self._seq,
+                "snapshot": False,
+                "deltas": [delta for delta in self._history if delta['seq'] > last_seq],
+            }
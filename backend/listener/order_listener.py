@@ -27,12 +27,21 @@ def on_end_order(data):
     order_id = data.get('order_id')
     print(f"Received end order ID: {order_id}")
 
+# まとめて送られたイベント(サーバーで SocketConfig.BATCH_WINDOW を指定したとき)
+@sio.on('batch')
+def on_batch(data):
+    handlers = {'new_order': on_new_order, 'order_call': on_order_call, 'end_order': on_end_order}
+    for item in data['events']:
+        handler = handlers.get(item['event'])
+        if handler:
+            handler(item['data'])
+
 @sio.event
 def disconnect():
     print("サーバーから切断されました")
 
 try:
-    sio.connect(f"http://{SERVER_IP}:{PORT}") 
+    sio.connect(f"http://{SERVER_IP}:{PORT}", auth={"role": "listener"}, transports=["websocket"]) 
     print("サーバーに接続中...")
 except socketio.exceptions.ConnectionError as e:
     print(f"サーバーへの接続中にエラーが発生しました: {e}")
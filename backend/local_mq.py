@@ -0,0 +1,160 @@
+import json
+import logging
+import socket
+import socketserver
+import struct
+import threading
+import time
+from urllib.parse import urlparse
+
+import socketio
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("!I")
+
+
+def send_frame(sock, payload):
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(sock):
+    """長さ付きのフレームを1つ読む。接続が閉じられたら None を返す。"""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    return _recv_exact(sock, _HEADER.unpack(header)[0])
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class _BrokerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        broker = self.server
+        with broker.clients_lock:
+            broker.clients.add(self.request)
+        try:
+            while True:
+                payload = recv_frame(self.request)
+                if payload is None:
+                    break
+                broker.publish(payload)
+        except OSError:
+            pass
+        finally:
+            with broker.clients_lock:
+                broker.clients.discard(self.request)
+
+
+class LocalBroker(socketserver.ThreadingTCPServer):
+    """
+    同じマシン上のワーカー間でメッセージを中継する最小限のブローカー。
+    受け取ったフレームを、送信元も含めた全接続にそのまま送る。
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _BrokerHandler)
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"local://{host}:{port}"
+
+    def publish(self, payload):
+        with self.clients_lock:
+            clients = list(self.clients)
+        with self._send_lock:
+            for client in clients:
+                try:
+                    send_frame(client, payload)
+                except OSError:
+                    with self.clients_lock:
+                        self.clients.discard(client)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="local-mq-broker", daemon=True).start()
+        return self
+
+
+class LocalSocketManager(socketio.PubSubManager):
+    """
+    LocalBroker を使う Socket.IO のクライアントマネージャー。
+    Redis などを用意できない環境や動作確認用に、local://host:port で指定する。
+    """
+
+    name = "local"
+
+    def __init__(self, url="local://127.0.0.1:5200", channel="socketio", write_only=False, logger=None,
+                 reconnect_wait=1.0):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or "127.0.0.1", parsed.port or 5200)
+        self.reconnect_wait = reconnect_wait
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _connect(self):
+        return socket.create_connection(self.address)
+
+    def _publish(self, data):
+        payload = json.dumps(data).encode("utf-8")
+        with self._publish_lock:
+            # 送信に失敗したら一度だけ接続し直して再送する
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = self._connect()
+                    send_frame(self._publisher, payload)
+                    return
+                except OSError as e:
+                    logger.warning("Message queue publish failed: %s", e)
+                    if self._publisher is not None:
+                        self._publisher.close()
+                    self._publisher = None
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        while True:
+            try:
+                sock = self._connect()
+            except OSError as e:
+                logger.warning("Message queue connect failed: %s", e)
+                time.sleep(self.reconnect_wait)
+                continue
+            try:
+                while True:
+                    payload = recv_frame(sock)
+                    if payload is None:
+                        break
+                    yield json.loads(payload)
+            except OSError as e:
+                logger.warning("Message queue connection lost: %s", e)
+            finally:
+                sock.close()
+            time.sleep(self.reconnect_wait)
+
+
+def create_client_manager(url, channel="flask-socketio"):
+    """
+    メッセージキューのURLからクライアントマネージャーを作る。
+    local:// 以外 (redis:// など) は Flask-SocketIO に任せるので None を返す。
+    """
+    if url and url.startswith("local://"):
+        return LocalSocketManager(url, channel=channel)
+    return None
@@ -0,0 +1,130 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 既定のバケット (秒)。DBクエリの数ミリ秒から印刷・音声合成の数秒までを想定する
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    ラベルごとの観測値の分布。observe() はバケットの位置を探して加算するだけにしている。
+    ロックは取らないので、OSスレッド (tpool) から同時に記録すると稀に取りこぼすことがある。
+    """
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # ラベルの値 -> [バケットごとの件数 (+Inf を含む), 合計, 件数]
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Gauge:
+    """取得時に func を呼んで現在値を返す。func は {ラベルの値のタプル: 値} か数値を返す。"""
+
+    def __init__(self, name, documentation, func, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.labels = tuple(labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        values = self.func()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        # モジュールの再読み込みなどで同じ名前が登録された場合は既存のものを返す
+        return self._metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, func, labels=()):
+        return self._register(Gauge(name, documentation, func, labels))
+
+    def render(self):
+        """Prometheus のテキスト形式で返す。"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
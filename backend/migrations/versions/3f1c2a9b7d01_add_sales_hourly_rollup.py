@@ -0,0 +1,35 @@
+"""add sales_hourly rollup table
+
+Revision ID: 3f1c2a9b7d01
+Revises: 
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d01'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 最初のリビジョンなので、create_all (init_db.py・start.py) で作成済みのDBでもそのまま適用できるようにする
+    if sa.inspect(op.get_bind()).has_table('sales_hourly'):
+        return
+    op.create_table(
+        'sales_hourly',
+        sa.Column('hour', sa.DateTime(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Integer(), nullable=False),
+        sa.Column('order_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('hour', 'product_id')
+    )
+
+
+def downgrade():
+    op.drop_table('sales_hourly')
@@ -0,0 +1,37 @@
+"""add indexes for hot query paths
+
+Revision ID: b7e4d2c91a3f
+Revises: 3f1c2a9b7d01
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4d2c91a3f'
+down_revision = '3f1c2a9b7d01'
+branch_labels = None
+depends_on = None
+
+
+def _has_product_id_index():
+    # MySQL (InnoDB) は外部キーの列に自動でインデックスを作るので、既にあれば重複して作らない
+    indexes = inspect(op.get_bind()).get_indexes('order_product')
+    return any(index['column_names'][:1] == ['product_id'] for index in indexes)
+
+
+def upgrade():
+    op.create_index('ix_orders_is_completed_order_id', 'orders', ['is_completed', 'order_id'], unique=False)
+    op.create_index('ix_orders_created_at', 'orders', ['created_at'], unique=False)
+    if not _has_product_id_index():
+        op.create_index('ix_order_product_product_id', 'order_product', ['product_id'], unique=False)
+
+
+def downgrade():
+    indexes = inspect(op.get_bind()).get_indexes('order_product')
+    if any(index['name'] == 'ix_order_product_product_id' for index in indexes):
+        op.drop_index('ix_order_product_product_id', table_name='order_product')
+    op.drop_index('ix_orders_created_at', table_name='orders')
+    op.drop_index('ix_orders_is_completed_order_id', table_name='orders')
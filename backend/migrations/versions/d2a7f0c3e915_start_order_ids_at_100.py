@@ -0,0 +1,50 @@
+"""start order ids at 100 on databases created before the table option
+
+Revision ID: d2a7f0c3e915
+Revises: b7e4d2c91a3f
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7f0c3e915'
+down_revision = 'b7e4d2c91a3f'
+branch_labels = None
+depends_on = None
+
+# models.ORDER_ID_START と同じ値
+ORDER_ID_START = 100
+
+
+def upgrade():
+    # create_all で作ったテーブルには開始番号が設定されているが、それ以前 (init_db) に作ったテーブルにはない。
+    # 既に開始番号以上の注文がある場合は何もしない
+    bind = op.get_bind()
+    last = bind.execute(sa.text("SELECT COALESCE(MAX(order_id), 0) FROM orders")).scalar()
+    if last >= ORDER_ID_START - 1:
+        return
+    if bind.dialect.name == 'mysql':
+        op.execute(f"ALTER TABLE orders AUTO_INCREMENT={ORDER_ID_START}")
+    elif bind.dialect.name == 'sqlite':
+        # sqlite_sequence は AUTOINCREMENT のテーブルがあるときだけ存在する
+        # (SQLite のDBは start.py の create_all で AUTOINCREMENT 付きで作成される)
+        autoincrement = bind.execute(sa.text(
+            "SELECT sql LIKE '%AUTOINCREMENT%' FROM sqlite_master WHERE type = 'table' AND name = 'orders'"
+        )).scalar()
+        if not autoincrement:
+            return
+        seeded = bind.execute(sa.text(
+            "UPDATE sqlite_sequence SET seq = :seq WHERE name = 'orders'"
+        ), {"seq": ORDER_ID_START - 1}).rowcount
+        if not seeded:
+            bind.execute(sa.text(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES ('orders', :seq)"
+            ), {"seq": ORDER_ID_START - 1})
+
+
+def downgrade():
+    # 開始番号は戻さない (採番済みの番号と重なるため)
+    pass
@@ -1,8 +1,14 @@
 from datetime import datetime
 import pytz
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+import storage  # SQLite の接続時の設定 (PRAGMA) を登録する
 
-db = SQLAlchemy()
+# セッションはリクエスト (アプリケーションコンテキスト) ごとに Flask-SQLAlchemy が作成・破棄する
+db = SQLAlchemy(session_options={"autoflush": False})
+
+# 注文番号は100番から始める
+ORDER_ID_START = 100
 
 class Product(db.Model):
     __tablename__ = 'products'
@@ -16,6 +22,17 @@ class Product(db.Model):
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # 厨房画面の未完了注文の取得 (is_completed で絞り込み order_id 順)
+        db.Index('ix_orders_is_completed_order_id', 'is_completed', 'order_id'),
+        # 注文履歴・集計の期間指定
+        db.Index('ix_orders_created_at', 'created_at'),
+        # 開始番号はテーブル作成時に設定する (MySQL: AUTO_INCREMENT, SQLite: sqlite_sequence)
+        {
+            'mysql_auto_increment': str(ORDER_ID_START),
+            'sqlite_autoincrement': True,
+        },
+    )
 
     order_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     created_at = db.Column(db.DateTime, default=datetime.now(pytz.timezone('Asia/Tokyo')))
@@ -24,15 +41,35 @@ class Order(db.Model):
     note = db.Column(db.String(100), nullable=True)
     is_completed = db.Column(db.Boolean, default=False)
 
-    def __init__(self, **kwargs):
-        super(Order, self).__init__(**kwargs)
-        if Order.query.count() == 0:
-            self.order_id = 100
+    # 注文明細 (OrderProduct) へのリレーション
+    order_products = db.relationship('OrderProduct', back_populates='order', lazy='select')
 
 class OrderProduct(db.Model):
     __tablename__ = 'order_product'
+    __table_args__ = (
+        # 商品別の集計 (products との JOIN)
+        db.Index('ix_order_product_product_id', 'product_id'),
+    )
 
     order_id = db.Column(db.Integer, db.ForeignKey('orders.order_id'), primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.product_id'), primary_key=True)
     quantity = db.Column(db.Integer, nullable=False)
     unit_price = db.Column(db.Integer, nullable=False)
+
+    order = db.relationship('Order', back_populates='order_products')
+    product = db.relationship('Product', lazy='select')
+
+class SalesHourly(db.Model):
+    """時間帯 × 商品ごとの売上集計 (注文確定時に加算する)"""
+    __tablename__ = 'sales_hourly'
+
+    hour = db.Column(db.DateTime, primary_key=True)  # 時間帯の開始時刻 (現地時刻)
+    product_id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Integer, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+event.listen(
+    Order.__table__, 'after_create',
+    DDL(f"INSERT INTO sqlite_sequence (name, seq) VALUES ('orders', {ORDER_ID_START - 1})").execute_if(dialect='sqlite')
+)
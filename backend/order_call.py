@@ -1,19 +1,34 @@
 import requests
 import json
-import pyaudio
 import wave
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
 from config import VVConfig as config
-from pydub import AudioSegment
+from metrics import registry
 import io
 from pathlib import Path
 
 __assets = Path(__file__).parent/"assets"
 WAV_PATH = str(__assets/"call.wav")
+CACHE_DIR = Path(__file__).parent/"cache"/"voice"
+
+logger = logging.getLogger(__name__)
+
+VOICEVOX_SECONDS = registry.histogram(
+    "pos_voicevox_seconds", "Time spent in VOICEVOX requests.", labels=("stage",))
 
 def load_and_convert_wav(file_path, target_rate):
     """
     WAVファイルを指定されたサンプルレートに変換して返す関数。
     """
+    # pydub は読み込みに時間がかかるので、最初に音声を扱うときに読み込む
+    from pydub import AudioSegment
+
     # WAVファイルを読み込み、pydubのAudioSegment形式に変換
     audio = AudioSegment.from_wav(file_path)
 
@@ -35,53 +50,179 @@ def load_and_convert_wav(file_path, target_rate):
 
     return audio, channels, sampwidth, framerate  # AudioSegmentオブジェクトを返す
 
-def vvox_test(text):
+class CallAudioCache:
     """
-    合成音声とcall.wavを結合して再生する。
+    呼び出し音声 (call.wav + 合成音声) のキャッシュ。
+    (テキスト, 話者, エンジンのバージョン) をキーに、メモリとディスクの両方にLRUで保持する。
     """
 
-    params = (
-        ('text', text),
-        ('speaker', 3),  # 3:ずんだもん
-    )
-
-    # 音声合成用のクエリを作成
-    query = requests.post(
-        f'http://{config.HOST}:{config.PORT}/audio_query',
-        params=params
-    )
-
-    # 音声合成を実施
-    synthesis = requests.post(
-        f'http://{config.HOST}:{config.PORT}/synthesis',
-        headers={"Content-Type": "application/json"},
-        params=params,
-        data=json.dumps(query.json())
-    )
-
-    # 合成音声をバイナリ形式で取得
-    voice = synthesis.content
-
-    # 合成音声をWAV形式に変換（pydubで処理しやすくする）
-    voice_audio = AudioSegment.from_file(io.BytesIO(voice), format="wav")
-    target_rate = voice_audio.frame_rate  # 合成音声のサンプルレート
-
-    # call.wavを読み込み、合成音声と同じサンプルレートに変換
-    call_audio, channels, sampwidth, framerate = load_and_convert_wav(WAV_PATH, target_rate)
-
-    # call.wavの音量を70%に調整 (-3.1 dBで約70%の音量)
-    call_audio = call_audio - 3.1
-
-    # call.wavと合成音声を結合
-    combined_audio = call_audio + voice_audio
-
-    # 結合された音声をWAVバイトデータに変換
-    combined_data = io.BytesIO()
-    combined_audio.export(combined_data, format="wav")
-    combined_data.seek(0)
-
-    # 再生処理
-    wf = wave.open(combined_data, 'rb')
+    def __init__(self, cache_dir=CACHE_DIR, speaker=config.SPEAKER,
+                 memory_size=config.MEMORY_CACHE_SIZE, disk_size=config.DISK_CACHE_SIZE, executor=None):
+        self.cache_dir = Path(cache_dir)
+        self.speaker = speaker
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        # 音声の変換・結合 (pydub) とディスクキャッシュの読み書きの実行方法 (eventlet 環境では tpool.execute を渡す)
+        # VOICEVOX への問い合わせとロックは呼び出し側のスレッドで行い、ここで渡す処理の中ではロックを取らない
+        self.executor = executor or (lambda func, *args, **kwargs: func(*args, **kwargs))
+        self._memory = OrderedDict()
+        self._chimes = {}  # サンプルレートごとに変換済みの call.wav
+        self._engine_version = None
+        self._version_retry_at = 0.0  # バージョンを取得できなかったとき、この時刻までは問い合わせない
+        self._lock = threading.Lock()
+        self._warmup_queue = queue.Queue()
+        self._warmup_worker = None
+
+    @property
+    def base_url(self):
+        return f'http://{config.HOST}:{config.PORT}'
+
+    def engine_version(self):
+        """
+        エンジンのバージョンを返す。取得できない場合は None。
+        エンジンが止まっている間に呼び出しのたびに待たないよう、失敗したら VERSION_RETRY_INTERVAL 秒は問い合わせない。
+        """
+        if self._engine_version is None and time.monotonic() >= self._version_retry_at:
+            try:
+                response = requests.get(f'{self.base_url}/version', timeout=config.VERSION_TIMEOUT)
+                response.raise_for_status()
+                self._engine_version = response.text.strip('"')
+            except requests.RequestException as e:
+                logger.warning("Could not get VOICEVOX version: %s", e)
+                self._version_retry_at = time.monotonic() + config.VERSION_RETRY_INTERVAL
+        return self._engine_version
+
+    def _key(self, text, version):
+        # エンジンが更新されたら別の音声になるので、バージョンもキーに含める
+        raw = f"{version}\0{self.speaker}\0{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _chime(self, frame_rate):
+        # call.wav のデコード・リサンプル・音量調整はサンプルレートごとに一度だけ行う
+        chime = self._chimes.get(frame_rate)
+        if chime is None:
+            chime, _, _, _ = load_and_convert_wav(WAV_PATH, frame_rate)
+            # call.wavの音量を70%に調整 (-3.1 dBで約70%の音量)
+            chime = chime - 3.1
+            self._chimes[frame_rate] = chime
+        return chime
+
+    def _synthesize(self, text):
+        """合成音声とcall.wavを結合したWAVデータを作成する。"""
+        params = (
+            ('text', text),
+            ('speaker', self.speaker),
+        )
+
+        # 音声合成用のクエリを作成
+        with VOICEVOX_SECONDS.time("audio_query"):
+            query = requests.post(f'{self.base_url}/audio_query', params=params, timeout=config.QUERY_TIMEOUT)
+            query.raise_for_status()
+
+        # 音声合成を実施
+        with VOICEVOX_SECONDS.time("synthesis"):
+            synthesis = requests.post(
+                f'{self.base_url}/synthesis',
+                headers={"Content-Type": "application/json"},
+                params=params,
+                data=json.dumps(query.json()),
+                timeout=config.SYNTHESIS_TIMEOUT
+            )
+            synthesis.raise_for_status()
+
+        return self.executor(self._combine, synthesis.content)
+
+    def _combine(self, voice_wav):
+        # 合成音声をWAV形式に変換（pydubで処理しやすくする）
+        from pydub import AudioSegment
+        voice_audio = AudioSegment.from_file(io.BytesIO(voice_wav), format="wav")
+
+        # call.wavと合成音声を結合
+        combined_audio = self._chime(voice_audio.frame_rate) + voice_audio
+
+        combined_data = io.BytesIO()
+        combined_audio.export(combined_data, format="wav")
+        return combined_data.getvalue()
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _read_disk(self, key):
+        path = self.cache_dir/f"{key}.wav"
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # 最終利用時刻を更新してLRUの順序に反映する
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_dir/f"{key}.tmp"
+            tmp_path.write_bytes(data)
+            tmp_path.replace(self.cache_dir/f"{key}.wav")
+
+            files = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".wav")]
+            if len(files) > self.disk_size:
+                files.sort(key=lambda entry: entry.stat().st_mtime)
+                for entry in files[:len(files) - self.disk_size]:
+                    os.remove(entry.path)
+        except OSError as e:
+            logger.warning("Could not write voice cache: %s", e)
+
+    def get(self, text):
+        """
+        呼び出し音声のWAVデータを返す。キャッシュになければ合成する。
+        エンジンのバージョンが分からない場合は、どのバージョンの音声か分からないのでキャッシュしない。
+        """
+        version = self.engine_version()
+        if version is None:
+            return self._synthesize(text)
+        key = self._key(text, version)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+
+        data = self.executor(self._read_disk, key)
+        if data is None:
+            data = self._synthesize(text)
+            self.executor(self._write_disk, key, data)
+        self._remember(key, data)
+        return data
+
+    def warmup(self, texts):
+        """バックグラウンドで音声を先に合成しておく。"""
+        if self._warmup_worker is None:
+            self._warmup_worker = threading.Thread(target=self._run_warmup, name="voice-warmup", daemon=True)
+            self._warmup_worker.start()
+        for text in texts:
+            self._warmup_queue.put(text)
+
+    def _run_warmup(self):
+        while True:
+            text = self._warmup_queue.get()
+            try:
+                self.get(text)
+            except Exception as e:
+                logger.warning("Voice warmup failed for %r: %s", text, e)
+
+call_cache = CallAudioCache()
+
+def call_text(order_id):
+    """呼び出し用のテキストを返す。"""
+    return config.CALL_TEXT.format(order_id=order_id)
+
+def play_wav(wav_bytes):
+    """WAVデータを再生する。"""
+    import pyaudio
+    wf = wave.open(io.BytesIO(wav_bytes), 'rb')
     pya = pyaudio.PyAudio()
     stream = pya.open(format=pya.get_format_from_width(wf.getsampwidth()),
                       channels=wf.getnchannels(),
@@ -98,3 +239,9 @@ def vvox_test(text):
     stream.stop_stream()
     stream.close()
     pya.terminate()
+
+def vvox_test(text):
+    """
+    合成音声とcall.wavを結合して再生する。
+    """
+    play_wav(call_cache.get(text))
@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+from itertools import groupby
+
+from models import Order, OrderProduct, Product
+
+# CSV は明細1行ごとに1行 (注文の列は明細ごとに繰り返す。明細のない注文は商品の列を空にする)
+CSV_COLUMNS = ("order_id", "created_at", "is_completed", "note", "total_quantity", "total_amount",
+               "product_id", "product_name", "quantity", "unit_price", "line_total")
+
+
+def export_rows(session, filters=(), batch_size=1000):
+    """
+    注文と明細を order_id 順に1行ずつ返す。
+    エンティティではなく列だけを読み、yield_per でサーバー側カーソルから少しずつ取り出すので、
+    注文の数によらずメモリ使用量は一定になる。
+    """
+    return (
+        session.query(Order.order_id, Order.created_at, Order.is_completed, Order.note,
+                      Order.total_quantity, Order.total_amount,
+                      OrderProduct.product_id, Product.name.label('product_name'),
+                      OrderProduct.quantity, OrderProduct.unit_price)
+        .outerjoin(OrderProduct, Order.order_id == OrderProduct.order_id)
+        .outerjoin(Product, Product.product_id == OrderProduct.product_id)
+        .filter(*filters)
+        .order_by(Order.order_id, OrderProduct.product_id)
+        .yield_per(batch_size)
+    )
+
+
+def _created_at(row):
+    return row.created_at.isoformat() if row.created_at else None
+
+
+def iter_csv(rows, chunk_size=500):
+    """CSV を chunk_size 行ずつの文字列で返す。Excel で文字化けしないよう先頭に BOM を付ける。"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(CSV_COLUMNS)
+    for count, row in enumerate(rows, 1):
+        has_item = row.product_id is not None
+        writer.writerow((
+            row.order_id, _created_at(row), int(bool(row.is_completed)), row.note,
+            row.total_quantity, row.total_amount,
+            row.product_id, row.product_name,
+            row.quantity, row.unit_price,
+            row.quantity * row.unit_price if has_item else None,
+        ))
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows, chunk_size=500):
+    """注文1件を1行の JSON (明細は products に入れる) にして、chunk_size 件ずつの文字列で返す。"""
+    lines = []
+    for order_id, order_rows in groupby(rows, key=lambda row: row.order_id):
+        first = next(order_rows)
+        products = []
+        for row in (first, *order_rows):
+            if row.product_id is None:
+                continue
+            products.append({
+                "product_id": row.product_id,
+                "name": row.product_name,
+                "quantity": row.quantity,
+                "unit_price": row.unit_price,
+                "total_price": row.quantity * row.unit_price,
+            })
+        lines.append(json.dumps({
+            "order_id": order_id,
+            "created_at": _created_at(first),
+            "is_completed": bool(first.is_completed),
+            "note": first.note,
+            "total_quantity": first.total_quantity,
+            "total_amount": first.total_amount,
+            "products": products,
+        }, ensure_ascii=False))
+        if len(lines) >= chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
@@ -0,0 +1,299 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from file_lock import lock_file
+
+logger = logging.getLogger(__name__)
+
+# レコードの種類
+ORDER = "order"  # 確定した注文
+COMPLETE = "complete"  # 注文の完了 (呼び出し)
+CHECKPOINT = "checkpoint"  # 圧縮時に書く。それまでに割り当てた最後の注文番号を残す
+
+
+class JournalNotReady(Exception):
+    pass
+
+
+class JournalConflict(Exception):
+    pass
+
+
+def _dumps(record):
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class OrderJournal:
+    """
+    会計の追記専用ジャーナル (JSON Lines)。
+    会計はDBより先にここへ追記して fsync し、DBへの反映は JournalReplayer が後から行う。
+    注文番号もここで割り当てるので、DBに繋がらない間も会計を続けられる。
+    DBに反映したレコードは、未反映のものがなくなった時点でファイルから取り除く (圧縮)。
+    DBに反映できないレコード (データの誤り) は reject() で別のファイル (*.rejected.jsonl) に移す。
+    """
+
+    def __init__(self, path, last_order_id_loader, fsync=True, compact_every=200, executor=None):
+        self.path = Path(path)
+        self.rejected_path = self.path.with_name(self.path.stem + ".rejected.jsonl")
+        self.last_order_id_loader = last_order_id_loader  # DB上の最大の注文番号を返す関数
+        self.fsync = fsync
+        self.compact_every = compact_every
+        # ファイルの書き込みと fsync の実行方法 (eventlet 環境では tpool.execute を渡してイベントループを止めない)
+        # 実行中はロックを取ったまま待つので、ここで渡す処理の中ではロックを取らない
+        self.executor = executor or (lambda func, *args, **kwargs: func(*args, **kwargs))
+        self._pending = deque()  # DBに未反映のレコード (追記順)
+        self._last_order_id = None
+        self._written = 0  # 前回の圧縮以降にファイルにあるレコード数
+        self._file = None
+        self._lock_file = None  # ほかのプロセスが同じファイルに追記・圧縮しないよう、使用中はロックしておく
+        self._lock = threading.Lock()
+        self._appended = threading.Event()
+
+    def open(self):
+        """
+        ファイルを読み込み、DBに未反映のレコードを復元して追記できるようにする。
+        ほかのプロセスが同じファイルを開いている場合は FileLocked を送出する。
+        """
+        with self._lock:
+            if self._file is not None:
+                return self
+            self._lock_file = lock_file(self.path)
+            valid_size = 0
+            if self.path.exists():
+                with open(self.path, "rb") as f:
+                    for line in f:
+                        try:
+                            if not line.endswith(b"\n"):
+                                raise ValueError("incomplete line")
+                            record = json.loads(line)
+                        except ValueError:
+                            # 書き込み途中で止まった末尾の行は捨てる (fsync 前なので会計は確定していない)
+                            logger.warning("Discarding a torn record at the end of %s", self.path)
+                            break
+                        valid_size += len(line)
+                        self._restore(record)
+                if valid_size < self.path.stat().st_size:
+                    os.truncate(self.path, valid_size)
+            self._file = open(self.path, "ab")
+            if self._pending:
+                logger.info("Recovered %d journal record(s) not yet written to the database.", len(self._pending))
+                self._appended.set()
+            return self
+
+    def _restore(self, record):
+        self._written += 1
+        if record["type"] == CHECKPOINT:
+            self._last_order_id = max(self._last_order_id or 0, record["last_order_id"])
+            return
+        if record["type"] == ORDER:
+            self._last_order_id = max(self._last_order_id or 0, record["order_id"])
+        self._pending.append(record)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def refresh_last_order_id(self):
+        """DB上の最大の注文番号を読み、それより小さい番号を割り当てないようにする。"""
+        last = self.last_order_id_loader()
+        with self._lock:
+            self._last_order_id = max(self._last_order_id or 0, last)
+
+    def _write_line(self, f, data):
+        f.write(data)
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def _write(self, record):
+        self.executor(self._write_line, self._file, _dumps(record))
+        self._written += 1
+        self._pending.append(record)
+        self._appended.set()
+
+    def append_order(self, **fields):
+        """
+        注文番号を割り当てて注文を追記し、レコードを返す。戻った時点でディスクに書き込まれている。
+        ファイルが空で一度もDBから注文番号を読めていない場合は、番号が重複しないよう JournalNotReady を送出する。
+        """
+        if self._last_order_id is None:
+            try:
+                self.refresh_last_order_id()
+            except Exception as e:
+                raise JournalNotReady(f"Could not determine the next order id: {e}") from e
+        with self._lock:
+            record = dict(fields, type=ORDER, order_id=self._last_order_id + 1)
+            self._write(record)
+            self._last_order_id = record["order_id"]
+            return record
+
+    def append_completion(self, order_id):
+        with self._lock:
+            self._write({"type": COMPLETE, "order_id": order_id})
+
+    def is_pending(self, order_id):
+        """DBに未反映の注文かどうか。"""
+        try:
+            order_id = int(order_id)
+        except (TypeError, ValueError):
+            return False
+        with self._lock:
+            return any(record["type"] == ORDER and record["order_id"] == order_id for record in self._pending)
+
+    def pending_orders(self, include_completed=False):
+        """DBに未反映の注文のレコードを返す。include_completed=False なら完了 (呼び出し) 済みのものを除く。"""
+        with self._lock:
+            completed = set() if include_completed else {
+                record["order_id"] for record in self._pending if record["type"] == COMPLETE}
+            return [record for record in self._pending
+                    if record["type"] == ORDER and record["order_id"] not in completed]
+
+    def pending_completions(self):
+        """DBに未反映の完了 (呼び出し) の注文番号を返す。"""
+        with self._lock:
+            return {record["order_id"] for record in self._pending if record["type"] == COMPLETE}
+
+    def pending(self):
+        return len(self._pending)
+
+    def peek(self):
+        with self._lock:
+            return self._pending[0] if self._pending else None
+
+    def wait(self, timeout):
+        """レコードが追記されるまで待つ。"""
+        self._appended.wait(timeout)
+        self._appended.clear()
+
+    def wake(self):
+        self._appended.set()
+
+    def applied(self, record):
+        """peek() で取り出したレコードをDBに反映したら呼ぶ。"""
+        with self._lock:
+            if self._pending and self._pending[0] is record:
+                self._pending.popleft()
+            if not self._pending and self._written >= self.compact_every:
+                self.executor(self._compact, self._last_order_id)
+                self._written = 1
+
+    def reject(self, record, error):
+        """
+        DBに反映できないレコードを *.rejected.jsonl に書き出して取り除く。
+        後から確認して手で直せるよう、エラーの内容も残す。
+        """
+        with self._lock:
+            self.executor(self._append_rejected, _dumps({"error": str(error), "record": record}))
+        self.applied(record)
+
+    def _append_rejected(self, data):
+        with open(self.rejected_path, "ab") as f:
+            self._write_line(f, data)
+
+    def _compact(self, last_order_id):
+        # 未反映のレコードがないので、最後の注文番号だけを残したファイルに置き換える
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(_dumps({"type": CHECKPOINT, "last_order_id": last_order_id}))
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "ab")
+
+
+class JournalReplayer:
+    """
+    ジャーナルの未反映レコードを追記順に1件ずつDBへ反映する。
+    apply は同じレコードを何度呼んでも結果が変わらないようにする (反映後・applied() 前に止まることがあるため)。
+    is_transient(例外) が True の失敗 (DBに繋がらない) は間隔を倍にしながら再試行し、
+    それ以外の失敗 (データの誤り) は再試行しても直らないので reject() して次のレコードに進む。
+    on_recover はDBに繋がらない状態から戻ったときに呼ぶ。
+    """
+
+    def __init__(self, journal, apply, retry_interval=1.0, max_retry_interval=30.0,
+                 is_transient=None, on_recover=None):
+        self.journal = journal
+        self.apply = apply
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.is_transient = is_transient or (lambda error: True)
+        self.on_recover = on_recover
+        self.degraded = False  # DBに反映できずに再試行している間 True
+        self.rejected = 0  # reject() したレコードの数
+        self._stopping = False
+        self._worker = None
+
+    def start(self):
+        if self._worker is None:
+            self._stopping = False
+            self._worker = threading.Thread(target=self._run, name="journal-replayer", daemon=True)
+            self._worker.start()
+        return self
+
+    def stop(self, timeout=None):
+        if self._worker is not None:
+            self._stopping = True
+            self.journal.wake()
+            self._worker.join(timeout)
+            self._worker = None
+
+    def _retry(self, interval, error):
+        if not self.degraded:
+            self.degraded = True
+            logger.warning("Database unavailable, keeping checkouts in the journal: %s", error)
+        time.sleep(interval)
+        return min(interval * 2, self.max_retry_interval)
+
+    def _recovered(self):
+        if not self.degraded:
+            return
+        self.degraded = False
+        logger.info("Database is back, replaying the journal.")
+        if self.on_recover:
+            try:
+                self.on_recover()
+            except Exception as e:
+                logger.error("Error handling database recovery: %s", e)
+
+    def _run(self):
+        interval = self.retry_interval
+        # ファイルから復元した番号がDBより古い場合に備えて、先にDB上の最大の番号を読んでおく
+        while not self._stopping:
+            try:
+                self.journal.refresh_last_order_id()
+                break
+            except Exception as e:
+                interval = self._retry(interval, e)
+        self._recovered()
+
+        interval = self.retry_interval
+        while not self._stopping:
+            record = self.journal.peek()
+            if record is None:
+                self.journal.wait(1.0)
+                continue
+            try:
+                self.apply(record)
+            except Exception as e:
+                if self.is_transient(e):
+                    interval = self._retry(interval, e)
+                    continue
+                logger.error("Journal record %s for order %s could not be written to the database and was "
+                             "moved to %s: %s", record["type"], record["order_id"], self.journal.rejected_path, e)
+                self.rejected += 1
+                self.journal.reject(record, e)
+            else:
+                self.journal.applied(record)
+            self._recovered()
+            interval = self.retry_interval
@@ -0,0 +1,106 @@
+import secrets
+import threading
+import time
+
+# 会計処理中であることを示す値
+IN_PROGRESS = "__in_progress__"
+
+
+class MemoryBackend:
+    """
+    有効期限付きのキー・バリューストア (プロセス内)。
+    別の保存先を使う場合は get / set / add / delete を同じ意味で実装する。
+    """
+
+    def __init__(self, purge_interval=60.0):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._purge_interval = purge_interval
+        self._last_purge = time.monotonic()
+
+    def _purge(self, now):
+        # 期限切れのキーは一定間隔でまとめて削除する
+        if now - self._last_purge < self._purge_interval:
+            return
+        self._last_purge = now
+        for key in [key for key, (_, expires) in self._data.items() if expires <= now]:
+            del self._data[key]
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            item = self._data.get(key)
+            if item is None or item[1] <= now:
+                return None
+            return item[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+
+    def add(self, key, value, ttl):
+        """キーが存在しない場合だけ保存する。保存できたらTrueを返す。"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] > now:
+                return False
+            self._data[key] = (value, now + ttl)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class DraftOrderStore:
+    """
+    会計前の注文 (カート) をサーバー側に保持する。
+    クライアントには短いトークンだけを渡すので、クッキーの大きさはカートの中身によらない。
+    会計結果は冪等キーごとに保存し、同じキーでの再送には最初の結果を返す。
+    """
+
+    def __init__(self, backend=None, draft_ttl=1800, result_ttl=3600):
+        self.backend = backend or MemoryBackend()
+        self.draft_ttl = draft_ttl
+        self.result_ttl = result_ttl
+
+    def save(self, data, token=None):
+        """注文を保存してトークンを返す。token を渡すとその注文を上書きする。"""
+        token = token or secrets.token_urlsafe(8)
+        self.backend.set(f"draft:{token}", data, self.draft_ttl)
+        return token
+
+    def get(self, token):
+        if not token:
+            return None
+        return self.backend.get(f"draft:{token}")
+
+    def delete(self, token):
+        if token:
+            self.backend.delete(f"draft:{token}")
+
+    def begin_checkout(self, key):
+        """
+        冪等キーで会計を開始する。
+        (True, None): 新しい会計として処理してよい
+        (False, None): 同じキーの会計が処理中
+        (False, result): 同じキーの会計が完了済み
+        """
+        if self.backend.add(f"checkout:{key}", IN_PROGRESS, self.result_ttl):
+            return True, None
+        result = self.backend.get(f"checkout:{key}")
+        if result == IN_PROGRESS:
+            return False, None
+        if result is None:
+            # 期限切れと競合した場合はもう一度確保を試みる
+            return self.begin_checkout(key)
+        return False, result
+
+    def finish_checkout(self, key, result):
+        self.backend.set(f"checkout:{key}", result, self.result_ttl)
+
+    def abort_checkout(self, key):
+        # 失敗した会計はキーを解放して再試行できるようにする
+        self.backend.delete(f"checkout:{key}")
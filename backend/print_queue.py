@@ -0,0 +1,266 @@
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from file_lock import lock_file
+
+logger = logging.getLogger(__name__)
+
+# ジョブの状態
+QUEUED = "queued"
+PRINTING = "printing"
+RETRYING = "retrying"
+DONE = "done"
+FAILED = "failed"
+
+
+def _encode(value):
+    # レシートの内容のうち日時 (order_date) だけは JSON にできないので印を付けて保存する
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _decode(obj):
+    if set(obj) == {"$datetime"}:
+        return datetime.fromisoformat(obj["$datetime"])
+    return obj
+
+
+def _dumps(record):
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=_encode) + "\n").encode("utf-8")
+
+
+class PrintJob:
+    def __init__(self, job_id, order_id, receipt):
+        self.job_id = job_id
+        self.order_id = order_id
+        self.receipt = receipt  # print_receipt に渡すキーワード引数
+        self.status = QUEUED
+        self.attempts = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "order_id": self.order_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class PrintQueue:
+    """
+    レシート印刷ジョブのキュー。
+    専用のワーカースレッドだけがプリンターを操作し、リクエスト側は enqueue して即座に戻る。
+    失敗したジョブは指数バックオフで max_retries 回まで再試行する。
+    path を指定すると、登録したジョブと終了をファイルに追記し、再起動後の start() で終わっていないジョブを印刷し直す。
+    (印刷中に止まったジョブはもう一度印刷されることがある)
+    同じファイルを2つのプロセスで使うと印刷が重複するので、start() でファイルをロックし、
+    既にロックされている場合は FileLocked を送出する。
+    """
+
+    def __init__(self, printer, max_retries=3, backoff=2.0, max_backoff=30.0,
+                 history_size=200, executor=None, on_update=None, path=None, fsync=True, compact_every=200):
+        self.printer = printer
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.history_size = history_size
+        # プリンター呼び出しの実行方法 (eventlet 環境では tpool.execute を渡す)
+        self.executor = executor or (lambda func, *args, **kwargs: func(*args, **kwargs))
+        self.on_update = on_update
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._worker = None
+        self.path = Path(path) if path else None
+        self.fsync = fsync
+        self.compact_every = compact_every
+        self._file = None
+        self._lock_file = None  # ほかのプロセスが同じファイルを使わないよう、使用中はロックしておく
+        self._file_lock = threading.Lock()
+        self._written = 0  # 前回の圧縮以降にファイルにあるレコード数
+        self._unfinished = 0  # ファイル上で終わっていないジョブの数
+
+    def start(self):
+        if self._worker is None:
+            if self.path is not None:
+                self._open()
+            self._worker = threading.Thread(target=self._run, name="print-worker", daemon=True)
+            self._worker.start()
+        return self
+
+    def stop(self, timeout=None):
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join(timeout)
+            self._worker = None
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def _open(self):
+        """ファイルから終わっていないジョブを読み込んでキューに戻し、ファイルをそれだけに書き直す。"""
+        self._lock_file = lock_file(self.path)
+        jobs = OrderedDict()
+        if self.path.exists():
+            with open(self.path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("incomplete line")
+                        record = json.loads(line, object_hook=_decode)
+                    except ValueError:
+                        # 書き込み途中で止まった末尾の行は捨てる
+                        logger.warning("Discarding a torn record at the end of %s", self.path)
+                        break
+                    if record["type"] == QUEUED:
+                        jobs[record["job_id"]] = record
+                    else:
+                        jobs.pop(record["job_id"], None)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._file_lock:
+            self._rewrite(jobs.values())
+        restored = [PrintJob(record["job_id"], record["order_id"], record["receipt"]) for record in jobs.values()]
+        if restored:
+            logger.info("Restored %d unfinished print job(s) from %s.", len(restored), self.path)
+            self._ids = itertools.count(max(job.job_id for job in restored) + 1)
+        for job in restored:
+            self._add(job)
+
+    def _rewrite(self, records):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        records = list(records)
+        with open(tmp_path, "wb") as f:
+            for record in records:
+                f.write(_dumps(record))
+            f.flush()
+            os.fsync(f.fileno())
+        if self._file is not None:
+            self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "ab")
+        self._written = self._unfinished = len(records)
+
+    def _append(self, record):
+        # tpool のOSスレッドで実行するので、ここではロックを取らない (呼び出し側で _file_lock を取る)
+        self._file.write(_dumps(record))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._written += 1
+        self._unfinished += 1 if record["type"] == QUEUED else -1
+        # 終わっていないジョブがなくなったらファイルを空にする
+        if not self._unfinished and self._written >= self.compact_every:
+            self._rewrite(())
+
+    def _persist(self, record):
+        with self._file_lock:
+            if self._file is not None:
+                # fsync でイベントループを止めないよう、プリンター呼び出しと同じ方法 (tpool) で書き込む
+                self.executor(self._append, record)
+
+    def enqueue(self, order_id, **receipt):
+        """
+        印刷ジョブを登録してジョブを返す。印刷の完了は待たない。
+        ファイルに保存する場合は、書き込んでから戻る。
+        """
+        job = PrintJob(next(self._ids), order_id, receipt)
+        try:
+            self._persist({"type": QUEUED, "job_id": job.job_id, "order_id": order_id, "receipt": receipt})
+        except Exception as e:
+            # 会計は確定しているので、保存できなくても印刷は登録する (再起動すると失われる)
+            logger.error("Error saving print job %s (order %s): %s", job.job_id, order_id, e)
+        self._add(job)
+        return job
+
+    def _add(self, job):
+        with self._lock:
+            self._jobs[job.job_id] = job
+            # 古いジョブから履歴を破棄する (待機中・印刷中のものは残す)
+            while len(self._jobs) > self.history_size:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.status not in (DONE, FAILED):
+                    break
+                self._jobs.popitem(last=False)
+        self._queue.put(job)
+        self._notify(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def jobs(self):
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _notify(self, job):
+        if self.on_update:
+            try:
+                self.on_update(job.to_dict())
+            except Exception as e:
+                logger.error("Error notifying print job update: %s", e)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            self._process(job)
+
+    def _process(self, job):
+        while True:
+            job.attempts += 1
+            job.status = PRINTING
+            self._notify(job)
+            try:
+                self.executor(self.printer.print_receipt, order_id=job.order_id, **job.receipt)
+            except Exception as e:
+                job.error = str(e)
+                logger.error("Print job %s (order %s) failed on attempt %d: %s",
+                             job.job_id, job.order_id, job.attempts, e)
+                if job.attempts > self.max_retries:
+                    job.status = FAILED
+                    job.finished_at = time.time()
+                    self._finish(job)
+                    return
+                job.status = RETRYING
+                self._notify(job)
+                time.sleep(min(self.backoff * 2 ** (job.attempts - 1), self.max_backoff))
+                continue
+            job.status = DONE
+            job.error = None
+            job.finished_at = time.time()
+            self._finish(job)
+            return
+
+    def _finish(self, job):
+        try:
+            self._persist({"type": job.status, "job_id": job.job_id})
+        except Exception as e:
+            # 記録できなくても、再起動後にもう一度印刷されるだけなので処理は続ける
+            logger.error("Error recording print job %s as %s: %s", job.job_id, job.status, e)
+        self._notify(job)
+
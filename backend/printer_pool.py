@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from csjwindowspossdk import ESCPOSConst, ESCPOSPrinter
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 印刷の段階ごとの所要時間 (connect: 接続, transfer: データ送信・印刷・カット)
+# トランザクションモードでは個々の命令はバッファに溜めるだけなので、送信 (TransactionPrint) の前は測らない
+PRINT_STAGE_SECONDS = registry.histogram(
+    "pos_print_stage_seconds", "Time spent in each stage of printing a receipt.", labels=("stage",))
+
+# この状態のときは印刷できないので接続を張り直す
+UNHEALTHY_STATUS = (ESCPOSConst.CMP_STS_PRINTEROFF
+                    | ESCPOSConst.CMP_STS_COVER_OPEN
+                    | ESCPOSConst.CMP_STS_PAPER_EMPTY)
+
+
+class PrinterConnectionError(Exception):
+    pass
+
+
+class PrinterConnection:
+    """
+    1台のプリンターへの接続をジョブをまたいで保持する。
+    接続は初回利用時に張り、一定時間使っていなければ利用前に PrinterCheck/Status で確認する。
+    """
+
+    def __init__(self, port_type, address, name=None, device_factory=ESCPOSPrinter,
+                 connect_attempts=3, connect_wait=5, health_interval=30.0):
+        self.port_type = port_type
+        self.address = address
+        self.name = name or address
+        self.device_factory = device_factory
+        self.connect_attempts = connect_attempts
+        self.connect_wait = connect_wait
+        self.health_interval = health_interval
+        self._device = None
+        self._connected = False
+        self.connect_count = 0  # 接続に成功した回数 (張り直したかどうかの判定に使う)
+        self._last_used = 0.0
+        self._lock = threading.RLock()
+
+    @property
+    def connected(self):
+        return self._connected
+
+    def _connect(self):
+        if self._device is None:
+            # ESCPOSPrinter() は DLL の読み込みを伴うので一度だけ生成する
+            self._device = self.device_factory()
+        for attempt in range(self.connect_attempts):
+            with PRINT_STAGE_SECONDS.time("connect"):
+                result = self._device.Connect(self.port_type, self.address)
+            if result == ESCPOSConst.CMP_SUCCESS:
+                self._connected = True
+                self.connect_count += 1
+                self._last_used = time.monotonic()
+                logger.info("Printer %s connected.", self.name)
+                return
+            self._device.Disconnect()
+            if attempt < self.connect_attempts - 1:
+                time.sleep(self.connect_wait)
+        raise PrinterConnectionError(
+            f"Failed to connect to printer {self.name} after {self.connect_attempts} attempts")
+
+    def check(self):
+        """接続中のプリンターが印刷可能か確認する。"""
+        if not self._connected:
+            return False
+        try:
+            if self._device.PrinterCheck() != ESCPOSConst.CMP_SUCCESS:
+                return False
+            return not (self._device.Status() & UNHEALTHY_STATUS)
+        except Exception as e:
+            logger.warning("Health check for printer %s failed: %s", self.name, e)
+            return False
+
+    def invalidate(self):
+        """接続を切り、次回利用時に再接続させる。"""
+        with self._lock:
+            if self._device is not None and self._connected:
+                try:
+                    self._device.Disconnect()
+                except Exception as e:
+                    logger.warning("Error disconnecting printer %s: %s", self.name, e)
+            self._connected = False
+
+    @contextmanager
+    def acquire(self):
+        """
+        接続済みのデバイスを貸し出す。
+        ブロック内で例外が起きた場合は接続が壊れたとみなして切断する。
+        """
+        with self._lock:
+            if self._connected and time.monotonic() - self._last_used > self.health_interval:
+                if not self.check():
+                    logger.info("Printer %s failed health check, reconnecting.", self.name)
+                    self.invalidate()
+            if not self._connected:
+                self._connect()
+            try:
+                yield self._device
+            except Exception:
+                self.invalidate()
+                raise
+            finally:
+                self._last_used = time.monotonic()
+
+    def close(self):
+        self.invalidate()
+
+
+class PrinterPool:
+    """
+    名前付きで複数台のプリンター接続を管理する (例: counter, kitchen)。
+    printers は {名前: (接続種別, アドレス)} の辞書。
+    """
+
+    def __init__(self, printers, **connection_options):
+        self._connections = {
+            name: PrinterConnection(port_type, address, name=name, **connection_options)
+            for name, (port_type, address) in printers.items()
+        }
+
+    def get(self, name):
+        try:
+            return self._connections[name]
+        except KeyError:
+            raise PrinterConnectionError(f"Unknown printer: {name}")
+
+    def names(self):
+        return list(self._connections)
+
+    def status(self):
+        return {name: conn.connected for name, conn in self._connections.items()}
+
+    def close_all(self):
+        for conn in self._connections.values():
+            conn.close()
+
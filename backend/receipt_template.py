@@ -0,0 +1,137 @@
+import hashlib
+import logging
+from pathlib import Path
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+__assets = Path(__file__).parent/"assets"
+BITMAP_PATH = str(__assets/"logoimg.bmp")
+CACHE_DIR = Path(__file__).parent/"cache"
+
+ENCODING = "shift_jis"
+
+# ESC/POS コマンド
+INIT = b'\x1B\x40'  # ESC @ (プリンタ初期化)
+SIZE_NORMAL = b'\x1D\x21\x00'
+SIZE_2HEIGHT = b'\x1D\x21\x10'
+SIZE_ORDER_ID = b'\x1D\x21\x56'
+UNDERLINE_ON = b'\x1B\x2D\x01'
+UNDERLINE_OFF = b'\x1B\x2D\x00'
+REVERSE_ON = b'\x1D\x42\x01'
+REVERSE_OFF = b'\x1D\x42\x00'
+CUT = b'\x1D\x56\x42\x2D'
+
+# 1ビット画像(1=白)を反転してプリンター用(1=黒)にする変換表
+_INVERT = bytes(255 - i for i in range(256))
+
+
+def build_logo_raster(image_path):
+    """
+    画像を1ビットモノクロに変換し、ラスタ形式 (GS v 0) のバッファを作成する。
+    ピクセル単位のループではなく PIL のビットパックをそのまま使う。
+    """
+    img = Image.open(image_path).convert('1')  # モノクロ変換 (1ビット)
+    width, height = img.size
+
+    # 横幅を8で割り切れるように調整
+    if width % 8 != 0:
+        width = (width + 7) // 8 * 8
+        img = img.resize((width, height))
+
+    # モード'1'の tobytes は1行ごとにMSBから詰めたビット列 (白=1) なので、反転すれば黒=1になる
+    bitmap_data = img.tobytes().translate(_INVERT)
+
+    # xL, xH, yL, yHを計算
+    xL = width // 8 % 256
+    xH = width // 8 // 256
+    yL = height % 256
+    yH = height // 256
+
+    return b'\x1D\x76\x30\x00' + bytes([xL, xH, yL, yH]) + bitmap_data
+
+
+def load_logo_raster(image_path=BITMAP_PATH, cache_dir=CACHE_DIR):
+    """
+    ロゴのラスタデータを返す。画像のハッシュをキーにディスクへキャッシュし、
+    画像が変わらない限り変換をやり直さない。
+    """
+    digest = hashlib.sha256(Path(image_path).read_bytes()).hexdigest()[:16]
+    cache_path = Path(cache_dir)/f"logo_{digest}.bin"
+    if cache_path.exists():
+        return cache_path.read_bytes()
+
+    raster = build_logo_raster(image_path)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp")
+        tmp_path.write_bytes(raster)
+        tmp_path.replace(cache_path)
+    except OSError as e:
+        logger.warning("Could not write logo cache %s: %s", cache_path, e)
+    return raster
+
+
+def _amount_width(value):
+    # 金額の表示幅 (4桁以上はコンマ1つ分を加える)
+    digits = len(str(value))
+    return digits if digits < 4 else digits + 1
+
+
+class ReceiptTemplate:
+    """
+    レシートのレイアウトを一度だけバイト列の断片にコンパイルしておき、
+    注文ごとには可変部分だけをエンコードして1つのバッファに結合する。
+    """
+
+    def __init__(self, shop_name="福桔祭店", logo=b''):
+        enc = lambda text: text.encode(ENCODING)
+        rule = UNDERLINE_ON + enc("                \n") + UNDERLINE_OFF
+
+        self._prefix = INIT + logo + SIZE_NORMAL + enc(f"{shop_name}    ")
+        self._header_end = enc("\n") + SIZE_2HEIGHT + rule
+        self._note_start = SIZE_NORMAL + enc("\n")
+        self._note_end = enc("\n") + SIZE_2HEIGHT
+        self._rule = rule
+        self._yen = enc("￥")
+        self._at = enc("@")
+        self._ko = enc("ｺ\n")
+        self._newline = enc("\n")
+        self._labels = [(enc("合計"), 9), (enc("お預り"), 7), (enc("おつり"), 7)]
+        self._order_id_start = SIZE_NORMAL + enc("\n          Thank you!") + SIZE_ORDER_ID + REVERSE_ON + enc("\n ")
+        self._suffix = enc(" \n") + REVERSE_OFF + CUT
+        self._spaces = [b' ' * n for n in range(17)]
+        self._names = {}
+
+    def _pad(self, n):
+        return self._spaces[n] if 0 <= n < len(self._spaces) else b' ' * max(n, 0)
+
+    def _name(self, name):
+        # 商品名は種類が限られるので、パディング込みでエンコード結果を使い回す
+        encoded = self._names.get(name)
+        if encoded is None:
+            encoded = (name + " " * (6 - len(name))).encode(ENCODING)
+            self._names[name] = encoded
+        return encoded
+
+    def _amount_line(self, width, value):
+        return self._pad(width - _amount_width(value)) + self._yen + f"{value:,}\n".encode("ascii")
+
+    def render(self, order_id, orderL, totalL, total, payment, note, menuL, order_date):
+        parts = [self._prefix, order_date.strftime("%Y/%m/%d %H:%M:%S").encode("ascii"), self._header_end]
+
+        for i in range(len(menuL)):
+            if orderL[i]['quantity'] > 0:
+                parts += (self._name(menuL[i]['name']), self._at,
+                          f"{menuL[i]['price']} {orderL[i]['quantity']}".encode("ascii"), self._ko,
+                          self._amount_line(13, totalL[i]))
+        if note:
+            parts += (self._note_start, note.encode(ENCODING), self._note_end)
+
+        parts.append(self._rule)
+        for (label, width), value in zip(self._labels, (total, payment, payment - total)):
+            parts += (label, self._amount_line(width, value))
+
+        parts += (self._order_id_start, str(order_id).encode("ascii"), self._suffix)
+        # join は全体の長さを先に求めて1回だけ確保する
+        return b''.join(parts)
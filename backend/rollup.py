@@ -0,0 +1,95 @@
+import logging
+from collections import defaultdict
+from models import Order, OrderProduct, SalesHourly
+
+logger = logging.getLogger(__name__)
+
+
+def hour_of(created_at):
+    """集計する時間帯 (タイムゾーンを外して時以下を切り捨てた時刻) を返す。"""
+    return created_at.replace(tzinfo=None, minute=0, second=0, microsecond=0)
+
+
+def aggregate(lines):
+    """(created_at, product_id, quantity, unit_price) の並びを時間帯 × 商品ごとにまとめる。"""
+    rows = defaultdict(lambda: {"quantity": 0, "revenue": 0, "order_count": 0})
+    for created_at, product_id, quantity, unit_price in lines:
+        row = rows[(hour_of(created_at), product_id)]
+        row["quantity"] += quantity
+        row["revenue"] += quantity * unit_price
+        row["order_count"] += 1  # 明細は注文内で商品ごとに1行なので、行数が注文数になる
+    return [dict(row, hour=hour, product_id=product_id) for (hour, product_id), row in rows.items()]
+
+
+def upsert(session, rows):
+    """集計行を加算する。既存の行があれば値を足し込む。"""
+    if not rows:
+        return
+    table = SalesHourly.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            quantity=table.c.quantity + stmt.inserted.quantity,
+            revenue=table.c.revenue + stmt.inserted.revenue,
+            order_count=table.c.order_count + stmt.inserted.order_count,
+        )
+        session.execute(stmt)
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.hour, table.c.product_id],
+            set_={
+                "quantity": table.c.quantity + stmt.excluded.quantity,
+                "revenue": table.c.revenue + stmt.excluded.revenue,
+                "order_count": table.c.order_count + stmt.excluded.order_count,
+            },
+        )
+        session.execute(stmt)
+    else:
+        for row in rows:
+            current = session.get(SalesHourly, (row["hour"], row["product_id"]))
+            if current is None:
+                session.add(SalesHourly(**row))
+            else:
+                current.quantity += row["quantity"]
+                current.revenue += row["revenue"]
+                current.order_count += row["order_count"]
+
+
+def record_order(session, created_at, lines):
+    """確定する注文の明細 (product_id, quantity, unit_price) を同じトランザクション内で集計に加える。"""
+    upsert(session, aggregate((created_at, product_id, quantity, unit_price)
+                              for product_id, quantity, unit_price in lines))
+
+
+def backfill(session, batch_size=1000):
+    """既存の注文から集計テーブルを作り直す。注文IDの範囲ごとに読み込んでコミットする。"""
+    session.query(SalesHourly).delete()
+    session.commit()
+
+    last_id = 0
+    total = 0
+    while True:
+        order_ids = [order_id for (order_id,) in session.query(Order.order_id)
+                     .filter(Order.order_id > last_id)
+                     .order_by(Order.order_id)
+                     .limit(batch_size)]
+        if not order_ids:
+            break
+        lines = (
+            session.query(Order.created_at, OrderProduct.product_id, OrderProduct.quantity, OrderProduct.unit_price)
+            .join(OrderProduct, Order.order_id == OrderProduct.order_id)
+            .filter(Order.order_id >= order_ids[0], Order.order_id <= order_ids[-1])
+        )
+        upsert(session, aggregate(lines))
+        session.commit()
+        last_id = order_ids[-1]
+        total += len(order_ids)
+        logger.info("Rollup backfilled up to order %s (%d orders).", last_id, total)
+    return total
@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+
+class SalesCounters:
+    """
+    売上の集計値 (商品別・カテゴリ別・時間帯別) をメモリ上で保持する。
+    起動時にDBから一度だけ再構築し、その後は会計ごとに record_order() で加算する。
+    """
+
+    def __init__(self, loader, bucket_seconds=3600, catchup_seconds=60.0):
+        # loader は (order_id, created_at, product_id, name, category, quantity, unit_price) を返す反復可能オブジェクトを返す
+        self.loader = loader
+        self.bucket_seconds = bucket_seconds
+        # 再構築と競合した注文の record_order() は確定の直後に呼ばれるので、この秒数が過ぎたら照合をやめる
+        self.catchup_seconds = catchup_seconds
+        self._lock = threading.RLock()
+        self._loaded = False
+        # 再構築で読んだ注文番号。再構築中に確定した注文が record_order() で二重に加算されないようにする
+        # (catchup_seconds が過ぎたら捨てて、注文のたびに増え続けないようにする)
+        self._rebuilt_order_ids = set()
+        self._rebuilt_at = 0.0
+        self._reset()
+
+    def _reset(self):
+        self._products = OrderedDict()
+        self._categories = OrderedDict()
+        self._buckets = OrderedDict()
+        self._total_items = 0
+        self._total_sales = 0
+        self._order_count = 0
+
+    def _bucket_key(self, created_at):
+        # DBには現地時刻がタイムゾーンなしで保存されるので、タイムゾーンを外して揃える
+        created_at = created_at.replace(tzinfo=None)
+        midnight = created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+        seconds = int((created_at - midnight).total_seconds())
+        return midnight + timedelta(seconds=seconds - seconds % self.bucket_seconds)
+
+    def _add_line(self, product_id, name, category, quantity, unit_price, bucket):
+        amount = quantity * unit_price
+        product = self._products.get(product_id)
+        if product is None:
+            product = self._products[product_id] = {"product_id": product_id, "product_name": name,
+                                                    "category": category, "sold": 0, "revenue": 0}
+        product["sold"] += quantity
+        product["revenue"] += amount
+
+        cat = self._categories.get(category)
+        if cat is None:
+            cat = self._categories[category] = {"category": category, "sold": 0, "revenue": 0}
+        cat["sold"] += quantity
+        cat["revenue"] += amount
+
+        bucket["sold"] += quantity
+        bucket["revenue"] += amount
+        self._total_items += quantity
+        self._total_sales += amount
+
+    def _bucket(self, created_at):
+        key = self._bucket_key(created_at)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = {"start": key.isoformat(), "sold": 0, "revenue": 0, "orders": 0}
+        return bucket
+
+    def rebuild(self):
+        """DBの注文明細から集計し直す。"""
+        with self._lock:
+            self._reset()
+            self._rebuilt_order_ids = set()
+            for order_id, created_at, product_id, name, category, quantity, unit_price in self.loader():
+                bucket = self._bucket(created_at)
+                if order_id not in self._rebuilt_order_ids:
+                    bucket["orders"] += 1
+                    self._order_count += 1
+                    self._rebuilt_order_ids.add(order_id)
+                self._add_line(product_id, name, category, quantity, unit_price, bucket)
+            self._rebuilt_at = time.monotonic()
+            self._loaded = True
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.rebuild()
+
+    def record_order(self, order_id, created_at, lines):
+        """
+        確定した注文を加算する。lines は (product_id, name, category, quantity, unit_price) のリスト。
+        まだDBから再構築していないか、再構築で既に読んだ注文なら何もしない。
+        """
+        with self._lock:
+            if not self._loaded:
+                return None
+            if self._rebuilt_order_ids:
+                if time.monotonic() - self._rebuilt_at > self.catchup_seconds:
+                    self._rebuilt_order_ids = set()
+                elif order_id in self._rebuilt_order_ids:
+                    return None
+            bucket = self._bucket(created_at)
+            bucket["orders"] += 1
+            self._order_count += 1
+            for line in lines:
+                self._add_line(*line, bucket)
+            return bucket
+
+    def product_summary(self):
+        """/product_count と同じ形式の商品別売上数。"""
+        self.ensure_loaded()
+        with self._lock:
+            return [{"product_id": p["product_id"], "product_name": p["product_name"], "sold": p["sold"]}
+                    for p in self._products.values()]
+
+    def snapshot(self, buckets=True):
+        self.ensure_loaded()
+        with self._lock:
+            result = {
+                "products": [dict(p) for p in self._products.values()],
+                "categories": [dict(c) for c in self._categories.values()],
+                "total_items": self._total_items,
+                "total_sales": self._total_sales,
+                "order_count": self._order_count,
+            }
+            if buckets:
+                result["buckets"] = [dict(self._buckets[key]) for key in sorted(self._buckets)]
+            return result
@@ -0,0 +1,117 @@
+"""
+本番用の起動スクリプト。デバッグ用のリローダーは使わない。
+
+    python backend/serve.py               # ワーカー1つ (Windows はこちら)
+    python backend/serve.py --workers 4   # ワーカーを4つ起動する (SO_REUSEPORT が使えるOSのみ)
+
+複数ワーカーの場合、ワーカー0 (プライマリ) がプリンター・音声・メモリ上の状態を持ち、
+ほかのワーカーは状態を持たない処理以外をプライマリへ転送する。
+Socket.IO のイベントは POS_MESSAGE_QUEUE (redis://... など) を通して全ワーカーに配信する。
+指定しなければこのプロセス内でローカルのブローカーを起動して使う。
+"""
+import time
+PROCESS_STARTED = time.perf_counter()  # 起動時間の計測用
+
+# eventletのモンキーパッチを最初に適用
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import logging
+import os
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+logger = logging.getLogger("serve")
+
+BACKEND_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def run_worker(host, port, workers, internal_port):
+    from eventlet import wsgi
+    from app import create_app, IS_PRIMARY
+    app = create_app()
+
+    listener = eventlet.listen((host, port), reuse_port=workers > 1)
+    if IS_PRIMARY and workers > 1:
+        # セカンダリからの転送は 127.0.0.1 の別ポートで受ける
+        internal = eventlet.listen(("127.0.0.1", internal_port))
+        eventlet.spawn(wsgi.server, internal, app, log_output=False)
+    logger.info("Worker %s listening on %s:%s (ready in %.2fs)", os.getenv("POS_WORKER_INDEX", "0"), host, port,
+                time.perf_counter() - PROCESS_STARTED)
+    wsgi.server(listener, app, log_output=False)
+
+
+def spawn_worker(index, args, message_queue):
+    env = dict(os.environ,
+               POS_WORKERS=str(args.workers),
+               POS_WORKER_INDEX=str(index),
+               POS_MESSAGE_QUEUE=message_queue)
+    env.pop("POS_PRIMARY_URL", None)
+    if index > 0:
+        env["POS_PRIMARY_URL"] = f"http://127.0.0.1:{args.internal_port}"
+    command = [sys.executable, str(Path(__file__).resolve()), "--worker",
+               "--host", args.host, "--port", str(args.port),
+               "--workers", str(args.workers), "--internal-port", str(args.internal_port)]
+    return subprocess.Popen(command, env=env)
+
+
+def run_workers(args):
+    message_queue = os.getenv("POS_MESSAGE_QUEUE")
+    if not message_queue:
+        from local_mq import LocalBroker
+        broker = LocalBroker(port=args.mq_port).start()
+        message_queue = broker.url
+        logger.info("Local message queue broker started at %s", message_queue)
+
+    processes = {}
+    try:
+        for index in range(args.workers):
+            processes[index] = spawn_worker(index, args, message_queue)
+            if index == 0:
+                # セカンダリが転送を始める前にプライマリを起動しておく
+                time.sleep(args.primary_wait)
+        while True:
+            time.sleep(1)
+            for index, process in list(processes.items()):
+                if process.poll() is not None:
+                    logger.warning("Worker %s exited with %s, restarting", index, process.returncode)
+                    processes[index] = spawn_worker(index, args, message_queue)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.wait()
+
+
+def main():
+    from config import ServeConfig
+
+    parser = argparse.ArgumentParser(description="POSサーバーを本番モードで起動する")
+    parser.add_argument("--host", default=ServeConfig.HOST)
+    parser.add_argument("--port", type=int, default=ServeConfig.PORT)
+    parser.add_argument("--workers", type=int, default=ServeConfig.WORKERS)
+    parser.add_argument("--internal-port", type=int, default=ServeConfig.INTERNAL_PORT)
+    parser.add_argument("--mq-port", type=int, default=0, help="ローカルのブローカーのポート (0: 空いているポート)")
+    parser.add_argument("--primary-wait", type=float, default=5.0, help="プライマリの起動を待つ秒数")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        logger.warning("SO_REUSEPORT is not available on this platform; starting a single worker")
+        args.workers = 1
+
+    if args.worker or args.workers == 1:
+        run_worker(args.host, args.port, args.workers, args.internal_port)
+    else:
+        run_workers(args)
+
+
+if __name__ == "__main__":
+    main()
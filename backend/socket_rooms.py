@@ -0,0 +1,203 @@
+import itertools
+import threading
+from collections import Counter
+
+from metrics import registry
+
+EMIT_SECONDS = registry.histogram(
+    "pos_socket_emit_seconds", "Time spent fanning out a Socket.IO event.", labels=("event",))
+EMIT_DELIVERIES = registry.counter(
+    "pos_socket_deliveries_total", "Socket.IO deliveries to clients connected to this process.", labels=("event",))
+
+# 画面の役割ごとのルーム
+CASHIER = "cashier"  # 注文・会計タブレット
+KITCHEN = "kitchen"  # 厨房画面
+CALL = "call"  # 呼び出し表示
+LISTENER = "listener"  # listener/ のスクリプト
+ROLES = (CASHIER, KITCHEN, CALL, LISTENER)
+
+# 役割を名乗らずに接続した (更新前の) クライアント。互換性のためすべてのイベントを送る
+UNASSIGNED = "unassigned"
+
+# 役割の組み合わせ (バッチの送信先)。クライアントは名乗った役割の組み合わせのルームに1つだけ入る
+ROLE_GROUPS = tuple(frozenset(roles) for n in range(1, len(ROLES) + 1) for roles in itertools.combinations(ROLES, n))
+
+
+def group_room(roles):
+    """役割の組み合わせのルーム名 (例: "roles:call+kitchen")。"""
+    return "roles:" + "+".join(sorted(roles))
+
+
+# イベントごとの送信先
+EVENT_ROLES = {
+    "new_order": (KITCHEN, CALL, LISTENER),
+    "order_call": (KITCHEN, CALL, LISTENER),
+    "end_order": (KITCHEN, CALL, LISTENER),
+    "order_complete": (CASHIER,),
+    "catalog_updated": (CASHIER,),
+    "print_job_status": (CASHIER,),
+    "call_played": (CALL,),
+    "sales_update": (LISTENER,),
+}
+
+
+def parse_roles(value):
+    """"kitchen,call" や ["kitchen"] のような指定から有効な役割だけを取り出す。"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [role.strip() for role in value if isinstance(role, str) and role.strip() in ROLES]
+
+
+class RoomRouter:
+    """
+    接続したクライアントを役割ごとのルームに入れ、イベントを必要な役割にだけ送る。
+    ルームごとの送信回数と配信数 (送信時の参加数) を数えておく。
+
+    batch_window を指定すると、イベントをその間だけ溜めて
+    'batch' イベント ({"room": ..., "events": [{"event": ..., "data": ...}, ...]}) として1回で送る。
+    バッチは役割の組み合わせ (group_room) ごとに溜めるので、複数の役割を名乗ったクライアントにも
+    同じイベントは1回だけ届く。
+    unbatched のイベントはすぐに送る (送信先に溜まっている分を先に送るので順序は変わらない)。
+    coalesce のイベントは溜めている間に同じイベントが来たら最新のものだけを残す。
+    役割を名乗っていないクライアントは 'batch' を解釈できないので、常にすぐ送る。
+
+    distributed=True (メッセージキューで複数ワーカーに配信する) の場合は、このプロセスに
+    参加者がいないルームにも送る。参加数と配信数はこのプロセスに接続したクライアントの分だけ数える。
+    """
+
+    def __init__(self, socketio, event_roles=None, namespace="/", batch_window=0.0, unbatched=(), coalesce=(),
+                 distributed=False):
+        self.socketio = socketio
+        self.distributed = distributed
+        self.event_roles = dict(EVENT_ROLES if event_roles is None else event_roles)
+        self.namespace = namespace
+        self.batch_window = batch_window
+        self.unbatched = set(unbatched)
+        self.coalesce = set(coalesce)
+        self._members = {}  # sid -> そのクライアントが入っているルームの集合 (役割と UNASSIGNED)
+        self._buffers = {}  # 役割の組み合わせ -> 送信待ちの [イベント名, データ] のリスト
+        self._emits = Counter()
+        self._deliveries = Counter()
+        self._batched = Counter()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def join(self, sid, roles):
+        """役割のルームに入れる。役割がなければ UNASSIGNED に入れる。入ったルームを返す。"""
+        rooms = set(parse_roles(roles)) or {UNASSIGNED}
+        with self._lock:
+            current = self._members.setdefault(sid, set())
+            before = current - {UNASSIGNED}
+            # 役割を名乗り直したら互換用のルームからは出す
+            if UNASSIGNED in current and UNASSIGNED not in rooms:
+                current.discard(UNASSIGNED)
+                self.socketio.server.leave_room(sid, UNASSIGNED, namespace=self.namespace)
+            for room in rooms - current:
+                self.socketio.server.enter_room(sid, room, namespace=self.namespace)
+            current |= rooms
+            # バッチを受け取る役割の組み合わせのルームを入れ替える
+            after = current - {UNASSIGNED}
+            if after != before:
+                if before:
+                    self.socketio.server.leave_room(sid, group_room(before), namespace=self.namespace)
+                self.socketio.server.enter_room(sid, group_room(after), namespace=self.namespace)
+            return sorted(current)
+
+    def leave(self, sid):
+        # ルームからの退出自体は切断時に Socket.IO が行うので、参加者の記録だけ消す
+        with self._lock:
+            self._members.pop(sid, None)
+
+    def rooms_for(self, event):
+        return tuple(self.event_roles.get(event, ROLES)) + (UNASSIGNED,)
+
+    def _count(self, room, batched=0):
+        members = sum(1 for joined in self._members.values() if room in joined)
+        if members or self.distributed:
+            self._emits[room] += 1
+            self._deliveries[room] += members
+            self._batched[room] += batched
+        return members
+
+    def _count_group(self, group, batched):
+        # 統計は役割ごとに数えるので、組み合わせの各役割に加える
+        members = sum(1 for joined in self._members.values() if joined - {UNASSIGNED} == group)
+        if members or self.distributed:
+            for room in group:
+                self._emits[room] += 1
+                self._deliveries[room] += members
+                self._batched[room] += batched
+        return members
+
+    def _groups_for(self, rooms):
+        """rooms のいずれかを含む役割の組み合わせ。"""
+        if self.distributed:
+            # ほかのワーカーに接続しているクライアントの組み合わせは分からないので、ありうるものすべてに送る
+            groups = ROLE_GROUPS
+        else:
+            groups = {frozenset(joined - {UNASSIGNED}) for joined in self._members.values()}
+        return [group for group in groups if group & set(rooms)]
+
+    def emit(self, event, data, **kwargs):
+        rooms = self.rooms_for(event)
+        if not self.batch_window or event in self.unbatched or kwargs:
+            with self._send_lock:
+                # 溜まっている分を先に送って順序を保つ
+                for group in list(self._buffers):
+                    if group & set(rooms):
+                        self._flush(group)
+                with self._lock:
+                    EMIT_DELIVERIES.inc(event, amount=sum(self._count(room) for room in rooms))
+                # 複数のルームに入っているクライアントにも1回だけ届く
+                with EMIT_SECONDS.time(event):
+                    self.socketio.emit(event, data, to=list(rooms), namespace=self.namespace, **kwargs)
+            return
+
+        with self._lock:
+            EMIT_DELIVERIES.inc(event, amount=self._count(UNASSIGNED))
+            for group in self._groups_for(rooms):
+                buffer = self._buffers.get(group)
+                if buffer is None:
+                    buffer = self._buffers[group] = []
+                    self.socketio.start_background_task(self._flush_later, group)
+                if event in self.coalesce:
+                    buffer[:] = [item for item in buffer if item[0] != event]
+                buffer.append([event, data])
+        with EMIT_SECONDS.time(event):
+            self.socketio.emit(event, data, to=UNASSIGNED, namespace=self.namespace)
+
+    def _flush_later(self, group):
+        self.socketio.sleep(self.batch_window)
+        with self._send_lock:
+            self._flush(group)
+
+    def _flush(self, group):
+        with self._lock:
+            buffer = self._buffers.pop(group, None)
+            if not buffer:
+                return
+            EMIT_DELIVERIES.inc("batch", amount=self._count_group(group, batched=len(buffer)))
+        room = group_room(group)
+        events = [{"event": event, "data": data} for event, data in buffer]
+        with EMIT_SECONDS.time("batch"):
+            self.socketio.emit("batch", {"room": room, "events": events}, to=room, namespace=self.namespace)
+
+    def flush(self):
+        """溜まっているイベントをすべて送る。"""
+        with self._send_lock:
+            for group in list(self._buffers):
+                self._flush(group)
+
+    def stats(self):
+        with self._lock:
+            return {
+                room: {
+                    "members": sum(1 for joined in self._members.values() if room in joined),
+                    "emits": self._emits[room],
+                    "deliveries": self._deliveries[room],
+                    "batched_events": self._batched[room],
+                }
+                for room in ROLES + (UNASSIGNED,)
+            }
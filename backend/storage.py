@@ -0,0 +1,105 @@
+import os
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+# SQLite (組み込みモード) の接続ごとに設定する PRAGMA
+# WAL にすると読み込みが書き込みを待たなくなり、synchronous=NORMAL なら WAL ではコミットごとの fsync が不要になる
+# (電源断で直前のコミットが失われることはあるが、DBが壊れることはない)
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("POS_SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("POS_SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": 5000,  # 他の接続が書き込み中なら最大5秒待つ
+    "foreign_keys": "ON",
+    "cache_size": -20000,  # 約20MB
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,  # 256MB
+}
+
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def ensure_sqlite_directory(uri):
+    """SQLite のファイルを置くディレクトリを作成する (SQLite はディレクトリまでは作らない)。"""
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:":
+        Path(url.database).parent.mkdir(parents=True, exist_ok=True)
+
+
+class _Task:
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class SingleWriter:
+    """
+    書き込み処理を1つのワーカーで順番に実行する。
+    SQLite は同時に1つの接続しか書き込めないので、会計を並べて待たせることで
+    ロック待ちの再試行や "database is locked" を起こさないようにする。
+    enabled=False ならその場で実行する (MySQL など)。
+    """
+
+    def __init__(self, app, enabled=True):
+        self.app = app
+        self.enabled = enabled
+        self._queue = queue.Queue()
+        self._worker = None
+
+    def start(self):
+        if self.enabled and self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._worker.start()
+        return self
+
+    def stop(self, timeout=None):
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join(timeout)
+            self._worker = None
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def submit(self, func, *args, **kwargs):
+        """func を書き込み用のワーカーで実行し、結果を返す (例外はそのまま送出する)。"""
+        if not self.enabled or self._worker is None:
+            return func(*args, **kwargs)
+        task = _Task(func, args, kwargs)
+        self._queue.put(task)
+        task.done.wait()
+        if task.error is not None:
+            raise task.error
+        return task.result
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            try:
+                # セッションはタスクごとに作り直す (コンテキストの終了時に破棄される)
+                with self.app.app_context():
+                    task.result = task.func(*task.args, **task.kwargs)
+            except Exception as e:
+                task.error = e
+            finally:
+                task.done.set()
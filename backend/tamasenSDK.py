@@ -1,37 +1,112 @@
 import __relimport
+import hashlib
+import json
 from datetime import datetime
 import pytz
-import time
 from config import BTConfig as config
-from csjwindowspossdk import ESCPOSConst, ESCPOSPrinter
+from csjwindowspossdk import ESCPOSConst
+from printer_pool import PRINT_STAGE_SECONDS, PrinterConnection
 from pathlib import Path
 
 __assets = Path(__file__).parent/"assets"
 BITMAP_PATH = str(__assets/"logoimg.bmp")
+# NVメモリに登録したロゴの版を記録するファイル (プリンターのアドレスごと)
+NV_STATE_PATH = Path(__file__).parent/"cache"/"nv_logo.json"
+
+
+class PrinterError(Exception):
+    pass
+
+
+def _image_hash(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def _load_nv_state():
+    try:
+        return json.loads(NV_STATE_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_nv_state(state):
+    NV_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = NV_STATE_PATH.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    tmp_path.replace(NV_STATE_PATH)
+
+
+def provision_nv_logo(printer, address, bitmap_path=BITMAP_PATH, number=config.NV_LOGO_NUMBER, force=False):
+    """
+    ロゴをプリンターのNVメモリに登録する。
+    前回登録した画像と同じハッシュなら転送しない。登録済み(または登録できた)ならTrueを返す。
+    """
+    digest = _image_hash(bitmap_path)
+    state = _load_nv_state()
+    if not force and state.get(address) == {"number": number, "hash": digest}:
+        return True
+
+    result = printer.SetNVBitmap(number, bitmap_path, ESCPOSConst.CMP_BM_ASIS)
+    if result != ESCPOSConst.CMP_SUCCESS:
+        print(f"SetNVBitmap Error : {result}")
+        return False
+    state[address] = {"number": number, "hash": digest}
+    _save_nv_state(state)
+    print(f"Logo stored in NV memory #{number}.")
+    return True
 
 
 class Printer:
 
-    def __init__(self, port_type=config.CONTENT_TYPE, address=config.ADDR):
+    def __init__(self, port_type=config.CONTENT_TYPE, address=config.ADDR, connection=None, use_nv_logo=True):
         self.port_type = port_type
         self.address = address
-
-    def connect_force(self, printer: ESCPOSPrinter, connectType: int, addr: int, wait: int = 5, output: bool = False) -> ESCPOSPrinter:
-        while printer.Connect(connectType, addr) != ESCPOSConst.CMP_SUCCESS:
-            printer.Disconnect()
-            time.sleep(wait)
-            output and print("Reconnecting...")
-        return printer
+        # 接続はレシートごとに張り直さず、PrinterConnection が保持したものを使い回す
+        self.connection = connection or PrinterConnection(port_type, address)
+        self.use_nv_logo = use_nv_logo
+        self.nv_logo_ready = False
+        # 登録に失敗した接続 (connect_count)。同じ接続の間はレシートごとに再登録せず、画像を送って印刷する
+        self._nv_logo_failed_on = None
+
+    def provision_logo(self, force=False):
+        """ロゴをNVメモリに登録する。起動時や画像差し替え時に呼ぶ。"""
+        with self.connection.acquire() as printer:
+            self._provision_logo(printer, force=force)
+        return self.nv_logo_ready
+
+    def _ensure_nv_logo(self, printer):
+        if not self.use_nv_logo or self.nv_logo_ready:
+            return
+        if self._nv_logo_failed_on == self.connection.connect_count:
+            return
+        self._provision_logo(printer)
+
+    def _provision_logo(self, printer, force=False):
+        self.nv_logo_ready = provision_nv_logo(printer, self.address, force=force)
+        self._nv_logo_failed_on = None if self.nv_logo_ready else self.connection.connect_count
+
+    def warmup(self):
+        """起動時に接続とロゴの登録を済ませておき、最初のレシートを待たせないようにする。"""
+        with self.connection.acquire() as printer:
+            self._ensure_nv_logo(printer)
 
     def print_receipt(self, order_id, orderL, totalL, total, payment, note, menuL, order_date):
-        self.printer = ESCPOSPrinter()
-        self.printer = self.connect_force(
-            self.printer, self.port_type, self.address, 5, True)
+        with self.connection.acquire() as printer:
+            self._ensure_nv_logo(printer)
+            self._print_receipt(printer, order_id, orderL, totalL, total, payment, note, menuL, order_date)
+
+    def _print_receipt(self, printer, order_id, orderL, totalL, total, payment, note, menuL, order_date):
+        self.printer = printer
         print("Printing receipt...")
         self.printer.TransactionPrint(ESCPOSConst.CMP_TP_TRANSACTION)
 
-        self.printer.PrintBitmap(BITMAP_PATH,
-                                 ESCPOSConst.CMP_ALIGNMENT_CENTER)
+        # NVメモリに登録済みならロゴ画像を毎回転送せず番号で呼び出す
+        if self.use_nv_logo and self.nv_logo_ready:
+            self.printer.PrintNVBitmap(config.NV_LOGO_NUMBER,
+                                       ESCPOSConst.CMP_ALIGNMENT_CENTER)
+        else:
+            self.printer.PrintBitmap(BITMAP_PATH,
+                                     ESCPOSConst.CMP_ALIGNMENT_CENTER)
 
         self.printer.PrintText(f"テスト店    {order_date.strftime('%Y/%m/%d %H:%M:%S')}\n",
                                ESCPOSConst.CMP_ALIGNMENT_LEFT,
@@ -149,11 +224,20 @@ class Printer:
 
         self.printer.CutPaper(ESCPOSConst.CMP_CUT_PARTIAL_PREFEED)
 
-        result = self.printer.TransactionPrint(ESCPOSConst.CMP_TP_NORMAL)
+        # トランザクションモードなので、ここで溜めたデータを送って印刷する (カットもここで行われる)
+        with PRINT_STAGE_SECONDS.time("transfer"):
+            result = self.printer.TransactionPrint(ESCPOSConst.CMP_TP_NORMAL)
 
         if result != ESCPOSConst.CMP_SUCCESS:
             print(f"Transaction Error : {result}")
-        else:
-            print("Printed receipt successfully.")
+            raise PrinterError(f"Transaction Error : {result}")
+        print("Printed receipt successfully.")
+
 
-        self.printer.Disconnect()
+if __name__ == "__main__":
+    # ロゴをNVメモリに登録する: python backend/tamasenSDK.py [--force]
+    import sys
+    printer = Printer()
+    ok = printer.provision_logo(force="--force" in sys.argv)
+    printer.connection.close()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# app を読み込む前に、一時ディレクトリの SQLite を使うよう環境変数を設定する
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(_tmpdir.name) / 'test.db'}"
+os.environ["POS_ORDER_JOURNAL_PATH"] = str(Path(_tmpdir.name) / "order_journal.jsonl")
+os.environ["POS_AUDIO_SINK"] = "null"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(scope="session")
+def appmod():
+    import app as appmod
+    from models import db
+
+    with appmod.app.app_context():
+        db.create_all()
+    return appmod
+
+
+@pytest.fixture
+def db_session(appmod):
+    """テストごとにテーブルを空にしてアプリケーションコンテキストに入る。"""
+    from models import db
+
+    with appmod.app.app_context():
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        yield db.session
+        db.session.remove()
+
+
+@pytest.fixture
+def count_statements(appmod):
+    """with の中で実行された SQL 文を記録する。"""
+    from contextlib import contextmanager
+    from sqlalchemy import event
+    from models import db
+
+    @contextmanager
+    def counting():
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        with appmod.app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+
+    return counting
@@ -0,0 +1,63 @@
+import io
+import json
+import wave
+
+from werkzeug.test import Client
+
+from benchmark import fakes
+from benchmark.fakes import FakeESCPOSPrinter, fake_voicevox_app
+from csjwindowspossdk import ESCPOSConst
+from printer_pool import PrinterConnection
+
+
+def test_fake_printer_fails_at_the_given_rate(monkeypatch):
+    slept = []
+    monkeypatch.setattr(fakes.time, "sleep", slept.append)
+    printer = FakeESCPOSPrinter(latency=0.3, failure_rate=0.25, connect_latency=0.1, seed=0)
+
+    assert printer.Connect(ESCPOSConst.CMP_PORT_Bluetooth, "00:11:22") == ESCPOSConst.CMP_SUCCESS
+    # 印刷以外の命令は何もせず成功する
+    assert printer.PrintText("text", 0, 0, 0) == ESCPOSConst.CMP_SUCCESS
+    assert printer.TransactionPrint(ESCPOSConst.CMP_TP_TRANSACTION) == ESCPOSConst.CMP_SUCCESS
+    results = [printer.TransactionPrint(ESCPOSConst.CMP_TP_NORMAL) for _ in range(400)]
+
+    assert results.count(ESCPOSConst.CMP_E_OFFLINE) == printer.failed
+    assert printer.printed + printer.failed == 400
+    assert 60 < printer.failed < 140
+    assert slept == [0.1] + [0.3] * 400
+
+
+def test_fake_printer_with_the_same_seed_fails_the_same_way():
+    first, second = (FakeESCPOSPrinter(failure_rate=0.5, seed=7) for _ in range(2))
+    assert ([first.TransactionPrint(ESCPOSConst.CMP_TP_NORMAL) for _ in range(20)]
+            == [second.TransactionPrint(ESCPOSConst.CMP_TP_NORMAL) for _ in range(20)])
+
+
+def test_fake_printer_can_be_used_as_a_printer_connection():
+    printer = FakeESCPOSPrinter()
+    conn = PrinterConnection(ESCPOSConst.CMP_PORT_Bluetooth, "00:11:22", device_factory=lambda: printer,
+                             connect_wait=0)
+    with conn.acquire() as device:
+        assert device.TransactionPrint(ESCPOSConst.CMP_TP_NORMAL) == ESCPOSConst.CMP_SUCCESS
+    assert conn.connected
+    assert printer.printed == 1
+
+
+def test_fake_voicevox_answers_the_engine_endpoints(monkeypatch):
+    slept = []
+    monkeypatch.setattr(fakes.time, "sleep", slept.append)
+    client = Client(fake_voicevox_app(latency=0.2, duration=0.5, frame_rate=24000))
+
+    assert client.get("/version").get_json() == "fake"
+    query = client.post("/audio_query?text=100&speaker=1")
+    assert json.loads(query.data)["accent_phrases"] == []
+    assert slept == []
+
+    synthesis = client.post("/synthesis?speaker=1", data=query.data)
+    assert synthesis.headers["Content-Type"] == "audio/wav"
+    with wave.open(io.BytesIO(synthesis.data)) as wf:
+        assert wf.getframerate() == 24000
+        assert wf.getnframes() == 12000
+    assert slept == [0.2]
+
+    assert client.get("/speakers").status_code == 404
@@ -0,0 +1,75 @@
+import pytest
+
+from catalog_cache import CatalogCache
+from models import Product
+
+
+@pytest.fixture
+def client(appmod, db_session, monkeypatch):
+    db_session.add(Product(name="normal", category="menu", price=250, onSale=True))
+    db_session.commit()
+    db_session.remove()
+    monkeypatch.setattr(appmod, "catalog_cache", CatalogCache(appmod.load_products))
+    return appmod.app.test_client()
+
+
+def test_products_are_served_from_memory_with_an_etag(client, count_statements):
+    first = client.get("/products")
+    assert first.status_code == 200
+    assert [product["name"] for product in first.get_json()] == ["normal"]
+    etag = first.headers["ETag"]
+
+    with count_statements() as statements:
+        second = client.get("/products", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert statements == []
+
+
+def test_product_change_invalidates_the_etag(client):
+    first = client.get("/products")
+    product_id = first.get_json()[0]["product_id"]
+
+    assert client.put(f"/product_management/{product_id}", json={"price": 300}).status_code == 200
+    second = client.get("/products", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert second.get_json()[0]["price"] == 300
+    assert int(second.headers["X-Catalog-Version"]) > int(first.headers["X-Catalog-Version"])
+
+
+def test_stale_catalog_is_used_while_the_database_is_down():
+    products = [{"product_id": 1, "name": "normal"}]
+    down = False
+
+    def loader():
+        if down:
+            raise ConnectionError("database is down")
+        return list(products)
+
+    cache = CatalogCache(loader)
+    with pytest.raises(ConnectionError):
+        down = True
+        cache.get_or_stale()
+
+    down = False
+    loaded = cache.get_or_stale()
+    cache.invalidate()
+    down = True
+    assert cache.get_or_stale() is loaded
+    with pytest.raises(ConnectionError):
+        cache.get()
+
+
+def test_catalog_changed_while_loading_is_not_cached():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        if len(calls) == 1:
+            # 読み込み中に商品が更新された
+            cache.invalidate()
+        return [{"product_id": 1, "price": 250 if len(calls) == 1 else 300}]
+
+    cache = CatalogCache(loader)
+    cache.get()
+    assert cache.get().products == [{"product_id": 1, "price": 300}]
+    assert len(calls) == 2
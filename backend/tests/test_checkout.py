@@ -0,0 +1,44 @@
+import pytest
+
+import rollup
+from models import Order, OrderProduct, Product, SalesHourly
+
+ORDER = {"orderL": [{"product_id": None, "quantity": 2}], "total": 500, "note": "n"}
+
+
+def order_for(product):
+    return dict(ORDER, orderL=[{"product_id": product.product_id, "quantity": 2}])
+
+
+@pytest.fixture
+def product(db_session):
+    product = Product(name="normal", category="menu", price=250, onSale=True)
+    db_session.add(product)
+    db_session.commit()
+    return product
+
+
+def test_order_lines_and_rollup_are_saved_together(appmod, db_session, product, count_statements):
+    order_data = order_for(product)
+    with count_statements() as statements:
+        order_id, _, sales_lines = appmod.save_order(order_data)
+
+    # 価格の取得・注文・明細・集計テーブルの4文を1回のコミットで保存する
+    assert len(statements) == 4
+    assert sales_lines == [(product.product_id, "normal", "menu", 2, 250)]
+    order = db_session.get(Order, order_id)
+    assert [(op.quantity, op.unit_price) for op in order.order_products] == [(2, 250)]
+    assert SalesHourly.query.one().quantity == 2
+
+
+def test_failure_leaves_no_order_without_lines(appmod, db_session, product, monkeypatch):
+    def broken(session, created_at, lines):
+        raise RuntimeError("rollup failed")
+
+    monkeypatch.setattr(rollup, "record_order", broken)
+    with pytest.raises(RuntimeError):
+        appmod.save_order(order_for(product))
+    db_session.rollback()
+
+    assert Order.query.count() == 0
+    assert OrderProduct.query.count() == 0
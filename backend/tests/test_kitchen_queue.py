@@ -0,0 +1,60 @@
+from kitchen_queue import END_ORDER, NEW_ORDER, ORDER_CALL, KitchenQueue
+
+
+def order(order_id):
+    return {"order_id": order_id, "note": None, "menuL": []}
+
+
+def loaded_queue(history_size=500):
+    queue = KitchenQueue(lambda: [order(100)], history_size=history_size)
+    queue.ensure_loaded()
+    return queue
+
+
+def test_reconnecting_client_gets_only_the_missed_deltas():
+    queue = loaded_queue()
+    queue.add_order(order(101))
+    seen = queue.seq
+    queue.call_order(100)
+    queue.end_order(100)
+
+    result = queue.since(queue.epoch, seen)
+    assert result["snapshot"] is False
+    assert [(delta["type"], delta["seq"]) for delta in result["deltas"]] == [(ORDER_CALL, seen + 1), (END_ORDER, seen + 2)]
+    assert queue.since(queue.epoch, queue.seq)["deltas"] == []
+
+
+def test_new_epoch_or_a_gap_returns_a_snapshot():
+    queue = loaded_queue(history_size=2)
+    for order_id in (101, 102, 103):
+        queue.add_order(order(order_id))
+    queue.call_order(101)
+
+    # 再起動した (epoch が違う)
+    result = queue.since("restarted", queue.seq)
+    assert result["snapshot"] is True
+    assert [(o["order_id"], o["called"]) for o in result["orders"]] == [(100, False), (101, True), (102, False), (103, False)]
+    # 差分が履歴から消えている
+    assert queue.since(queue.epoch, 1)["snapshot"] is True
+    # クライアントの連番がサーバーより先 (サーバーの再起動後に同じ epoch はないが念のため)
+    assert queue.since(queue.epoch, queue.seq + 1)["snapshot"] is True
+    # 履歴に残っている範囲なら差分
+    assert queue.since(queue.epoch, queue.seq - 2)["snapshot"] is False
+
+
+def test_duplicate_and_unknown_changes_are_not_recorded():
+    queue = loaded_queue()
+    assert queue.add_order(order(100)) is None
+    assert queue.call_order(999) is None
+    assert queue.call_order(100)["type"] == ORDER_CALL
+    assert queue.call_order(100) is None
+    assert queue.end_order(999) is None
+    assert queue.waiting_orders() == []
+
+
+def test_order_added_before_the_first_load_is_broadcast_once():
+    # 読み込み前に確定した注文は、DBから読んだ一覧に既に含まれている
+    queue = KitchenQueue(lambda: [order(100), order(101)])
+    delta = queue.add_order(order(101))
+    assert delta["type"] == NEW_ORDER
+    assert [o["order_id"] for o in queue.waiting_orders()] == [100, 101]
@@ -0,0 +1,10 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+
+def test_failed_statement_does_not_leave_a_query_timer(appmod, db_session):
+    connection = db_session.connection()
+    with pytest.raises(OperationalError):
+        db_session.execute(text("SELECT * FROM no_such_table"))
+    assert connection.info.get('query_started') == []
@@ -0,0 +1,65 @@
+import importlib.util
+from pathlib import Path
+
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from models import ORDER_ID_START, Order, OrderProduct, Product
+
+VERSIONS = Path(__file__).resolve().parent.parent / "migrations" / "versions"
+
+
+def run_upgrade(connection, revision):
+    path = next(VERSIONS.glob(f"{revision}_*.py"))
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    with Operations.context(MigrationContext.configure(connection)):
+        migration.upgrade()
+
+
+def insert_order(connection):
+    return connection.execute(Order.__table__.insert().values(total_quantity=1, total_amount=100)).inserted_primary_key[0]
+
+
+def test_order_ids_start_at_100_on_tables_created_without_the_seed(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'pos.db'}")
+    with engine.begin() as connection:
+        Order.__table__.create(connection)
+        # init_db で作ったテーブルと同じく開始番号がない状態にする
+        connection.execute(sa.text("DELETE FROM sqlite_sequence"))
+        run_upgrade(connection, "d2a7f0c3e915")
+        assert insert_order(connection) == ORDER_ID_START
+
+        # 既に開始番号以上の注文があれば変えない
+        run_upgrade(connection, "d2a7f0c3e915")
+        assert insert_order(connection) == ORDER_ID_START + 1
+
+
+def test_rollup_migration_skips_an_existing_table(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'pos.db'}")
+    with engine.begin() as connection:
+        run_upgrade(connection, "3f1c2a9b7d01")
+        assert sa.inspect(connection).has_table("sales_hourly")
+        # create_all で作成済みのDBにもう一度適用しても失敗しない
+        run_upgrade(connection, "3f1c2a9b7d01")
+
+
+def test_product_id_index_is_not_duplicated(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'pos.db'}")
+    with engine.begin() as connection:
+        for table in (Product.__table__, Order.__table__, OrderProduct.__table__):
+            table.create(connection)
+        # 以前のスキーマと同じく、このリビジョンで追加するインデックスがない状態にする
+        for name in ("ix_orders_is_completed_order_id", "ix_orders_created_at", "ix_order_product_product_id"):
+            connection.execute(sa.text(f"DROP INDEX {name}"))
+        # 外部キー用に product_id のインデックスが既にある (MySQL の InnoDB が自動で作るもの)
+        connection.execute(sa.text("CREATE INDEX product_id ON order_product (product_id)"))
+
+        run_upgrade(connection, "b7e4d2c91a3f")
+
+        inspector = sa.inspect(connection)
+        assert {index["name"] for index in inspector.get_indexes("orders")} >= {
+            "ix_orders_is_completed_order_id", "ix_orders_created_at"}
+        assert [index["name"] for index in inspector.get_indexes("order_product")] == ["product_id"]
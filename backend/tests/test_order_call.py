@@ -0,0 +1,85 @@
+import io
+import wave
+
+import requests
+
+import order_call
+from order_call import CallAudioCache
+
+
+def response(content):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = content
+    return response
+
+
+def silent_wav(frame_rate=24000):
+    data = io.BytesIO()
+    with wave.open(data, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(frame_rate)
+        wf.writeframes(b"\x00\x00" * 2400)
+    return data.getvalue()
+
+
+class VersionEndpoint:
+    """/version の代わり。up が False の間は接続できない。"""
+
+    def __init__(self):
+        self.up = False
+        self.calls = 0
+
+    def __call__(self, url, timeout=None):
+        self.calls += 1
+        if not self.up:
+            raise requests.ConnectionError("refused")
+        return response(b'"0.20.0"')
+
+
+def test_version_failure_is_remembered_and_uncached_audio_is_not_kept(tmp_path, monkeypatch):
+    version = VersionEndpoint()
+    monkeypatch.setattr(order_call.requests, "get", version)
+    cache = CallAudioCache(cache_dir=tmp_path)
+    synthesized = []
+    cache._synthesize = lambda text: synthesized.append(text) or f"wav:{text}".encode()
+
+    # 止まっている間は呼び出しのたびに問い合わせない
+    assert cache.get("100") == b"wav:100"
+    assert cache.get("100") == b"wav:100"
+    assert version.calls == 1
+    # バージョンが分からない音声はキャッシュしない
+    assert synthesized == ["100", "100"]
+    assert list(tmp_path.iterdir()) == []
+
+    # 再試行の時刻を過ぎたらもう一度問い合わせ、以降はキャッシュする
+    version.up = True
+    cache._version_retry_at = 0.0
+    cache.get("100")
+    cache.get("100")
+    assert version.calls == 2
+    assert synthesized == ["100", "100", "100"]
+    assert len(list(tmp_path.glob("*.wav"))) == 1
+
+
+def test_audio_is_combined_and_cached_through_the_executor(tmp_path, monkeypatch):
+    version = VersionEndpoint()
+    version.up = True
+    monkeypatch.setattr(order_call.requests, "get", version)
+    monkeypatch.setattr(order_call.requests, "post", lambda url, **kwargs: response(
+        b'{"accent_phrases": []}' if url.endswith("/audio_query") else silent_wav()))
+    executed = []
+
+    def executor(func, *args):
+        executed.append(func.__name__)
+        return func(*args)
+
+    cache = CallAudioCache(cache_dir=tmp_path, executor=executor)
+    data = cache.get("100")
+
+    assert data.startswith(b"RIFF")
+    # 問い合わせ以外 (ディスクの読み込み・変換・書き込み) はすべて executor で実行する
+    assert executed == ["_read_disk", "_combine", "_write_disk"]
+    assert cache.get("100") == data
+    assert executed == ["_read_disk", "_combine", "_write_disk"]
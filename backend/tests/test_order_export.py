@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from models import Order, OrderProduct, Product
+from order_export import CSV_COLUMNS, export_rows, iter_csv, iter_ndjson
+
+
+def seed_orders(session):
+    normal = Product(name="normal", category="menu", price=250, onSale=True)
+    dx = Product(name="DX", category="menu", price=300, onSale=True)
+    session.add_all([normal, dx])
+    session.flush()
+    first = Order(order_id=100, created_at=datetime(2024, 11, 2, 10, 15), total_quantity=3, total_amount=800,
+                  note="マヨなし", is_completed=True)
+    first.order_products = [OrderProduct(product_id=normal.product_id, quantity=2, unit_price=250),
+                            OrderProduct(product_id=dx.product_id, quantity=1, unit_price=300)]
+    second = Order(order_id=101, created_at=datetime(2024, 11, 2, 11, 0), total_quantity=1, total_amount=250)
+    second.order_products = [OrderProduct(product_id=normal.product_id, quantity=1, unit_price=250)]
+    # 明細のない注文
+    empty = Order(order_id=102, created_at=datetime(2024, 11, 2, 12, 0), total_quantity=0, total_amount=0)
+    session.add_all([first, second, empty])
+    session.commit()
+    session.remove()
+
+
+def test_csv_has_one_row_per_line(appmod, db_session):
+    seed_orders(db_session)
+    response = appmod.app.test_client().get("/export/orders?format=csv")
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "text/csv; charset=utf-8"
+    assert "Content-Length" not in response.headers
+    text = response.get_data(as_text=True)
+    assert text.startswith("\ufeff")
+    rows = list(csv.DictReader(io.StringIO(text[1:])))
+    assert [(row["order_id"], row["product_name"], row["line_total"]) for row in rows] == [
+        ("100", "normal", "500"), ("100", "DX", "300"), ("101", "normal", "250"), ("102", "", "")]
+    assert rows[0]["note"] == "マヨなし"
+    assert rows[0]["is_completed"] == "1"
+    assert rows[0]["created_at"] == "2024-11-02T10:15:00"
+
+
+def test_ndjson_has_one_line_per_order_and_filters(appmod, db_session):
+    seed_orders(db_session)
+    client = appmod.app.test_client()
+
+    response = client.get("/export/orders?format=ndjson")
+    assert response.headers["Content-Type"] == "application/x-ndjson; charset=utf-8"
+    orders = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [order["order_id"] for order in orders] == [100, 101, 102]
+    assert orders[0]["products"][1] == {"product_id": orders[0]["products"][1]["product_id"], "name": "DX",
+                                        "quantity": 1, "unit_price": 300, "total_price": 300}
+    assert orders[2]["products"] == []
+
+    response = client.get("/export/orders", query_string={
+        "format": "ndjson", "start": "2024-11-02T10:30:00", "end": "2024-11-02T12:00:00", "completed": "false"})
+    assert [json.loads(line)["order_id"] for line in response.get_data(as_text=True).splitlines()] == [101]
+
+
+def test_invalid_parameters_are_rejected(appmod, db_session):
+    client = appmod.app.test_client()
+    assert client.get("/export/orders?format=xml").status_code == 400
+    assert client.get("/export/orders?completed=maybe").status_code == 400
+    assert client.get("/export/orders?start=yesterday").status_code == 400
+
+
+def test_output_is_streamed_in_chunks(appmod, db_session):
+    seed_orders(db_session)
+    rows = list(export_rows(db_session, batch_size=1))
+
+    chunks = list(iter_csv(rows, chunk_size=2))
+    assert len(chunks) == 3
+    assert chunks[0].splitlines()[0] == "\ufeff" + ",".join(CSV_COLUMNS)
+
+    # 注文の途中では区切らない
+    chunks = list(iter_ndjson(rows, chunk_size=2))
+    assert [len(chunk.splitlines()) for chunk in chunks] == [2, 1]
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import rollup
+from models import Order, OrderProduct, Product
+
+
+def seed_orders(session):
+    product = Product(name="normal", category="menu", price=250, onSale=True)
+    session.add(product)
+    session.flush()
+    for created_at, quantity in [(datetime(2024, 11, 2, 10, 15), 1), (datetime(2024, 11, 2, 11, 45), 2),
+                                 (datetime(2024, 11, 2, 12, 5), 3)]:
+        order = Order(created_at=created_at, total_quantity=quantity, total_amount=250 * quantity)
+        order.order_products = [OrderProduct(product_id=product.product_id, quantity=quantity, unit_price=250)]
+        session.add(order)
+        rollup.record_order(session, created_at, [(product.product_id, quantity, 250)])
+    session.commit()
+    session.remove()
+
+
+def totals(client, count_statements, **params):
+    with count_statements() as statements:
+        body = client.get("/order_history", query_string=params).get_json()
+    rollup_used = any("sales_hourly" in statement for statement in statements)
+    return body["total_items_sold"], body["total_sales_amount"], rollup_used
+
+
+def test_totals_come_from_the_rollup_for_hour_aligned_ranges(appmod, db_session, count_statements):
+    seed_orders(db_session)
+    client = appmod.app.test_client()
+
+    assert totals(client, count_statements) == (6, 1500, True)
+    assert totals(client, count_statements, start="2024-11-02T11:00:00", end="2024-11-02T12:00:00") == (2, 500, True)
+    # 時間帯の途中で区切った場合は明細から集計する
+    assert totals(client, count_statements, start="2024-11-02T11:30:00") == (5, 1250, False)
+
+
+def test_order_history_pages_with_a_cursor(appmod, db_session):
+    seed_orders(db_session)
+    client = appmod.app.test_client()
+
+    first = client.get("/order_history", query_string={"limit": 2}).get_json()
+    assert [order["total_quantity"] for order in first["order_history"]] == [1, 2]
+    assert first["order_history"][1]["total_price"] == 500
+    assert first["order_history"][1]["products"] == [
+        {"name": "normal", "unit_price": 250, "quantity": 2, "total_price": 500}]
+    assert first["next_cursor"] == first["order_history"][-1]["order_id"]
+
+    second = client.get("/order_history", query_string={"limit": 2, "cursor": first["next_cursor"]}).get_json()
+    assert [order["total_quantity"] for order in second["order_history"]] == [3]
+    assert second["next_cursor"] is None
+    # 合計はページではなく範囲全体の値
+    assert (second["total_items_sold"], second["total_sales_amount"]) == (6, 1500)
+
+
+def test_order_history_rejects_invalid_dates(appmod, db_session):
+    response = appmod.app.test_client().get("/order_history", query_string={"start": "yesterday"})
+    assert response.status_code == 400
+
+
+def test_dates_with_an_offset_are_compared_in_local_time(appmod, db_session, count_statements):
+    seed_orders(db_session)
+    client = appmod.app.test_client()
+
+    # 02:00Z は現地時刻 (JST) の 11:00 なので、集計テーブルから 11時台だけを集計する
+    assert totals(client, count_statements, start="2024-11-02T02:00:00+00:00",
+                  end="2024-11-02T12:00:00+09:00") == (2, 500, True)
+    assert totals(client, count_statements, start="2024-11-02T02:30:00Z") == (5, 1250, False)
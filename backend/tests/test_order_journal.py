@@ -0,0 +1,147 @@
+import json
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import exc
+
+from file_lock import FileLocked
+from models import Order, OrderProduct, Product
+from order_journal import JournalConflict, JournalReplayer, OrderJournal
+from sales_stats import SalesCounters
+
+CREATED_AT = "2024-11-02T12:30:00+09:00"
+
+
+def journal_record(journal, product_id, quantity=2, total_amount=500):
+    return journal.append_order(
+        created_at=CREATED_AT, total_quantity=quantity, total_amount=total_amount, note=None,
+        lines=[{"product_id": product_id, "name": "normal", "category": "menu",
+                "quantity": quantity, "unit_price": 250}])
+
+
+def test_record_that_fails_for_data_reasons_is_moved_to_the_rejected_file(tmp_path):
+    journal = OrderJournal(tmp_path / "order_journal.jsonl", lambda: 99, fsync=False).open()
+    bad = journal_record(journal, 1)
+    good = journal_record(journal, 1)
+    applied = []
+
+    def apply(record):
+        if record is bad:
+            raise ValueError("bad record")
+        applied.append(record["order_id"])
+
+    replayer = JournalReplayer(journal, apply, is_transient=lambda error: isinstance(error, ConnectionError))
+    replayer.start()
+    try:
+        deadline = time.monotonic() + 5
+        while journal.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        replayer.stop()
+
+    # 再試行せずに取り除き、後ろのレコードの反映を止めない
+    assert applied == [good["order_id"]]
+    assert replayer.rejected == 1
+    rejected = [json.loads(line) for line in journal.rejected_path.read_text(encoding="utf-8").splitlines()]
+    assert rejected == [{"error": "bad record", "record": bad}]
+    journal.close()
+
+
+def test_replayed_order_must_match_the_stored_one(appmod, db_session, tmp_path):
+    product = Product(name="normal", category="menu", price=250, onSale=True)
+    db_session.add(product)
+    db_session.commit()
+    journal = OrderJournal(tmp_path / "order_journal.jsonl", lambda: 99, fsync=False).open()
+    record = journal_record(journal, product.product_id)
+    db_session.remove()
+
+    appmod.apply_journal_record(record)
+    # 反映済みの同じ内容のレコードは何もしない
+    appmod.apply_journal_record(record)
+    with pytest.raises(JournalConflict, match="total_amount"):
+        appmod.apply_journal_record(dict(record, total_amount=750))
+    assert Order.query.count() == 1
+    assert OrderProduct.query.count() == 1
+    journal.close()
+
+
+def test_sales_counters_include_orders_not_yet_in_the_database(appmod, db_session, tmp_path, monkeypatch):
+    product = Product(name="normal", category="menu", price=250, onSale=True)
+    db_session.add(product)
+    db_session.flush()
+    order = Order(created_at=datetime(2024, 11, 2, 12, 0), total_quantity=1, total_amount=250)
+    order.order_products = [OrderProduct(product_id=product.product_id, quantity=1, unit_price=250)]
+    db_session.add(order)
+    db_session.commit()
+
+    journal = OrderJournal(tmp_path / "order_journal.jsonl", lambda: order.order_id, fsync=False).open()
+    monkeypatch.setattr(appmod, "order_journal", journal)
+    record = journal_record(journal, product.product_id)
+    # 集計の読み込み前に確定した注文は record_order() では加算されない
+    counters = SalesCounters(appmod.load_sales_lines)
+    assert counters.record_order(record["order_id"], datetime.fromisoformat(CREATED_AT), []) is None
+
+    counters.rebuild()
+    snapshot = counters.snapshot()
+    assert snapshot["order_count"] == 2
+    assert snapshot["total_items"] == 3
+    assert snapshot["total_sales"] == 750
+    journal.close()
+
+
+def test_journal_cannot_be_opened_by_two_processes(tmp_path):
+    path = tmp_path / "order_journal.jsonl"
+    journal = OrderJournal(path, lambda: 99, fsync=False).open()
+    with pytest.raises(FileLocked):
+        OrderJournal(path, lambda: 99, fsync=False).open()
+
+    journal.close()
+    OrderJournal(path, lambda: 99, fsync=False).open().close()
+
+
+class MySQLError(Exception):
+    """pymysql のエラーと同じく args[0] にエラー番号を持つ。"""
+
+
+@pytest.mark.parametrize("error, transient", [
+    (exc.OperationalError("INSERT", {}, MySQLError(2013, "Lost connection to MySQL server during query")), True),
+    (exc.OperationalError("INSERT", {}, MySQLError(1213, "Deadlock found")), True),
+    (exc.OperationalError("INSERT", {}, sqlite3.OperationalError("database is locked")), True),
+    (exc.InterfaceError("INSERT", {}, MySQLError(0, "")), True),
+    (exc.OperationalError("INSERT", {}, MySQLError(1054, "Unknown column 'note'")), False),
+    (exc.OperationalError("INSERT", {}, sqlite3.OperationalError("no such column: note")), False),
+    (exc.IntegrityError("INSERT", {}, MySQLError(1452, "foreign key constraint fails")), False),
+    (KeyError("lines"), False),
+])
+def test_only_connection_errors_are_retried(appmod, error, transient):
+    assert appmod.is_transient_db_error(error) is transient
+
+
+def test_lines_for_deleted_products_are_dropped_and_the_order_is_kept(appmod, db_session, tmp_path):
+    kept = Product(name="normal", category="menu", price=250, onSale=True)
+    deleted = Product(name="DX", category="menu", price=300, onSale=True)
+    db_session.add_all([kept, deleted])
+    db_session.commit()
+    journal = OrderJournal(tmp_path / "order_journal.jsonl", lambda: 99, fsync=False).open()
+    record = journal.append_order(
+        created_at=CREATED_AT, total_quantity=3, total_amount=800, note=None,
+        lines=[{"product_id": kept.product_id, "name": "normal", "category": "menu", "quantity": 2, "unit_price": 250},
+               {"product_id": deleted.product_id, "name": "DX", "category": "menu", "quantity": 1, "unit_price": 300}])
+    # 会計の後、DBに反映する前に商品が削除された
+    kept_id = kept.product_id
+    db_session.delete(deleted)
+    db_session.commit()
+    db_session.remove()
+    dropped = appmod.JOURNAL_DROPPED_LINES._values.get((), 0)
+
+    appmod.apply_journal_record(record)
+    # 再反映しても食い違いにはならない
+    appmod.apply_journal_record(record)
+
+    order = db_session.get(Order, record["order_id"])
+    assert order.total_amount == 800
+    assert [(line.product_id, line.quantity) for line in order.order_products] == [(kept_id, 2)]
+    assert appmod.JOURNAL_DROPPED_LINES._values[()] == dropped + 1
+    journal.close()
@@ -0,0 +1,71 @@
+import pytest
+
+import order_store
+from order_store import DraftOrderStore, MemoryBackend
+
+ORDER = {"orderL": [{"product_id": 1, "quantity": 2}], "totalL": [500], "total": 500,
+         "menuL": [{"name": "normal", "price": 250, "quantity": 2}]}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(order_store.time, "monotonic", clock)
+    return clock
+
+
+def test_checkout_is_started_once_per_key(clock):
+    store = DraftOrderStore(MemoryBackend())
+
+    assert store.begin_checkout("k") == (True, None)
+    assert store.begin_checkout("k") == (False, None)
+
+    store.finish_checkout("k", {"order_id": 100})
+    assert store.begin_checkout("k") == (False, {"order_id": 100})
+
+    # 失敗した会計はキーを解放して、同じキーで再試行できる
+    assert store.begin_checkout("other") == (True, None)
+    store.abort_checkout("other")
+    assert store.begin_checkout("other") == (True, None)
+
+
+def test_drafts_and_results_expire(clock):
+    store = DraftOrderStore(MemoryBackend(purge_interval=0), draft_ttl=60, result_ttl=120)
+    token = store.save(ORDER)
+    store.begin_checkout("k")
+    store.finish_checkout("k", {"order_id": 100})
+
+    clock.now += 61
+    assert store.get(token) is None
+    assert store.begin_checkout("k") == (False, {"order_id": 100})
+
+    clock.now += 60
+    assert store.begin_checkout("k") == (True, None)
+
+
+def test_failed_checkout_releases_the_key(appmod, monkeypatch):
+    client = appmod.app.test_client()
+    client.post("/order", json=ORDER)
+    headers = {"Idempotency-Key": "retry-after-error"}
+
+    def unavailable(token):
+        raise OSError("store down")
+
+    real_get = appmod.draft_orders.get
+    monkeypatch.setattr(appmod.draft_orders, "get", unavailable)
+    assert client.post("/pay", json={"payment": 500}, headers=headers).status_code != 302
+
+    # 処理中のまま残っていれば 409 になる
+    monkeypatch.setattr(appmod.draft_orders, "get", real_get)
+    monkeypatch.setattr(appmod, "confirm_order", lambda order_data, payment: {"order_id": 100, "print_job_id": 1})
+    response = client.post("/pay", json={"payment": 500}, headers=headers)
+    assert response.status_code == 302
+    assert response.headers["X-Order-Id"] == "100"
@@ -0,0 +1,55 @@
+from kitchen_queue import KitchenQueue
+from models import Order, OrderProduct, Product
+
+
+def seed_open_orders(session, count):
+    products = [Product(name=f"p{i}", category="menu", price=100 * i, onSale=True) for i in range(1, 4)]
+    session.add_all(products)
+    session.flush()
+    for _ in range(count):
+        order = Order(total_quantity=3, total_amount=600, note=None, is_completed=False)
+        order.order_products = [OrderProduct(product_id=product.product_id, quantity=1, unit_price=product.price)
+                                for product in products]
+        session.add(order)
+    session.commit()
+
+
+def test_get_orders_runs_a_single_statement(appmod, db_session, count_statements, monkeypatch):
+    seed_open_orders(db_session, 60)
+    db_session.remove()
+    # 読み込み前のキューにして、最初の GET /orders でDBから読み込ませる
+    monkeypatch.setattr(appmod, "kitchen_queue", KitchenQueue(appmod.load_open_orders))
+    client = appmod.app.test_client()
+
+    with count_statements() as statements:
+        response = client.get("/orders")
+
+    assert response.status_code == 200
+    orders = response.get_json()
+    assert len(orders) == 60
+    assert all(len(order["menuL"]) == 3 for order in orders)
+    assert len(statements) == 1
+
+    # 2回目以降はメモリ上のキューから返すのでDBを読まない
+    with count_statements() as statements:
+        assert client.get("/orders").status_code == 200
+    assert statements == []
+
+
+def test_get_orders_returns_only_open_orders_in_order(appmod, db_session, monkeypatch):
+    product = Product(name="normal", category="menu", price=250, onSale=True)
+    db_session.add(product)
+    db_session.flush()
+    for is_completed, note in [(False, "a"), (True, "b"), (False, "c")]:
+        order = Order(total_quantity=2, total_amount=500, note=note, is_completed=is_completed)
+        order.order_products = [OrderProduct(product_id=product.product_id, quantity=2, unit_price=250)]
+        db_session.add(order)
+    db_session.commit()
+    db_session.remove()
+    monkeypatch.setattr(appmod, "kitchen_queue", KitchenQueue(appmod.load_open_orders))
+
+    orders = appmod.app.test_client().get("/orders").get_json()
+
+    assert [order["note"] for order in orders] == ["a", "c"]
+    assert orders[0]["order_id"] < orders[1]["order_id"]
+    assert orders[0]["menuL"] == [{"name": "normal", "price": 250, "quantity": 2}]
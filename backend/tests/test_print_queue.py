@@ -0,0 +1,72 @@
+import threading
+from datetime import datetime
+
+import pytz
+
+import pytest
+
+from file_lock import FileLocked
+from print_queue import DONE, PrintQueue
+
+
+class BlockingPrinter:
+    """release されるまで印刷を終えないプリンター。"""
+
+    def __init__(self):
+        self.printed = []
+        self.release = threading.Event()
+
+    def print_receipt(self, order_id, **receipt):
+        self.release.wait(5)
+        self.printed.append((order_id, receipt))
+
+
+def wait_done(print_queue, count):
+    for _ in range(500):
+        if sum(job["status"] == DONE for job in print_queue.jobs()) >= count:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(print_queue.jobs())
+
+
+def test_unfinished_jobs_are_printed_after_restart(tmp_path):
+    path = tmp_path / "print_queue.jsonl"
+    order_date = datetime(2024, 11, 2, 12, 30, tzinfo=pytz.timezone("Asia/Tokyo"))
+
+    # 1件目の印刷中に止まったことにする
+    stuck = BlockingPrinter()
+    first = PrintQueue(stuck, path=path).start()
+    first.enqueue(100, total=500, order_date=order_date)
+    first.enqueue(101, total=300, order_date=order_date)
+    # プロセスが止まったことにして、以降は書き込ませない (ロックも外れる)
+    first._file.close()
+    first._file = None
+    first._lock_file.close()
+
+    printer = BlockingPrinter()
+    printer.release.set()
+    second = PrintQueue(printer, path=path).start()
+    wait_done(second, 2)
+    assert [order_id for order_id, _ in printer.printed] == [100, 101]
+    assert printer.printed[0][1] == {"total": 500, "order_date": order_date}
+
+    # 印刷済みのジョブはもう一度起動しても印刷しない
+    second.stop()
+    third_printer = BlockingPrinter()
+    third = PrintQueue(third_printer, path=path).start()
+    third.stop()
+    assert third_printer.printed == []
+    assert third.jobs() == []
+    stuck.release.set()
+
+
+def test_file_cannot_be_used_by_two_queues(tmp_path):
+    path = tmp_path / "print_queue.jsonl"
+    first = PrintQueue(BlockingPrinter(), path=path).start()
+
+    # 2つ目は同じジョブを印刷し直してしまうので起動させない
+    with pytest.raises(FileLocked):
+        PrintQueue(BlockingPrinter(), path=path).start()
+
+    first.stop()
+    PrintQueue(BlockingPrinter(), path=path).start().stop()
@@ -0,0 +1,116 @@
+import pytest
+
+import printer_pool
+from csjwindowspossdk import ESCPOSConst
+from printer_pool import PrinterConnection, PrinterConnectionError
+
+
+class ScriptedDevice:
+    """Connect の結果と PrinterCheck/Status の値を指定できるデバイス。"""
+
+    def __init__(self, connect_results=()):
+        self.connect_results = list(connect_results)
+        self.connects = 0
+        self.disconnects = 0
+        self.checks = 0
+        self.status = 0
+
+    def Connect(self, port_type, address):
+        self.connects += 1
+        return self.connect_results.pop(0) if self.connect_results else ESCPOSConst.CMP_SUCCESS
+
+    def Disconnect(self):
+        self.disconnects += 1
+
+    def PrinterCheck(self):
+        self.checks += 1
+        return ESCPOSConst.CMP_SUCCESS
+
+    def Status(self):
+        return self.status
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(printer_pool.time, "monotonic", clock)
+    return clock
+
+
+def connection(device, **options):
+    return PrinterConnection(ESCPOSConst.CMP_PORT_Bluetooth, "00:11:22", device_factory=lambda: device,
+                             connect_wait=0, **options)
+
+
+def test_connection_is_kept_between_jobs(clock):
+    device = ScriptedDevice()
+    conn = connection(device)
+
+    for _ in range(3):
+        with conn.acquire() as acquired:
+            assert acquired is device
+    assert device.connects == 1
+    assert conn.connect_count == 1
+
+
+def test_connect_is_retried_and_gives_up(clock):
+    device = ScriptedDevice([ESCPOSConst.CMP_E_CONNECT_NOTFOUND, ESCPOSConst.CMP_SUCCESS])
+    conn = connection(device)
+    with conn.acquire():
+        pass
+    assert device.connects == 2
+
+    failing = ScriptedDevice([ESCPOSConst.CMP_E_CONNECT_NOTFOUND] * 3)
+    conn = connection(failing)
+    with pytest.raises(PrinterConnectionError):
+        with conn.acquire():
+            pass
+    assert failing.connects == 3
+    assert not conn.connected
+
+
+def test_health_check_runs_only_after_the_idle_interval(clock):
+    device = ScriptedDevice()
+    conn = connection(device, health_interval=30.0)
+    with conn.acquire():
+        pass
+
+    clock.now += 10
+    with conn.acquire():
+        pass
+    assert device.checks == 0
+
+    # 使っていない間に紙切れになったら接続を張り直す
+    clock.now += 31
+    device.status = ESCPOSConst.CMP_STS_PAPER_EMPTY
+    with conn.acquire():
+        pass
+    assert device.checks == 1
+    assert device.disconnects == 1
+    assert conn.connect_count == 2
+
+
+def test_error_while_printing_invalidates_the_connection(clock):
+    device = ScriptedDevice()
+    conn = connection(device)
+    with pytest.raises(RuntimeError):
+        with conn.acquire():
+            raise RuntimeError("paper jam")
+    assert not conn.connected
+    assert device.disconnects == 1
+
+    with conn.acquire():
+        pass
+    assert conn.connect_count == 2
+
+    conn.invalidate()
+    conn.invalidate()
+    assert device.disconnects == 2
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytz
+
+import tamasenSDK
+from benchmark.fakes import FakeESCPOSPrinter
+from csjwindowspossdk import ESCPOSConst
+from printer_pool import PrinterConnection
+
+
+class NoNVMemoryPrinter(FakeESCPOSPrinter):
+    """NVメモリへの登録に失敗するプリンター。"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def SetNVBitmap(self, *args):
+        self.calls.append("SetNVBitmap")
+        return ESCPOSConst.CMP_E_ILLEGAL
+
+    def PrintBitmap(self, *args):
+        self.calls.append("PrintBitmap")
+        return ESCPOSConst.CMP_SUCCESS
+
+
+def print_receipt(printer):
+    printer.print_receipt(100, orderL=[], totalL=[], total=0, payment=0, note=None, menuL=[],
+                          order_date=datetime.now(pytz.timezone("Asia/Tokyo")))
+
+
+def test_failed_logo_upload_is_not_retried_on_the_same_connection(tmp_path, monkeypatch):
+    monkeypatch.setattr(tamasenSDK, "NV_STATE_PATH", tmp_path / "nv_logo.json")
+    device = NoNVMemoryPrinter()
+    connection = PrinterConnection(ESCPOSConst.CMP_PORT_Bluetooth, "00:00:00:00:00:00", device_factory=lambda: device)
+    printer = tamasenSDK.Printer(connection=connection)
+
+    print_receipt(printer)
+    print_receipt(printer)
+    assert device.calls == ["SetNVBitmap", "PrintBitmap", "PrintBitmap"]
+
+    # 接続を張り直したら登録をやり直す
+    connection.invalidate()
+    print_receipt(printer)
+    assert device.calls[3:] == ["SetNVBitmap", "PrintBitmap"]
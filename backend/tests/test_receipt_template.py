@@ -0,0 +1,46 @@
+from datetime import datetime
+
+import pytest
+from PIL import Image
+
+from benchmark.bench_receipt import legacy_logo, legacy_receipt
+from receipt_template import ReceiptTemplate, build_logo_raster, load_logo_raster
+
+MENU = [{'name': 'normal', 'price': 250}, {'name': 'DX', 'price': 300}, {'name': 'GAMING', 'price': 4500}]
+
+
+@pytest.mark.parametrize("order", [
+    dict(orderL=[{'quantity': 2}, {'quantity': 1}, {'quantity': 3}], totalL=[500, 300, 13500],
+         total=14300, payment=20000, note="マヨなし"),
+    # 数量0の行と備考なし
+    dict(orderL=[{'quantity': 1}, {'quantity': 0}, {'quantity': 0}], totalL=[250, 0, 0],
+         total=250, payment=250, note=None),
+])
+def test_render_matches_the_previous_receipt(order):
+    logo = b'\x1D\x76\x30\x00\x01\x00\x01\x00\xff'
+    order = dict(order, order_id=123, menuL=MENU, order_date=datetime(2024, 11, 3, 12, 34, 56))
+
+    template = ReceiptTemplate(logo=logo)
+    assert template.render(**order) == legacy_receipt(logo, **order)
+    # 2回目以降 (商品名のキャッシュを使う) も同じ
+    assert template.render(**order) == legacy_receipt(logo, **order)
+
+
+def test_logo_raster_matches_the_pixel_loop_and_is_cached(tmp_path):
+    # 横幅が8で割り切れない画像
+    image_path = tmp_path / "logo.bmp"
+    image = Image.new('1', (21, 5), 1)
+    for x in range(0, 21, 3):
+        image.putpixel((x, x % 5), 0)
+    image.save(image_path)
+
+    raster = build_logo_raster(image_path)
+    assert raster == legacy_logo(image_path)
+
+    cache_dir = tmp_path / "cache"
+    assert load_logo_raster(image_path, cache_dir) == raster
+    cached = list(cache_dir.glob("logo_*.bin"))
+    assert len(cached) == 1
+    # キャッシュがあれば画像を変換し直さない
+    cached[0].write_bytes(b"cached")
+    assert load_logo_raster(image_path, cache_dir) == b"cached"
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+import sales_stats
+from sales_stats import SalesCounters
+
+CREATED_AT = datetime(2024, 11, 2, 12, 30)
+
+
+def test_order_read_by_the_rebuild_is_not_counted_twice():
+    rows = [(100, CREATED_AT, 1, "normal", "menu", 2, 250)]
+    counters = SalesCounters(lambda: rows)
+    counters.rebuild()
+
+    # 再構築のクエリに含まれていた注文は、確定後の加算を無視する
+    assert counters.record_order(100, CREATED_AT, [(1, "normal", "menu", 2, 250)]) is None
+    counters.record_order(101, CREATED_AT, [(1, "normal", "menu", 1, 250)])
+
+    snapshot = counters.snapshot()
+    assert snapshot["order_count"] == 2
+    assert snapshot["total_items"] == 3
+    assert snapshot["total_sales"] == 750
+
+
+def test_rebuilt_order_ids_are_dropped_after_the_catch_up_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sales_stats.time, "monotonic", lambda: now[0])
+    counters = SalesCounters(lambda: [(100, CREATED_AT, 1, "normal", "menu", 2, 250)], catchup_seconds=60)
+    counters.rebuild()
+
+    now[0] += 61
+    counters.record_order(101, CREATED_AT, [(1, "normal", "menu", 1, 250)])
+    assert counters._rebuilt_order_ids == set()
+    assert counters.snapshot()["order_count"] == 2
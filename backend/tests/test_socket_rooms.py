@@ -0,0 +1,141 @@
+from socket_rooms import CALL, CASHIER, KITCHEN, LISTENER, UNASSIGNED, RoomRouter
+
+
+class FakeServer:
+    def __init__(self):
+        self.rooms = {}  # sid -> 入っているルーム
+
+    def enter_room(self, sid, room, namespace=None):
+        self.rooms.setdefault(sid, set()).add(room)
+
+    def leave_room(self, sid, room, namespace=None):
+        self.rooms.setdefault(sid, set()).discard(room)
+
+
+class FakeSocketIO:
+    """送信をクライアント (sid) ごとの受信に展開して記録する。複数のルームに入っていても1回だけ届く。"""
+
+    def __init__(self):
+        self.server = FakeServer()
+        self.received = {}  # sid -> 受信した (イベント名, データ)
+        self.tasks = []
+
+    def emit(self, event, data, to=None, namespace=None):
+        targets = {to} if isinstance(to, str) else set(to)
+        for sid, joined in self.server.rooms.items():
+            if joined & targets:
+                self.received.setdefault(sid, []).append((event, data))
+
+    def start_background_task(self, func, *args):
+        self.tasks.append((func, args))
+
+    def sleep(self, seconds):
+        pass
+
+
+def router(**options):
+    socketio = FakeSocketIO()
+    return RoomRouter(socketio, **options), socketio
+
+
+def test_events_go_only_to_the_roles_that_need_them():
+    rooms, socketio = router()
+    rooms.join("cashier", CASHIER)
+    rooms.join("kitchen", KITCHEN)
+    rooms.join("both", "kitchen,call")
+    rooms.join("old", None)
+
+    rooms.emit("new_order", {"order_id": 100})
+    rooms.emit("order_complete", {"message": "ok"})
+
+    assert socketio.received["cashier"] == [("order_complete", {"message": "ok"})]
+    assert socketio.received["kitchen"] == [("new_order", {"order_id": 100})]
+    # 複数の役割に入っていても1回だけ届く
+    assert socketio.received["both"] == [("new_order", {"order_id": 100})]
+    # 役割を名乗っていないクライアントにはすべて届く
+    assert socketio.received["old"] == [("new_order", {"order_id": 100}), ("order_complete", {"message": "ok"})]
+
+
+def test_naming_a_role_later_leaves_the_unassigned_room():
+    rooms, socketio = router()
+    assert rooms.join("sid", None) == [UNASSIGNED]
+    assert rooms.join("sid", ["listener", "unknown"]) == [LISTENER]
+    assert socketio.server.rooms["sid"] == {LISTENER, "roles:listener"}
+
+    rooms.emit("order_complete", {"message": "ok"})
+    assert "sid" not in socketio.received
+
+    stats = rooms.stats()
+    assert stats[LISTENER]["members"] == 1
+    assert stats[UNASSIGNED]["members"] == 0
+    rooms.leave("sid")
+    assert rooms.stats()[LISTENER]["members"] == 0
+
+
+def test_unknown_events_go_to_every_role():
+    rooms, socketio = router()
+    rooms.join("call", CALL)
+    rooms.emit("something_new", 1)
+    assert socketio.received["call"] == [("something_new", 1)]
+
+
+def run_tasks(socketio):
+    tasks, socketio.tasks = socketio.tasks, []
+    for func, args in tasks:
+        func(*args)
+
+
+def test_client_with_several_roles_gets_each_batch_once():
+    rooms, socketio = router(batch_window=0.05)
+    rooms.join("both", "kitchen,call")
+    rooms.join("kitchen", KITCHEN)
+    rooms.join("call", CALL)
+
+    rooms.emit("new_order", {"order_id": 100})
+    rooms.emit("call_played", {"order_id": 100})
+    run_tasks(socketio)
+
+    events = [{"event": "new_order", "data": {"order_id": 100}}, {"event": "call_played", "data": {"order_id": 100}}]
+    assert socketio.received["both"] == [("batch", {"room": "roles:call+kitchen", "events": events})]
+    assert socketio.received["kitchen"] == [("batch", {"room": "roles:kitchen", "events": events[:1]})]
+    assert socketio.received["call"] == [("batch", {"room": "roles:call", "events": events})]
+    assert rooms.stats()[KITCHEN]["batched_events"] == 3
+
+
+def test_adding_a_role_moves_the_client_to_the_new_combination():
+    rooms, socketio = router(batch_window=0.05)
+    rooms.join("sid", KITCHEN)
+    rooms.join("sid", CALL)
+    assert socketio.server.rooms["sid"] == {KITCHEN, CALL, "roles:call+kitchen"}
+
+
+def test_batches_keep_order_and_coalesce():
+    rooms, socketio = router(batch_window=0.05, unbatched=("order_call",), coalesce=("sales_update",))
+    rooms.join("listener", LISTENER)
+    rooms.join("old", None)
+
+    rooms.emit("sales_update", 1)
+    rooms.emit("new_order", {"order_id": 100})
+    rooms.emit("sales_update", 2)
+    # すぐに送るイベントの前に、溜まっている分を送る
+    rooms.emit("order_call", {"order_id": 100})
+    rooms.emit("end_order", {"order_id": 100})
+    rooms.flush()
+    run_tasks(socketio)
+
+    assert socketio.received["listener"] == [
+        ("batch", {"room": "roles:listener", "events": [{"event": "new_order", "data": {"order_id": 100}},
+                                                        {"event": "sales_update", "data": 2}]}),
+        ("order_call", {"order_id": 100}),
+        ("batch", {"room": "roles:listener", "events": [{"event": "end_order", "data": {"order_id": 100}}]}),
+    ]
+    # 役割を名乗っていないクライアントには溜めずにすべて送る
+    assert [event for event, _ in socketio.received["old"]] == [
+        "sales_update", "new_order", "sales_update", "order_call", "end_order"]
+
+
+def test_distributed_batches_go_to_every_combination():
+    rooms, socketio = router(batch_window=0.05, distributed=True)
+    rooms.emit("call_played", {"order_id": 100})
+    # このプロセスに参加者がいなくても、ほかのワーカーのクライアントのために送る
+    assert len(socketio.tasks) == 8
@@ -0,0 +1,113 @@
+import io
+
+import pytest
+import requests
+from flask import Flask, request
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3 import HTTPResponse
+from urllib3._collections import HTTPHeaderDict
+
+from catalog_cache import CatalogCache
+from models import Product
+from worker_proxy import FORWARDED_HEADER, PrimaryProxy
+
+
+class RecordingSession:
+    def __init__(self):
+        self.headers = None
+
+    def request(self, method, url, headers=None, **kwargs):
+        self.headers = headers
+        raise requests.ConnectionError("not connected")
+
+
+def test_forward_does_not_mark_external_requests_as_internal():
+    app = Flask(__name__)
+    proxy = PrimaryProxy("http://127.0.0.1:5001")
+    proxy.session = RecordingSession()
+
+    with app.test_request_context("/internal/kitchen_sync", headers={FORWARDED_HEADER: "1", "X-Test": "a"}):
+        assert proxy.forward(request).status_code == 502
+
+    assert FORWARDED_HEADER not in proxy.session.headers
+    assert proxy.session.headers["X-Test"] == "a"
+
+
+class PrimaryAdapter(BaseAdapter):
+    """転送されたリクエストを、同じアプリをプライマリとして動かして処理する。"""
+
+    def __init__(self, appmod):
+        super().__init__()
+        self.appmod = appmod
+        self.paths = []
+
+    def send(self, request, **kwargs):
+        self.paths.append(request.path_url)
+        secondary, self.appmod.primary = self.appmod.primary, None
+        try:
+            response = self.appmod.app.test_client().open(
+                request.path_url, method=request.method, headers=dict(request.headers), data=request.body,
+                environ_base={"REMOTE_ADDR": "127.0.0.1"})
+        finally:
+            self.appmod.primary = secondary
+        raw = HTTPResponse(body=io.BytesIO(response.data), headers=HTTPHeaderDict(list(response.headers)),
+                           status=response.status_code, preload_content=False)
+        return HTTPAdapter().build_response(request, raw)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def secondary(appmod, db_session, monkeypatch):
+    """プライマリへ転送するセカンダリのワーカーとして動かす。"""
+    db_session.add(Product(name="normal", category="menu", price=250, onSale=True))
+    db_session.commit()
+    db_session.remove()
+    monkeypatch.setattr(appmod, "catalog_cache", CatalogCache(appmod.load_products))
+    adapter = PrimaryAdapter(appmod)
+    proxy = PrimaryProxy("http://127.0.0.1:5001")
+    proxy.session.mount("http://", adapter)
+    monkeypatch.setattr(appmod, "primary", proxy)
+    return adapter
+
+
+def test_catalog_is_forwarded_with_its_etag(appmod, secondary):
+    client = appmod.app.test_client()
+    first = client.get("/products")
+    assert first.status_code == 200
+    assert [product["name"] for product in first.get_json()] == ["normal"]
+
+    # 条件付きリクエストのヘッダーもそのまま渡り、プライマリの 304 が返る
+    second = client.get("/products", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert second.headers["X-Catalog-Version"] == first.headers["X-Catalog-Version"]
+    assert secondary.paths == ["/products", "/products"]
+
+
+def test_stateless_pages_are_not_forwarded(appmod, secondary):
+    assert appmod.app.test_client().get("/order_history").status_code == 200
+    assert secondary.paths == []
+
+
+def test_internal_endpoints_reject_external_requests(appmod, db_session):
+    # 転送用のヘッダーがなければ外部からは呼べない
+    assert appmod.app.test_client().get("/internal/kitchen_sync").status_code == 404
+
+
+def test_socket_events_on_a_secondary_go_to_the_primary_queue(appmod, secondary, monkeypatch):
+    actions = []
+    monkeypatch.setattr(appmod.kitchen_queue, "call_order", lambda order_id: actions.append(order_id))
+    client = appmod.socketio.test_client(appmod.app, auth={"role": "kitchen"})
+    try:
+        # 役割のルームには接続したワーカーで入る
+        assert appmod.rooms.stats()["kitchen"]["members"] >= 1
+
+        sync = client.emit("kitchen_sync", {}, callback=True)
+        assert sync["snapshot"] is True
+        client.emit("order_call", {"order_id": 100})
+        assert actions == [100]
+        assert secondary.paths == ["/internal/kitchen_sync", "/internal/kitchen/order_call"]
+    finally:
+        client.disconnect()
@@ -0,0 +1,56 @@
+import logging
+
+import requests
+from flask import Response
+
+logger = logging.getLogger(__name__)
+
+# 転送先にそのまま渡さないヘッダー
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailers",
+    "transfer-encoding", "upgrade", "host", "content-length", "content-encoding",
+}
+
+# ワーカー間の内部用の呼び出しを示すヘッダー (プライマリ側ではこれが付いたリクエストだけを内部用として受け付ける)
+# 外部からのリクエストを転送するときは付けず、クライアントが付けてきたものも取り除く
+FORWARDED_HEADER = "X-POS-Forwarded"
+
+
+class PrimaryProxy:
+    """
+    セカンダリのワーカーから、状態を持つプライマリのワーカーへリクエストを転送する。
+    下書きの注文・厨房キュー・印刷キュー・音声はプライマリだけがメモリ上に持っている。
+    """
+
+    def __init__(self, base_url, timeout=10.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def forward(self, req):
+        """Flask のリクエストをそのまま転送して、プライマリの応答を返す。"""
+        headers = {key: value for key, value in req.headers
+                   if key.lower() not in HOP_BY_HOP and key.lower() != FORWARDED_HEADER.lower()}
+        headers["X-Forwarded-For"] = req.remote_addr or ""
+        try:
+            upstream = self.session.request(
+                req.method,
+                self.base_url + req.full_path.rstrip("?"),
+                headers=headers,
+                data=req.get_data(),
+                allow_redirects=False,
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            logger.error("Forwarding %s %s to primary failed: %s", req.method, req.path, e)
+            return Response('{"message": "Primary worker unavailable"}', status=502, mimetype="application/json")
+        # Set-Cookie のように複数あるヘッダーも1行ずつ渡す
+        headers = [(key, value) for key, value in upstream.raw.headers.iteritems() if key.lower() not in HOP_BY_HOP]
+        return Response(upstream.content, status=upstream.status_code, headers=headers)
+
+    def call(self, method, path, **kwargs):
+        """内部用のエンドポイントを呼んでJSONを返す。"""
+        response = self.session.request(method, self.base_url + path, timeout=self.timeout,
+                                        headers={FORWARDED_HEADER: "1"}, **kwargs)
+        response.raise_for_status()
+        return response.json()
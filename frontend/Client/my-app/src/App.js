@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useCallback, useEffect, useRef, useState } from 'react';
 import {
   ChakraProvider,
   Box,
@@ -251,14 +251,16 @@ function OrderHistory() {
   const [orderHistory, setOrderHistory] = useState([]);
   const [totalItemsSold, setTotalItemsSold] = useState(0);
   const [totalSalesAmount, setTotalSalesAmount] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
   const toast = useToast();
   const navigate = useNavigate();
 
-  // 注文履歴の取得
-  useEffect(() => {
-    axios.get(`http://${SERVER_IP}:5000/order_history`)
+  // 注文履歴の取得 (cursorを指定すると続きのページを追加する)
+  const fetchOrderHistory = useCallback((cursor = null) => {
+    axios.get(`http://${SERVER_IP}:5000/order_history`, { params: cursor ? { cursor } : {} })
       .then((response) => {
-        setOrderHistory(response.data.order_history);
+        setOrderHistory((prev) => (cursor ? [...prev, ...response.data.order_history] : response.data.order_history));
+        setNextCursor(response.data.next_cursor);
         setTotalItemsSold(response.data.total_items_sold);  // 合計商品の個数をセット
         setTotalSalesAmount(response.data.total_sales_amount);  // 合計販売額をセット
       })
@@ -273,6 +275,10 @@ function OrderHistory() {
       });
   }, [toast]);
 
+  useEffect(() => {
+    fetchOrderHistory();
+  }, [fetchOrderHistory]);
+
   return (
     <ChakraProvider>
       <Box p={5} maxWidth="1200px" mx="auto">
@@ -322,6 +328,11 @@ function OrderHistory() {
               </HStack>
             </Box>
           ))}
+          {nextCursor && (
+            <Button onClick={() => fetchOrderHistory(nextCursor)}>
+              さらに読み込む
+            </Button>
+          )}
         </VStack>
 
         {/* 合計商品数と合計販売額を表示 */}
@@ -554,6 +565,8 @@ function PayPage() {
   const [payment, setPayment] = useState('');
   const [orderData, setOrderData] = useState({});
   const [isProcessing, setIsProcessing] = useState(false);
+  // 会計の冪等キー。再送しても同じ注文として扱われる
+  const idempotencyKey = useRef(`${Date.now()}-${Math.random().toString(36).slice(2)}`);
   const toast = useToast();
   const navigate = useNavigate();
 
@@ -612,7 +625,10 @@ function PayPage() {
         isClosable: true,
       });
 
-      axios.post(`http://${SERVER_IP}:5000/pay`, { payment: inputPayment }, { withCredentials: true })
+      axios.post(`http://${SERVER_IP}:5000/pay`, { payment: inputPayment }, {
+        withCredentials: true,
+        headers: { 'Idempotency-Key': idempotencyKey.current },
+      })
         .then(() => {
           setPayment('');
           navigate('/');
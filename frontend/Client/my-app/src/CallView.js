@@ -79,31 +79,39 @@ function CallView() {
     useEffect(() => {
         socket.current = io(`http://${SERVER_IP}:5000`, {
             transports: ['websocket'],
+            auth: { role: 'call' }, // この役割向けのイベントだけを受け取る
             reconnection: true,
             reconnectionAttempts: 5,
             reconnectionDelay: 1000,
         });
 
-        socket.current.on('new_order', (orderData) => {
-            setWaitingOrders((prevOrders) => [...prevOrders, orderData.order_id]);
-        });
+        const handlers = {
+            new_order: (orderData) => {
+                setWaitingOrders((prevOrders) => [...prevOrders, orderData.order_id]);
+            },
+            order_call: (orderData) => {
+                setWaitingOrders((prevOrders) =>
+                    prevOrders.filter((orderId) => orderId !== orderData.order_id)
+                );
+                setCalledOrders((prevOrders) => {
+                    const updatedOrders = [...prevOrders, orderData.order_id];
+                    return updatedOrders.slice(-4); // 最大4件まで表示
+                });
+                resetNoCalledOrderTimeout(); // 呼び出しが発生した場合のタイマーリセット
+            },
+            end_order: (orderData) => {
+                setCalledOrders((prevOrders) =>
+                    prevOrders.filter((orderId) => orderId !== orderData.order_id)
+                );
+                if (calledOrders.length === 1) startNoCalledOrderTimeout(); // タイマー開始
+            },
+        };
 
-        socket.current.on('order_call', (orderData) => {
-            setWaitingOrders((prevOrders) =>
-                prevOrders.filter((orderId) => orderId !== orderData.order_id)
-            );
-            setCalledOrders((prevOrders) => {
-                const updatedOrders = [...prevOrders, orderData.order_id];
-                return updatedOrders.slice(-4); // 最大4件まで表示
-            });
-            resetNoCalledOrderTimeout(); // 呼び出しが発生した場合のタイマーリセット
-        });
+        Object.entries(handlers).forEach(([event, handler]) => socket.current.on(event, handler));
 
-        socket.current.on('end_order', (orderData) => {
-            setCalledOrders((prevOrders) =>
-                prevOrders.filter((orderId) => orderId !== orderData.order_id)
-            );
-            if (calledOrders.length === 1) startNoCalledOrderTimeout(); // タイマー開始
+        // まとめて送られたイベントを順番に処理する (再描画は1回で済む)
+        socket.current.on('batch', ({ events }) => {
+            events.forEach(({ event, data }) => handlers[event] && handlers[event](data));
         });
 
         return () => {
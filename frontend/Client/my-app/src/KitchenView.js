@@ -17,57 +17,92 @@ function KitchenView() {
     const socket = useRef();
     const navigate = useNavigate();
 
-    // 初回ロード時に未完了の注文を取得
-    useEffect(() => {
-        const fetchOrders = async () => {
-            try {
-                const response = await axios.get(`http://${SERVER_IP}:5000/orders`);
-                if (response.status === 200) {
-                    setOrders(response.data);
-                }
-            } catch (error) {
-                console.error('注文データの取得中にエラーが発生しました:', error);
-            }
-        };
-        fetchOrders();
-    }, []);
+    // 最後に適用した変更の連番と、サーバーの起動ごとの識別子
+    const lastSeq = useRef(null);
+    const epoch = useRef(null);
 
     // Socket.IO の接続とイベントリスナーの設定
     useEffect(() => {
         socket.current = io(`http://${SERVER_IP}:5000`, {
             transports: ['websocket'],
+            auth: { role: 'kitchen' }, // この役割向けのイベントだけを受け取る
             reconnection: true,
             reconnectionAttempts: 5,
             reconnectionDelay: 1000,
         });
 
+        // サーバーの注文キューの変更を1件適用する
+        const applyChange = (type, data) => {
+            if (type === 'new_order') {
+                setOrders((prevOrders) =>
+                    prevOrders.some((order) => order.order_id === data.order_id)
+                        ? prevOrders
+                        : [...prevOrders, data]
+                );
+            } else if (type === 'order_call') {
+                setOrders((prevOrders) =>
+                    prevOrders.map((order) =>
+                        order.order_id === data.order_id ? { ...order, isHighlighted: true } : order
+                    )
+                );
+            } else if (type === 'end_order') {
+                setOrders((prevOrders) =>
+                    prevOrders.filter((order) => order.order_id !== data.order_id)
+                );
+            }
+        };
+
+        // 取りこぼした変更だけを受け取る (初回や差分が古すぎる場合は一覧全体)
+        const resync = () => {
+            socket.current.emit(
+                'kitchen_sync',
+                { epoch: epoch.current, last_seq: lastSeq.current },
+                (result) => {
+                    if (result.snapshot) {
+                        setOrders(result.orders.map((order) => ({ ...order, isHighlighted: order.called })));
+                    } else {
+                        result.deltas.forEach((delta) =>
+                            applyChange(delta.type, delta.type === 'new_order' ? delta.order : delta)
+                        );
+                    }
+                    epoch.current = result.epoch;
+                    lastSeq.current = result.seq;
+                }
+            );
+        };
+
+        // 連番が飛んでいたら取りこぼしがあったので同期し直す
+        const handleChange = (type) => (data) => {
+            if (data.epoch === epoch.current && lastSeq.current !== null && data.seq <= lastSeq.current) {
+                return; // 適用済み
+            }
+            if (data.epoch !== epoch.current || data.seq !== lastSeq.current + 1) {
+                resync();
+                return;
+            }
+            lastSeq.current = data.seq;
+            applyChange(type, data);
+        };
+
         socket.current.on('connect', () => {
             console.log('Socket.IO に接続されました');
+            resync();
         });
 
         socket.current.on('connect_error', (err) => {
             console.error('Socket.IO 接続エラー:', err);
         });
 
-        // 新しい注文が来たときの処理
-        socket.current.on('new_order', (orderData) => {
-            setOrders((prevOrders) => [...prevOrders, orderData]);
-        });
-
-        // 注文呼び出し時の処理
-        socket.current.on('order_call', (data) => {
-            setOrders((prevOrders) =>
-                prevOrders.map((order) =>
-                    order.order_id === data.order_id ? { ...order, isHighlighted: true } : order
-                )
-            );
-        });
+        const handlers = {
+            new_order: handleChange('new_order'),
+            order_call: handleChange('order_call'),
+            end_order: handleChange('end_order'),
+        };
+        Object.entries(handlers).forEach(([event, handler]) => socket.current.on(event, handler));
 
-        // 注文終了時の処理
-        socket.current.on('end_order', (data) => {
-            setOrders((prevOrders) =>
-                prevOrders.filter((order) => order.order_id !== data.order_id)
-            );
+        // まとめて送られたイベントを順番に処理する (再描画は1回で済む)
+        socket.current.on('batch', ({ events }) => {
+            events.forEach(({ event, data }) => handlers[event] && handlers[event](data));
         });
 
         return () => {
@@ -1,41 +1,48 @@
 import os
 import sys
+import threading
 import requests
 import subprocess
 from sqlalchemy import create_engine
-from time import sleep
+from time import monotonic, sleep
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent/"backend"))
-from backend.config import DBConfig, BTConfig, SerialConfig, VVConfig
+from backend.config import DBConfig, BTConfig, SerialConfig, ServeConfig, VVConfig
 from backend.csjwindowspossdk import ESCPOSConst, ESCPOSPrinter
 
+CHECK_TIMEOUT = 20  # 各確認の最大待ち時間(秒)。プリンターの再接続 (5秒 × 3回) が収まるようにする
+
 # Step 1: localhost:50021 のレスポンス確認
 def check_localhost_response():
+    SERVER_URL = f"http://{VVConfig.HOST}:{VVConfig.PORT}"
     try:
-        SERVER_URL = f"http://{VVConfig.HOST}:{VVConfig.PORT}"
-        response = requests.get(SERVER_URL)
-        if response.status_code == 200:
-            print(f"{SERVER_URL} is responding correctly.")
-        else:
-            print(f"Error: {SERVER_URL} did not return a 200 status.")
-            sys.exit(1)
+        response = requests.get(SERVER_URL, timeout=5)
     except requests.exceptions.RequestException as e:
-        print(f"Error: Could not connect to {SERVER_URL}. Details: {e}")
-        sys.exit(1)
+        return False, f"Could not connect to {SERVER_URL}. Details: {e}"
+    if response.status_code != 200:
+        return False, f"{SERVER_URL} did not return a 200 status."
+    return True, f"{SERVER_URL} is responding correctly."
 
 # Step 2: データベースへのアクセス確認
 def check_database_connection():
     try:
+        if DBConfig.SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
+            # 組み込みモード: サーバーは不要。ファイルがなければ作成し、足りないテーブルを作る
+            from storage import ensure_sqlite_directory
+            from models import db
+            ensure_sqlite_directory(DBConfig.SQLALCHEMY_DATABASE_URI)
+            engine = create_engine(DBConfig.SQLALCHEMY_DATABASE_URI)
+            db.metadata.create_all(engine)
+            return True, f"Using embedded SQLite database: {DBConfig.SQLALCHEMY_DATABASE_URI}"
         # SQLAlchemyエンジンを使用してデータベースに接続
-        engine = create_engine(DBConfig.SQLALCHEMY_DATABASE_URI)
+        engine = create_engine(DBConfig.SQLALCHEMY_DATABASE_URI, connect_args={"connect_timeout": 5})
         connection = engine.connect()
-        print("Database connection successful.")
         connection.close()
+        return True, "Database connection successful."
     except Exception as e:
-        print(f"Error: Could not connect to the database. Details: {e}")
-        sys.exit(1)
+        return False, f"Could not connect to the database. Details: {e}"
 
-# Step 4: プリンター接続確認
+# Step 3: プリンター接続確認
 def check_printer_connection():
     printer = ESCPOSPrinter()
     attempts = 0
@@ -44,20 +51,58 @@ def check_printer_connection():
         sleep(5)
         print("Reconnecting...")
         attempts += 1
+    printer.Disconnect()
     if attempts == 3:
-        print("Failed to connect after 3 attempts.")
-        printer.Disconnect()
-        sys.exit(1)
-    else:
-        print("Printer connection successful.")
-        printer.Disconnect()
+        return False, "Failed to connect after 3 attempts."
+    return True, "Printer connection successful."
+
+def run_checks(checks, timeout=CHECK_TIMEOUT):
+    """
+    確認をすべて同時に実行し、(名前, 成否, メッセージ) のリストを返す。
+    timeout 秒で終わらなかったものは失敗とする (スレッドは daemon なので終了を待たない)。
+    """
+    results = {}
+
+    def run(name, check):
+        started = monotonic()
+        try:
+            ok, message = check()
+        except Exception as e:
+            ok, message = False, f"{type(e).__name__}: {e}"
+        results[name] = (ok, f"{message} ({monotonic() - started:.1f}s)")
+
+    threads = [threading.Thread(target=run, args=(name, check), daemon=True) for name, check in checks]
+    deadline = monotonic() + timeout
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(max(0, deadline - monotonic()))
+    return [(name, *results.get(name, (False, f"Timed out after {timeout}s"))) for name, _ in checks]
 
 # Step 4: Flaskアプリケーションの起動（別コンソール）
 def start_backend():
     print("Starting backend in a new console...")
     if os.name == 'nt':  # Windows
-        subprocess.Popen(["start", "cmd", "/k", "python", "backend/app.py"], shell=True)
-    sleep(3)
+        # 本番モード (リローダーなし)。ワーカー数は環境変数 POS_WORKERS で指定する
+        subprocess.Popen(["start", "cmd", "/k", "python", "backend/serve.py"], shell=True)
+    wait_for_backend()
+
+def wait_for_backend(timeout=30):
+    """バックエンドが最初のリクエストに応答するまで待ち、かかった時間を表示する。"""
+    url = f"http://127.0.0.1:{ServeConfig.PORT}/products"
+    started = monotonic()
+    while monotonic() - started < timeout:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                elapsed = monotonic() - started
+                print(f"Backend is ready ({elapsed:.1f}s).")
+                if elapsed > ServeConfig.STARTUP_TARGET:
+                    print(f"Warning: startup took longer than the target ({ServeConfig.STARTUP_TARGET:.1f}s).")
+                return
+        except requests.exceptions.RequestException:
+            pass
+        sleep(0.2)
+    print(f"Warning: backend did not respond within {timeout}s.")
 
 # Step 5: フロントエンドの起動（別コンソール）
 def start_frontend():
@@ -68,11 +113,17 @@ def start_frontend():
 
 # メイン処理
 if __name__ == "__main__":
-    # localhostとDBへのアクセス確認
-    check_localhost_response()
-    check_database_connection()
-    check_printer_connection()
-    
+    # VOICEVOX・DB・プリンターの確認は待ち時間が重ならないよう同時に行う
+    results = run_checks([
+        ("VOICEVOX", check_localhost_response),
+        ("Database", check_database_connection),
+        ("Printer", check_printer_connection),
+    ])
+    for name, ok, message in results:
+        print(f"[{'OK' if ok else 'NG'}] {name}: {message}")
+    if not all(ok for _, ok, _ in results):
+        sys.exit(1)
+
     # BackendとFrontendを別コンソールで起動
     start_backend()
     start_frontend()